@@ -5,6 +5,7 @@ Responsibility:
     - Entry point for the FastAPI application.
     - Initializes the `FastAPI` app instance.
     - Implements `lifespan` context manager to load models once on startup.
+    - Installs admission control on the inference endpoints (app/middleware.py).
 """
 
 from fastapi import FastAPI
@@ -26,8 +27,20 @@ async def lifespan(app: FastAPI):
     Model loading is now lazy-handled by ModelManager.
     """
     print("System startup...")
+    # Finish feedback batches that were logged but not yet written when the process stopped
+    from core.active_learning import recover_feedback_log
+    recover_feedback_log()
+    # Load the BoVW fallback now rather than on the first overloaded /predict
+    from core.config import BOVW_FALLBACK_ENABLED
+    if BOVW_FALLBACK_ENABLED:
+        from fastapi.concurrency import run_in_threadpool
+        from core.vision_logic import get_bovw_engine
+        await run_in_threadpool(get_bovw_engine)
     yield
     print("Shutting down...")
+    # Persist any queued feedback records before the process exits
+    from core.active_learning import flush_feedback_log
+    flush_feedback_log()
 
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse
@@ -51,6 +64,11 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 # Include Router
 app.include_router(router)
 
+from app.middleware import AdmissionMiddleware
+from core.config import ADMISSION_ENABLED
+if ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
 @app.get("/")
 async def read_index():
     index_path = os.path.join(STATIC_DIR, "index.html")
@@ -0,0 +1,59 @@
+"""
+app/middleware.py
+
+Responsibility:
+    - ASGI middleware applying admission control (core/admission.py) to the inference
+      endpoints. It runs before the request body is read, so rejected uploads are never
+      buffered.
+    - Rejections are answered with 429/503 (504 when the request's deadline ran out in the
+      queue), a JSON `detail` and a Retry-After header.
+    - Starts the request's deadline clock (core/deadline.py) on arrival and leaves it in
+      `request.state.deadline` for the route's stage checks.
+"""
+
+from starlette.responses import JSONResponse
+
+from core import config
+from core.admission import AdmissionRejected, get_admission_controller
+from core.deadline import Deadline, DEADLINE_HEADER
+
+def _header(headers, name):
+    for key, value in headers:
+        if key == name:
+            return value.decode("latin-1").strip()
+    return None
+
+def client_class(headers):
+    """
+    "ui" for the web UI (sends `X-Client: ui`), "api" for everything else.
+    """
+    return "ui" if (_header(headers, b"x-client") or "").lower() == "ui" else "api"
+
+class AdmissionMiddleware:
+    def __init__(self, app, controller=None, paths=config.ADMISSION_PATHS):
+        self.app = app
+        self.controller = controller
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        controller = self.controller or get_admission_controller()
+        headers = scope.get("headers", [])
+        client = client_class(headers)
+        deadline = Deadline.from_header(_header(headers, DEADLINE_HEADER.lower().encode()))
+        scope.setdefault("state", {})["deadline"] = deadline
+        try:
+            admitted_at = await controller.acquire(client, deadline)
+        except AdmissionRejected as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code,
+                                    headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(client, admitted_at)
@@ -3,33 +3,132 @@ app/routes.py
 
 Responsibility:
     - Defines the HTTP API endpoints.
-    - POST /predict: Preprocesses image for CNN and returns prediction.
+    - POST /predict: Preprocesses image for CNN and returns prediction
+      (optionally through the small/full model cascade, see core/cascade.py, or a
+      resolution variant chosen explicitly or by latency budget, see core/variants.py;
+      low-confidence answers can be re-run with batched test-time augmentation, core/tta.py).
+      While the CNN is backed up, plain requests are answered by the BoVW fallback
+      (core/vision_logic.py, reported in X-Model-Engine).
+    - POST /explain: Grad-CAM heatmap of the CNN's prediction as a PNG overlay or a
+      float16 map; batched, cached and computed off the request path (core/explain.py).
+    - POST /predict/search: Pyramid tile search for small logos in large images (core/search.py).
+    - WS /ws/predict: Streams JPEG frames in, results (with sequence numbers) out; frames
+      of all connections share one batched forward pass and stale ones are dropped.
+    - POST /feedback: Ingests user corrections (JSON base64 or multipart) into the feedback log.
+    - GET /train/jobs: Queued, running and finished retraining jobs with progress/throughput.
+    - GET /train/jobs/stream: Same data pushed as Server-Sent Events.
+    - GET /metrics: Serving telemetry in the Prometheus text format.
+    - /admin/*: Token-protected sampling profiler and tracemalloc diffs.
 """
 
-from fastapi import APIRouter, File, UploadFile, HTTPException, Request, BackgroundTasks
-from app.schemas import PredictionResponse, FeedbackRequest
+from fastapi import (APIRouter, File, UploadFile, HTTPException, Request, Response, Header,
+                     WebSocket, WebSocketDisconnect)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from pydantic import ValidationError
+from app.schemas import PredictionResponse, SearchResponse, ExplainMapResponse, FeedbackRequest
 from core.config import CLASS_LABELS, IMG_SIZE
+from core import config
 import numpy as np
 import tensorflow as tf
 from PIL import Image
 import io
+import re
+import hmac
+import json
+import time
+import asyncio
+import base64
 
 router = APIRouter()
 
 # Global Lock (if needed, though TF graph execution is usually thread-safe for inference if handled correctly)
 from core.locks import PREDICTION_LOCK
+from core import telemetry
+from core.profiling import server_timing_header
+from core.cascade import run_cascade, model_input_size
+from core.tta import tta_predict
+from core.inference import forward
+from core.streaming import get_frame_batcher
+from core.search import search_image
+from core.deadline import Deadline, DeadlineExceeded
+from core.vision_logic import get_bovw_engine
+from core.explain import get_explainer, overlay_png, ExplainQueueFull
 
-def preprocess_image(image_bytes):
+def decode_image(image_bytes):
     """
-    Preprocesses the image for MobileNetV2.
+    Decodes raw upload bytes into an RGB PIL image.
+    """
+    return Image.open(io.BytesIO(image_bytes)).convert('RGB')
+
+def prepare_image(image, size=IMG_SIZE):
     """
-    image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-    image = image.resize(IMG_SIZE)
+    Resizes and normalizes a decoded image into a (1, H, W, 3) batch for MobileNetV2.
+    """
+    image = image.resize(tuple(size))
     img_array = tf.keras.preprocessing.image.img_to_array(image)
     img_array = np.expand_dims(img_array, axis=0)
     img_array = img_array / 255.0  # Normalize as per training
     return img_array
 
+def preprocess_image(image_bytes):
+    """
+    Preprocesses the image for MobileNetV2.
+    """
+    return prepare_image(decode_image(image_bytes))
+
+def request_deadline(request, header_value):
+    """
+    The deadline the admission middleware started on arrival, or one starting now.
+    """
+    deadline = getattr(request.state, "deadline", None)
+    return deadline if isinstance(deadline, Deadline) else Deadline.from_header(header_value)
+
+def deadline_error(e):
+    return HTTPException(status_code=504, detail=str(e))
+
+def cnn_backlog():
+    """
+    Requests waiting for the CNN: blocked on the model lock (in the threadpool) plus
+    queued in admission.
+    """
+    return telemetry.INFERENCE_QUEUE_DEPTH.total() + telemetry.ADMISSION_QUEUED.total()
+
+def cnn_overloaded():
+    """
+    True once the CNN is backed up: BOVW_FALLBACK_QUEUE_DEPTH requests are waiting for it,
+    or the model lock has been held for BOVW_FALLBACK_LOCK_HELD_MS (a long stream batch or
+    search pass). Both are read from the loop, so this works with admission disabled too.
+    """
+    return (cnn_backlog() >= config.BOVW_FALLBACK_QUEUE_DEPTH
+            or PREDICTION_LOCK.held_for() * 1000 >= config.BOVW_FALLBACK_LOCK_HELD_MS)
+
+async def bovw_predict(engine, contents, start, response=None):
+    """
+    Answers a /predict request with the BoVW fallback, off the event loop and without
+    the model lock.
+    """
+    try:
+        label, confidence, stages = await run_in_threadpool(engine.predict, contents)
+    except ValueError as e:
+        telemetry.ERRORS_TOTAL.labels("invalid_image").inc()
+        raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
+    for stage, seconds in stages.items():
+        telemetry.BOVW_STAGE_SECONDS.labels(stage).observe(seconds)
+    telemetry.BOVW_FALLBACK_TOTAL.inc()
+    telemetry.STAGE_TOTAL.observe(time.perf_counter() - start)
+    if response is not None:
+        response.headers["X-Model-Engine"] = "bovw"
+        if config.SERVER_TIMING_ENABLED:
+            response.headers["Server-Timing"] = server_timing_header(stages)
+    print(f"Prediction (BoVW fallback): {label} ({confidence:.2f})")
+
+    if confidence < 0.4:
+        telemetry.UNCERTAIN_TOTAL.inc()
+        return PredictionResponse(label="Uncertain", confidence=confidence)
+    telemetry.PREDICTIONS_TOTAL.labels(label.lower()).inc()
+    return PredictionResponse(label=label.title(), confidence=confidence)
+
 @router.get("/health")
 async def health_check():
     return {"status": "ok"}
@@ -49,30 +148,115 @@ async def get_classes():
 
 
 @router.post("/predict", response_model=PredictionResponse)
-async def predict(request: Request, file: UploadFile = File(...)):
+async def predict(request: Request, response: Response = None, file: UploadFile = File(...),
+                  resolution: int = None, latency_budget_ms: float = None, tta: bool = None,
+                  x_request_deadline_ms: str = Header(None)):
     """
     Endpoint to predict car brand using CNN.
+    With SERVER_TIMING_ENABLED, per-stage timings are returned in the Server-Timing header.
+    With CASCADE_ENABLED, a small model answers confident cases and escalates the rest.
+    `resolution` serves a specific input-size variant; `latency_budget_ms` lets the
+    server pick the most accurate variant that fits (reported in X-Model-Variant).
+    `tta` overrides TTA_ENABLED for this request.
+    With BOVW_FALLBACK_ENABLED, requests that ask for neither a variant nor TTA are
+    answered by the BoVW engine once BOVW_FALLBACK_QUEUE_DEPTH requests wait for the CNN.
+    The request's deadline (X-Request-Deadline-Ms) is checked after upload, after
+    decode and once the model lock is held; expired requests get 504 without inference.
     """
     from app.services.model_manager import ModelManager
     
+    start = time.perf_counter()
+    deadline = request_deadline(request, x_request_deadline_ms)
     manager = ModelManager()
     model, classes_dict = manager.get_model()
     
     if model is None:
+        telemetry.ERRORS_TOTAL.labels("model_unavailable").inc()
         raise HTTPException(status_code=503, detail="Model not initialized or available.")
 
+    variant = resolution
+    if variant is None and latency_budget_ms is not None:
+        variant = manager.variant_for_budget(latency_budget_ms)
+    if variant is not None:
+        if variant not in config.RESOLUTION_VARIANTS:
+            raise HTTPException(status_code=400, detail=f"Unknown resolution {variant}; choose from {list(config.RESOLUTION_VARIANTS)}.")
+        model, classes_dict = manager.get_variant(variant)
+        if model is None:
+            raise HTTPException(status_code=404, detail=f"No {variant}px model variant is trained.")
+        if response is not None:
+            response.headers["X-Model-Variant"] = str(variant)
+
+    # Explicit variants bypass the cascade
+    small_model, threshold = (None, None)
+    if config.CASCADE_ENABLED and variant is None:
+        small_model, threshold = manager.get_cascade_model()
+
+    bovw = None
+    if config.BOVW_FALLBACK_ENABLED and variant is None and not tta and cnn_overloaded():
+        # Loaded at startup; if that failed or was skipped, a first load must not block the loop
+        bovw = await run_in_threadpool(get_bovw_engine)
+
     # 1. Read and Decode Image
     try:
         contents = await file.read()
-        processed_image = preprocess_image(contents)
+        t_read = time.perf_counter()
+        telemetry.STAGE_READ.observe(t_read - start)
+        deadline.check("read")
+        if bovw is not None:
+            return await bovw_predict(bovw, contents, start, response)
+
+        image = decode_image(contents)
+        t_decode = time.perf_counter()
+        telemetry.STAGE_DECODE.observe(t_decode - t_read)
+
+        # Sized from the model itself: a tuned retrain may change the served input size
+        first_model = small_model if small_model is not None else model
+        processed_image = prepare_image(image, model_input_size(first_model))
+        t_preprocess = time.perf_counter()
+        telemetry.STAGE_PREPROCESS.observe(t_preprocess - t_decode)
+        deadline.check("decode")
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        raise deadline_error(e)
     except Exception as e:
+        telemetry.ERRORS_TOTAL.labels("invalid_image").inc()
         print(f"Image Processing Error: {e}")
         raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
 
-    # 2. Prediction
-    try:
+    # 2. Prediction, in the threadpool: waiting for the model lock (held by stream batches,
+    # search passes and other requests) must never block the event loop
+    def infer():
+        telemetry.INFERENCE_QUEUE_DEPTH.inc()
+        t_wait = time.perf_counter()
         with PREDICTION_LOCK:
-            predictions = model.predict(processed_image)
+            t_locked = time.perf_counter()
+            telemetry.INFERENCE_QUEUE_DEPTH.dec()
+            telemetry.STAGE_QUEUE_WAIT.observe(t_locked - t_wait)
+            deadline.check("queue")
+            if small_model is not None:
+                predictions, tier = run_cascade(processed_image, lambda: prepare_image(image, model_input_size(model)),
+                                                small_model, model, threshold)
+                (telemetry.CASCADE_SMALL if tier == "small" else telemetry.CASCADE_FULL).inc()
+            elif variant is not None:
+                # Compiled call: model.predict's per-call overhead would swamp the smaller variants
+                predictions = forward(model, processed_image)
+            else:
+                predictions = model.predict(processed_image)
+
+            if use_tta and float(np.max(predictions)) < config.TTA_THRESHOLD:
+                # One batched pass over all views; the cascade's small input is the wrong size
+                tta_input = processed_image if small_model is None else prepare_image(image, model_input_size(model))
+                predictions = tta_predict(model, tta_input, config.TTA_CROP_FRACTION)
+                rescued = float(np.max(predictions)) >= config.TTA_THRESHOLD
+                (telemetry.TTA_RESCUED if rescued else telemetry.TTA_UNCERTAIN).inc()
+        return predictions, t_wait, t_locked
+
+    use_tta = config.TTA_ENABLED if tta is None else tta
+    try:
+        predictions, t_wait, t_locked = await run_in_threadpool(infer)
+        t_inference = time.perf_counter()
+        telemetry.STAGE_INFERENCE.observe(t_inference - t_locked)
         
         # predictions is [1, num_classes]
         confidence = float(np.max(predictions))
@@ -91,23 +275,337 @@ async def predict(request: Request, file: UploadFile = File(...)):
             label_str = classes_dict.get(predicted_class_idx, "Unknown")
             
         print(f"Prediction: {label_str} ({confidence:.2f})")
+        t_end = time.perf_counter()
+        telemetry.STAGE_TOTAL.observe(t_end - start)
+
+        if config.SERVER_TIMING_ENABLED and response is not None:
+            response.headers["Server-Timing"] = server_timing_header({
+                "read": t_read - start,
+                "decode": t_decode - t_read,
+                "preprocess": t_preprocess - t_decode,
+                "queue_wait": t_locked - t_wait,
+                "inference": t_inference - t_locked,
+                "total": t_end - start,
+            })
         
         if confidence < 0.4:
+             telemetry.UNCERTAIN_TOTAL.inc()
              return PredictionResponse(label="Uncertain", confidence=confidence)
 
+        telemetry.PREDICTIONS_TOTAL.labels(label_str.lower()).inc()
         return PredictionResponse(label=label_str.title(), confidence=confidence)
         
+    except DeadlineExceeded as e:
+        raise deadline_error(e)
     except Exception as e:
+        telemetry.ERRORS_TOTAL.labels(type(e).__name__).inc()
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Prediction Internal Error: {str(e)}")
 
 
+@router.post("/predict/search", response_model=SearchResponse)
+async def predict_search(request: Request, file: UploadFile = File(...), threshold: float = None,
+                         max_latency_ms: float = None, x_request_deadline_ms: str = Header(None)):
+    """
+    Searches the image for a logo over a pyramid of tiles and returns the best tile.
+    `threshold` (early stop) and `max_latency_ms` (latency cap) override the config defaults;
+    the latency cap never exceeds what is left of the request's deadline.
+    """
+    from app.services.model_manager import ModelManager
+
+    deadline = request_deadline(request, x_request_deadline_ms)
+
+    model, classes_dict = ModelManager().get_model()
+    if model is None:
+        telemetry.ERRORS_TOTAL.labels("model_unavailable").inc()
+        raise HTTPException(status_code=503, detail="Model not initialized or available.")
+
+    try:
+        contents = await file.read()
+        deadline.check("read")
+        image = np.asarray(decode_image(contents))
+        deadline.check("decode")
+    except DeadlineExceeded as e:
+        raise deadline_error(e)
+    except Exception as e:
+        telemetry.ERRORS_TOTAL.labels("invalid_image").inc()
+        raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
+
+    cap_ms = config.SEARCH_MAX_LATENCY_MS if max_latency_ms is None else max_latency_ms
+    result = await run_in_threadpool(
+        search_image, model, image, classes_dict,
+        config.SEARCH_THRESHOLD if threshold is None else threshold,
+        min(cap_ms, deadline.remaining_ms()),
+    )
+    telemetry.SEARCH_TOTAL.labels(result["stopped"]).inc()
+    telemetry.SEARCH_TILES.observe(result["tiles_evaluated"])
+    print(f"Search: {result['label']} ({result['confidence']:.2f}) at {result['box']}, "
+          f"{result['tiles_evaluated']}/{result['tiles_total']} tiles, stopped: {result['stopped']}")
+
+    if result["confidence"] < 0.4:
+        telemetry.UNCERTAIN_TOTAL.inc()
+        result["label"] = "Uncertain"
+    else:
+        result["label"] = result["label"].title()
+    return SearchResponse(**result)
+
+def _served_model():
+    from app.services.model_manager import ModelManager
+    return ModelManager().get_model()
+
+def _served_version():
+    from app.services.model_manager import ModelManager
+    return ModelManager().version
+
+@router.post("/explain")
+async def explain(file: UploadFile = File(...), format: str = "png", alpha: float = 0.4):
+    """
+    Grad-CAM explanation of the CNN's prediction for an image.
+    `format=png` (default) returns the image blended with the heatmap; `format=map` returns
+    the feature-map-resolution float16 heatmap as base64 JSON. With the PNG, the label,
+    confidence and whether the heatmap came from the cache are in X-Explain-Label/-Confidence/-Cache.
+    """
+    if format not in ("png", "map"):
+        raise HTTPException(status_code=400, detail="format must be 'png' or 'map'.")
+    contents = await file.read()
+    explainer = get_explainer(_served_model, _served_version,
+                              lambda data, size: prepare_image(decode_image(data), size))
+    try:
+        result = await asyncio.wrap_future(explainer.submit(contents))
+    except ExplainQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    heatmap = result["heatmap"]
+    if format == "map":
+        return ExplainMapResponse(label=result["label"], confidence=result["confidence"], shape=list(heatmap.shape),
+                                  heatmap=base64.b64encode(heatmap.tobytes()).decode("ascii"), cached=result["cached"])
+    try:
+        png = await run_in_threadpool(overlay_png, contents, heatmap, alpha)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+    return Response(png, media_type="image/png", headers={
+        "X-Explain-Label": result["label"],
+        "X-Explain-Confidence": f"{result['confidence']:.4f}",
+        "X-Explain-Cache": "hit" if result["cached"] else "miss",
+    })
+
+@router.websocket("/ws/predict")
+async def ws_predict(websocket: WebSocket):
+    """
+    Live frame classification. Each binary message is one encoded frame (JPEG/PNG);
+    each reply is JSON {seq, label, confidence, dropped, latency_ms} (or {seq, error}),
+    in frame order. `seq` counts received frames from 0; skipped numbers were dropped
+    because a newer frame arrived before the model got to them. X-Request-Deadline-Ms on
+    the handshake sets how old a frame may get before it is answered with an error.
+    """
+    budget_ms = Deadline.from_header(websocket.headers.get("x-request-deadline-ms")).budget_ms
+    await websocket.accept()
+    loop = asyncio.get_running_loop()
+    results = asyncio.Queue()
+    batcher = get_frame_batcher(_served_model, lambda data, size: prepare_image(decode_image(data), size))
+    stream = batcher.open(lambda result: loop.call_soon_threadsafe(results.put_nowait, result), budget_ms)
+
+    async def send_results():
+        while True:
+            result = await results.get()
+            await websocket.send_json(result)
+            batcher.release(stream)
+
+    sender = asyncio.create_task(send_results())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                batcher.submit(stream, message["bytes"])
+    except WebSocketDisconnect:
+        pass
+    finally:
+        batcher.close(stream)
+        sender.cancel()
+
+def _form_bool(value):
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
 @router.post("/feedback")
-async def feedback_loop(feedback: FeedbackRequest, background_tasks: BackgroundTasks):
+async def feedback_loop(request: Request, domain: str = "cars"):
     """
     Endpoint to receive user feedback.
-    Currently just logs or saves, retraining trigger to be implemented for CNN.
+    Accepts JSON (`image_base64`) or multipart/form-data (`file` + form fields).
+    Decoding runs in the threadpool; persistence is batched by the feedback log writer,
+    so the request returns as soon as the record is queued.
+    """
+    from core.active_learning import decode_feedback_image, get_feedback_log, feedback_target_dir
+
+    if domain not in config.DOMAINS:
+        raise HTTPException(status_code=400, detail=f"Unknown domain '{domain}'; choose from {sorted(config.DOMAINS)}.")
+
+    image_bytes = None
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is not None and hasattr(upload, "read"):
+                image_bytes = await upload.read()
+            feedback = FeedbackRequest(
+                image_base64=form.get("image_base64"),
+                label=form.get("label", ""),
+                is_correct=_form_bool(form.get("is_correct", False)),
+                new_brand_name=form.get("new_brand_name") or None,
+            )
+        else:
+            body = await request.json()
+            if not isinstance(body, dict):
+                raise HTTPException(status_code=400, detail="Feedback payload must be a JSON object.")
+            feedback = FeedbackRequest(**body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid feedback payload: {str(e)}")
+
+    try:
+        image_bytes, digest = await run_in_threadpool(decode_feedback_image, feedback.image_base64, image_bytes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Ground truth: the predicted label if confirmed, the user's correction otherwise
+    if feedback.is_correct:
+        target_label = feedback.label.lower()
+    elif feedback.new_brand_name:
+        target_label = re.sub(r"\s+", "_", feedback.new_brand_name.strip().lower())
+    else:
+        target_label = None
+    if target_label:
+        try:
+            feedback_target_dir(domain, target_label)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    record = {
+        "ts": time.time(),
+        "domain": domain,
+        "label": feedback.label,
+        "is_correct": feedback.is_correct,
+        "new_brand_name": feedback.new_brand_name,
+        "target_label": target_label,
+        "sha256": digest,
+    }
+
+    if not get_feedback_log().submit(record, image_bytes if target_label else None):
+        raise HTTPException(status_code=503, detail="Feedback queue is full.", headers={"Retry-After": "1"})
+
+    if target_label:
+        # Coalesced per domain: a burst of corrections results in a single retrain
+        from app.services.training import TrainingService, PRIORITY_LOW
+        try:
+            TrainingService().request_training(domain=domain, priority=PRIORITY_LOW, reason="feedback")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return {"status": "accepted", "action": "queued" if target_label else "logged", "id": digest[:16]}
+
+
+@router.get("/train/jobs")
+async def list_training_jobs(domain: str = None):
+    """
+    Lists retraining jobs. Running jobs carry the latest worker progress
+    (phase, epoch, images/sec, step time, data vs compute time, ETA);
+    finished jobs carry their final validation metrics.
+    """
+    from app.services.training import TrainingService
+    return TrainingService().scheduler.snapshot(domain)
+
+@router.get("/train/jobs/stream")
+async def stream_training_jobs(request: Request, domain: str = None, interval: float = 0.5):
+    """
+    Server-Sent Events variant of /train/jobs: pushes a snapshot whenever a job changes.
+    """
+    from app.services.training import TrainingService
+    scheduler = TrainingService().scheduler
+    interval = min(max(interval, 0.1), 10.0)
+
+    async def events():
+        version = None
+        idle = 0.0
+        while not await request.is_disconnected():
+            if scheduler.version != version:
+                version = scheduler.version
+                idle = 0.0
+                yield f"event: jobs\ndata: {json.dumps(scheduler.snapshot(domain))}\n\n"
+            elif idle >= 15.0:
+                # Keep-alive comment so proxies don't drop the connection
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(interval)
+            idle += interval
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/metrics")
+async def metrics():
+    """
+    Prometheus scrape endpoint.
     """
-    # For now, just return valid to keep UI working if it calls this
-    return {"status": "accepted", "action": "logged"}
+    return Response(content=telemetry.REGISTRY.render(), media_type=telemetry.CONTENT_TYPE)
+
+
+def _require_admin(token):
+    # Admin surface is invisible unless a token is configured
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    # Constant-time comparison so response timing doesn't leak the token prefix
+    if not hmac.compare_digest((token or "").encode(), config.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+@router.get("/admin/profile")
+async def admin_profile(seconds: float = 10.0, interval: float = 0.005, x_admin_token: str = Header(None)):
+    """
+    Samples all threads for `seconds` and returns collapsed stacks
+    (feed to flamegraph.pl or speedscope).
+    """
+    _require_admin(x_admin_token)
+    from core.profiling import SamplingProfiler
+
+    profiler = SamplingProfiler(duration=min(max(seconds, 0.1), 120.0), interval=max(interval, 0.001))
+    try:
+        collapsed = await run_in_threadpool(profiler.run)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(collapsed, headers={
+        "Content-Disposition": "attachment; filename=profile.collapsed",
+        "X-Profile-Samples": str(profiler.samples),
+    })
+
+@router.post("/admin/tracemalloc/start")
+async def admin_tracemalloc_start(frames: int = 10, x_admin_token: str = Header(None)):
+    _require_admin(x_admin_token)
+    from core.profiling import tracemalloc_start
+    return tracemalloc_start(frames)
+
+@router.get("/admin/tracemalloc/diff")
+async def admin_tracemalloc_diff(limit: int = 25, group_by: str = "lineno", reset: bool = False, x_admin_token: str = Header(None)):
+    """
+    Top allocation differences since /admin/tracemalloc/start (or the last reset).
+    """
+    _require_admin(x_admin_token)
+    from core.profiling import tracemalloc_diff
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by must be lineno, filename or traceback.")
+    try:
+        return await run_in_threadpool(tracemalloc_diff, limit, group_by, reset)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/admin/tracemalloc/stop")
+async def admin_tracemalloc_stop(x_admin_token: str = Header(None)):
+    _require_admin(x_admin_token)
+    from core.profiling import tracemalloc_stop
+    return tracemalloc_stop()
@@ -4,17 +4,38 @@ app/schemas.py
 Responsibility:
     - Defines Pydantic models for data validation and serialization.
     - `PredictionResponse`: Standardizes the JSON output structure.
+    - `SearchResponse`: Best tile of a logo search with its box and search statistics.
+    - `ExplainMapResponse`: Raw Grad-CAM heatmap of /explain?format=map.
 """
 
 from pydantic import BaseModel
-from typing import Union
+from typing import List, Union
 
 class PredictionResponse(BaseModel):
     label: str
     confidence: Union[float, str] = "N/A"
 
+class SearchResponse(BaseModel):
+    label: str
+    confidence: float
+    box: List[int]  # [x1, y1, x2, y2] in pixels of the uploaded image
+    tiles_evaluated: int
+    tiles_total: int
+    passes: int
+    stopped: str  # confident / latency / exhausted
+    elapsed_ms: float
+
+class ExplainMapResponse(BaseModel):
+    label: str
+    confidence: float
+    shape: List[int]  # [h, w] of the CNN's last feature map
+    dtype: str = "float16"
+    heatmap: str  # base64 of the row-major float16 values, 0..1
+    cached: bool
+
 class FeedbackRequest(BaseModel):
-    image_base64: str
+    # Optional because multipart submissions carry the image as a binary file part
+    image_base64: Union[str, None] = None
     label: str
     is_correct: bool
     new_brand_name: Union[str, None] = None
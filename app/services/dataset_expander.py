@@ -5,7 +5,7 @@ Responsibility:
     - Autonomous service to expand the dataset for a specific domain/label.
     - Scrapes new images using DuckDuckGo.
     - Sanitizes images using core utilities.
-    - Triggers full model retraining upon completion.
+    - Queues model retraining upon completion.
 """
 
 import os
@@ -14,7 +14,7 @@ import hashlib
 from duckduckgo_search import DDGS
 from core.config import BASE_DIR
 from core.image_utils import sanitize_image
-from app.services.training import TrainingService
+from app.services.training import TrainingService, PRIORITY_NORMAL
 
 def expand_dataset(domain: str, label: str):
     """
@@ -22,7 +22,7 @@ def expand_dataset(domain: str, label: str):
        - Save to data/raw/{domain}/{label}/
        - Uses core.image_utils.sanitize_image.
     
-    2. RETRAIN: Once scraping is done, trigger the training pipeline.
+    2. RETRAIN: Once scraping is done, queue the training pipeline.
     """
     print(f"AUTOMATION: Expansion requested for {domain}/{label}")
     
@@ -102,11 +102,11 @@ def expand_dataset(domain: str, label: str):
     # 3. Retrain
     if count > 0:
         print("Triggering retraining pipeline...")
-        success = TrainingService.run_sync(domain=domain)
-        if success:
-            print("Retraining started successfully.")
-        else:
-            print("Retraining skipped (already running).")
+        try:
+            job = TrainingService().request_training(domain=domain, priority=PRIORITY_NORMAL, reason=f"expand:{label}")
+            print(f"Retraining queued (job {job.id}, {job.requests} merged request(s)).")
+        except ValueError as e:
+            print(f"Retraining skipped: {e}")
     else:
         print("No new images added. Retraining skipped.")
 
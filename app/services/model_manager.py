@@ -3,18 +3,30 @@ app/services/model_manager.py
 
 Responsibility:
     - Singleton class to manage the lifecycle of the Deep Learning model.
-    - Loads the model on startup.
+    - Loads the model on startup (from the memory-mapped artifact when one is current).
     - Provides access to the model for the application.
+    - Lazily loads the cascade's small model and its calibrated threshold.
+    - Lazily loads resolution variants and the latency table that maps budgets to them.
 """
 
 import os
 import sys
 from core.dl_loader import load_trained_model
+from core.config import (MODEL_PATH, MODEL_ARTIFACT_PATH, CASCADE_MODEL_PATH, CASCADE_CLASS_INDICES_PATH,
+                         CASCADE_CALIBRATION_PATH, CASCADE_DEFAULT_THRESHOLD,
+                         RESOLUTION_VARIANTS, VARIANT_TABLE_PATH, variant_paths)
+from core.cascade import load_calibration, model_input_size
+from core.variants import load_variant_table, pick_variant
+from core.telemetry import CACHE_HIT, CACHE_MISS, MODEL_VERSION
 
 class ModelManager:
     _instance = None
     _model = None
     _classes = None
+    _version = 0
+    _cascade = None
+    _variants = None
+    _variant_table = None
 
     def __new__(cls):
         if cls._instance is None:
@@ -27,12 +39,27 @@ class ModelManager:
         Loads the Keras model and class indices.
         """
         print("ModelManager: Loading Deep Learning Model...")
-        self._model, self._classes = load_trained_model()
-        
+        self.install_model(*load_trained_model())
+
+    def install_model(self, model, classes):
+        """
+        Makes an already loaded model the served one. Cheap: retrains load the promoted
+        model first and only hold PREDICTION_LOCK around the file swap and this call.
+        """
+        self._model, self._classes = model, classes
         if self._model:
+            # Artifact mtime identifies the model generation (changes on every promoted retrain)
+            version_path = MODEL_PATH if os.path.exists(MODEL_PATH) else MODEL_ARTIFACT_PATH
+            self._version = int(os.path.getmtime(version_path))
             print(f"ModelManager: Model loaded successfully. Classes: {list(self._classes.keys())[:5]}...")
         else:
+            self._version = 0
             print("ModelManager: Failed to load model.")
+        MODEL_VERSION.set(self._version)
+        # Auxiliary models are re-validated against the (possibly new) class mapping on next use
+        self._cascade = None
+        self._variants = {}
+        self._variant_table = None
 
     def get_model(self):
         """
@@ -40,10 +67,85 @@ class ModelManager:
         """
         if self._model is None:
             # Try reloading if not loaded
+            CACHE_MISS.inc()
             self.load_model()
+        else:
+            CACHE_HIT.inc()
             
         return self._model, self._classes
 
+    def get_cascade_model(self):
+        """
+        Returns (small_model, threshold) for the cascade, or (None, None) when no small
+        model is trained or its classes differ from the served model's.
+        """
+        if self._cascade is None:
+            self._cascade = self._load_cascade()
+        return self._cascade
+
+    def _load_cascade(self):
+        if not os.path.exists(CASCADE_MODEL_PATH):
+            return (None, None)
+        model, classes = load_trained_model(CASCADE_MODEL_PATH, CASCADE_CLASS_INDICES_PATH)
+        if model is None:
+            return (None, None)
+        if classes != self._classes:
+            print("ModelManager: Cascade model classes differ from the served model; cascade disabled.")
+            return (None, None)
+        calibration = load_calibration(CASCADE_CALIBRATION_PATH)
+        threshold = calibration["threshold"] if calibration else CASCADE_DEFAULT_THRESHOLD
+        print(f"ModelManager: Cascade model loaded (threshold {threshold:.3f}).")
+        return (model, threshold)
+
+    def served_resolution(self):
+        """
+        Input size of the served model (IMG_SIZE unless a tuned retrain changed it), or None.
+        """
+        if self._model is None:
+            return None
+        return model_input_size(self._model)[0]
+
+    def available_variants(self):
+        """
+        Resolutions that can be served right now: trained variant artifacts plus the
+        served model under its actual input size (it takes that slot over a variant file).
+        """
+        available = {r for r in RESOLUTION_VARIANTS if os.path.exists(variant_paths(r)["model"])}
+        served = self.served_resolution()
+        if served in RESOLUTION_VARIANTS:
+            available.add(served)
+        return sorted(available)
+
+    def get_variant(self, resolution):
+        """
+        Returns (model, classes) for a resolution variant, or (None, None) if it is
+        not trained or was trained on different classes than the served model.
+        """
+        if resolution == self.served_resolution():
+            return self.get_model()
+        if resolution not in self._variants:
+            paths = variant_paths(resolution)
+            model, classes = (None, None)
+            if os.path.exists(paths["model"]):
+                model, classes = load_trained_model(paths["model"], paths["classes"])
+            if model is not None and classes != self._classes:
+                print(f"ModelManager: {resolution}px variant classes differ from the served model; ignored.")
+                model, classes = (None, None)
+            self._variants[resolution] = (model, classes)
+        return self._variants[resolution]
+
+    def variant_for_budget(self, budget_ms):
+        """
+        Resolution to serve for a latency budget, or None to use the default model.
+        """
+        if self._variant_table is None:
+            self._variant_table = load_variant_table(VARIANT_TABLE_PATH)
+        return pick_variant(budget_ms, self.available_variants(), self._variant_table)
+
+    @property
+    def version(self):
+        return self._version
+
     # Legacy method signature for compatibility during refactor, but essentially just returns the single model
     def load_domain(self, domain="cars"):
         return self.get_model()
@@ -25,5 +25,5 @@ def expand_and_retrain(domain: str, label: str):
     
     # 2. Retrain
     print(f"[Orchestrator] Retraining domain model...")
-    training_services.retrain_domain(domain=domain)
-    print(f"[Orchestrator] Retraining triggered.")
+    job = training_services.retrain_domain(domain=domain, reason=f"expand:{label}")
+    print(f"[Orchestrator] Retraining queued (job {job.id}).")
@@ -3,18 +3,301 @@ app/services/training.py
 
 Responsibility:
     - Thread-safe singleton for managing training jobs.
-    - Queues or locks training to prevent race conditions.
+    - Per-domain job queue: repeated requests for a domain coalesce into a single
+      pending job (highest priority wins, start is debounced).
+    - Persists queue state so pending retrains survive restarts.
+    - Runs jobs in an isolated worker process and promotes the artifact only on success.
+    - Only configured domains (config.DOMAINS) can be queued; a job that finds another
+      training run in progress goes back to the queue instead of failing.
 """
 
+import os
+import json
+import time
+import uuid
+import shutil
 import threading
 import asyncio
-from train.train_model import run_training
-from core.config import BASE_DIR, CLASS_LABELS, MODELS_DIR
+from collections import deque
+from core.config import (TRAINING_QUEUE_PATH, TRAINING_DEBOUNCE_SECONDS, TRAINING_MAX_DELAY_SECONDS,
+                         TRAINING_OUT_OF_PROCESS, DOMAINS, SERVED_DOMAIN)
+
+# Job priorities (higher runs first when several domains are due)
+PRIORITY_LOW = 0       # User feedback
+PRIORITY_NORMAL = 5    # Dataset expansion (scraping)
+PRIORITY_HIGH = 10     # Manual trigger
+
+class TrainingBusy(Exception):
+    """
+    Raised by a job runner when another training run holds the training lock.
+    """
+
+class TrainingJob:
+    """
+    One (possibly merged) retraining request for a domain.
+    """
+
+    def __init__(self, domain, priority=PRIORITY_NORMAL, reasons=None, job_id=None, status="queued",
+                 requested_at=None, due_at=None, requests=1, started_at=None, finished_at=None, error=None,
+                 progress=None, metrics=None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.domain = domain
+        self.priority = priority
+        self.reasons = list(reasons or [])
+        self.status = status
+        self.requested_at = requested_at if requested_at is not None else time.time()
+        self.due_at = due_at if due_at is not None else self.requested_at
+        self.requests = requests
+        self.started_at = started_at
+        self.finished_at = finished_at
+        self.error = error
+        # Latest worker progress event (phase, epoch, throughput, ETA) and final val metrics
+        self.progress = progress
+        self.metrics = metrics
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "domain": self.domain,
+            "priority": self.priority,
+            "reasons": self.reasons,
+            "status": self.status,
+            "requested_at": self.requested_at,
+            "due_at": self.due_at,
+            "requests": self.requests,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "progress": self.progress,
+            "metrics": self.metrics,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["domain"],
+            priority=data.get("priority", PRIORITY_NORMAL),
+            reasons=data.get("reasons"),
+            job_id=data.get("id"),
+            status=data.get("status", "queued"),
+            requested_at=data.get("requested_at"),
+            due_at=data.get("due_at"),
+            requests=data.get("requests", 1),
+        )
+
+class TrainingScheduler:
+    """
+    Coalescing job queue with one pending slot per domain and a single worker thread.
+
+    - A request for a domain that already has a pending job merges into it.
+    - A request while the domain is training creates the next pending job, so
+      feedback that arrives mid-retrain is picked up by the following run.
+    - Each request pushes the start back by `debounce` seconds, capped at
+      `max_delay` after the first request of the job.
+    - A runner that raises TrainingBusy gets its job re-queued `debounce` seconds out,
+      merged with any request that arrived meanwhile.
+    - With `domains`, requests (and restored jobs) for any other domain are rejected.
+    """
+
+    def __init__(self, runner, state_path=TRAINING_QUEUE_PATH, debounce=TRAINING_DEBOUNCE_SECONDS,
+                 max_delay=TRAINING_MAX_DELAY_SECONDS, history_size=50, domains=None):
+        self._runner = runner
+        self.domains = domains
+        self.state_path = state_path
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._running = {}
+        self._history = deque(maxlen=history_size)
+        self._thread = None
+        # Bumped on every change so streaming clients can tell when to push
+        self.version = 0
+        self._load_state()
+
+    def request(self, domain, priority=PRIORITY_NORMAL, reason=None, debounce=None):
+        """
+        Requests a retrain of `domain`. Returns the (new or merged) pending job.
+        `debounce=0` asks for the job to start as soon as the worker is free.
+        Raises ValueError for a domain outside `domains`.
+        """
+        if self.domains is not None and domain not in self.domains:
+            raise ValueError(f"Unknown domain '{domain}'; choose from {sorted(self.domains)}.")
+        now = time.time()
+        debounce = self.debounce if debounce is None else debounce
+        with self._cond:
+            job = self._pending.get(domain)
+            if job is None:
+                job = TrainingJob(domain, priority, requested_at=now, due_at=now + debounce)
+                self._pending[domain] = job
+            else:
+                job.requests += 1
+                job.priority = max(job.priority, priority)
+                if debounce <= 0:
+                    job.due_at = now
+                else:
+                    job.due_at = min(max(job.due_at, now + debounce), job.requested_at + self.max_delay)
+            if reason and reason not in job.reasons:
+                job.reasons.append(reason)
+            self.version += 1
+            self._save_state()
+            self._cond.notify_all()
+        self._ensure_started()
+        return job
+
+    def update_progress(self, domain, event):
+        """
+        Attaches a worker event to the running job of `domain` (no-op if none is running).
+        """
+        with self._cond:
+            job = self._running.get(domain)
+            if job is None:
+                return
+            if event.get("event") in ("progress", "epoch"):
+                job.progress = event
+            elif event.get("event") == "done":
+                job.metrics = event.get("metrics")
+                job.error = event.get("error")
+            self.version += 1
+            self._cond.notify_all()
+
+    def snapshot(self, domain=None):
+        """
+        Returns {"queued": [...], "running": [...], "finished": [...]} as plain dicts,
+        optionally restricted to one domain.
+        """
+        def keep(jobs):
+            return [j.to_dict() for j in jobs if domain is None or j.domain == domain]
+
+        with self._cond:
+            return {
+                "queued": keep(sorted(self._pending.values(), key=lambda j: j.due_at)),
+                "running": keep(self._running.values()),
+                "finished": keep(reversed(self._history)),
+            }
+
+    def wait_idle(self, timeout=None):
+        """
+        Blocks until there is nothing queued or running. Returns False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+        return True
+
+    def _ensure_started(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="training-scheduler", daemon=True)
+                self._thread.start()
+
+    def _next_due(self, now):
+        due = [j for j in self._pending.values() if j.due_at <= now and j.domain not in self._running]
+        if not due:
+            return None
+        return max(due, key=lambda j: (j.priority, -j.requested_at))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                job = self._next_due(time.time())
+                while job is None:
+                    waits = [j.due_at - time.time() for j in self._pending.values()]
+                    self._cond.wait(timeout=max(0.0, min(waits)) if waits else None)
+                    job = self._next_due(time.time())
+                del self._pending[job.domain]
+                job.status = "running"
+                job.started_at = time.time()
+                self._running[job.domain] = job
+                self.version += 1
+                self._save_state()
+
+            print(f"[Scheduler] Starting job {job.id} for {job.domain} "
+                  f"({job.requests} merged request(s), reasons: {job.reasons})")
+            try:
+                job.status = "succeeded" if self._runner(job.domain) else "failed"
+            except TrainingBusy:
+                self._requeue(job)
+                continue
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+
+            with self._cond:
+                job.finished_at = time.time()
+                del self._running[job.domain]
+                self._history.append(job)
+                self.version += 1
+                self._save_state()
+                self._cond.notify_all()
+            print(f"[Scheduler] Job {job.id} for {job.domain} {job.status}.")
+
+    def _requeue(self, job):
+        with self._cond:
+            del self._running[job.domain]
+            job.status = "queued"
+            job.started_at = None
+            job.due_at = time.time() + self.debounce
+            newer = self._pending.get(job.domain)
+            if newer is not None:
+                job.requests += newer.requests
+                job.priority = max(job.priority, newer.priority)
+                job.reasons += [r for r in newer.reasons if r not in job.reasons]
+            self._pending[job.domain] = job
+            self.version += 1
+            self._save_state()
+            self._cond.notify_all()
+        print(f"[Scheduler] Training busy; job {job.id} for {job.domain} re-queued in {self.debounce}s.")
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except Exception as e:
+            print(f"[Scheduler] Could not read queue state: {e}")
+            return
+
+        restorable = lambda data: self.domains is None or data["domain"] in self.domains
+        for data in filter(restorable, state.get("pending", [])):
+            self._pending[data["domain"]] = TrainingJob.from_dict(data)
+        # Jobs that were running when the process stopped are re-queued
+        for data in filter(restorable, state.get("running", [])):
+            job = self._pending.get(data["domain"]) or TrainingJob.from_dict(data)
+            job.status = "queued"
+            job.due_at = time.time() + self.debounce
+            if "interrupted" not in job.reasons:
+                job.reasons.append("interrupted")
+            self._pending[job.domain] = job
+
+        if self._pending:
+            print(f"[Scheduler] Restored {len(self._pending)} pending job(s).")
+            self._ensure_started()
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        state = {
+            "pending": [j.to_dict() for j in self._pending.values()],
+            "running": [j.to_dict() for j in self._running.values()],
+        }
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            print(f"[Scheduler] Could not persist queue state: {e}")
 
 class TrainingService:
     _instance = None
     _lock = threading.Lock()
-    _is_training = False
 
     def __new__(cls):
         if cls._instance is None:
@@ -22,67 +305,98 @@ class TrainingService:
                 if cls._instance is None:
                     cls._instance = super(TrainingService, cls).__new__(cls)
                     cls._instance.training_lock = threading.Lock()
+                    cls._instance.scheduler = TrainingScheduler(cls._instance._run_scheduled_job, domains=DOMAINS)
         return cls._instance
 
+    @property
+    def is_training(self):
+        return self.training_lock.locked()
+
+    def request_training(self, domain="cars", priority=PRIORITY_NORMAL, reason=None, debounce=None):
+        """
+        Queues a retrain for `domain`, merged with any pending request for the same domain.
+        Preferred entry point for background services (feedback, scraping).
+        Raises ValueError unless `domain` is in config.DOMAINS.
+        """
+        return self.scheduler.request(domain, priority=priority, reason=reason, debounce=debounce)
+
     def run_training_job(self, domain="cars"):
         """
         Runs the training process in a thread-safe manner for a specific domain.
-        Returns True if started, False if already running.
+        Training happens in a separate worker process (see train/worker.py) that writes
+        to a staging directory; the served model is only replaced on success.
+        Returns True on success, False if already running or if training failed.
         """
-        if self._is_training:
+        try:
+            return self._run_scheduled_job(domain)
+        except TrainingBusy:
+            return False
+        except ValueError as e:
+            print(f"Training failed: {e}")
             return False
-            
-        with self.training_lock:
-            try:
-                self._is_training = True
-                print(f"Starting thread-safe training job for {domain}...")
-                
-                # Paths - dynamically determined based on domain
-                # data/raw/{domain}
-                data_path = BASE_DIR / "data" / "raw" / domain
-                
-                if not data_path.exists():
-                    print(f"Data path not found: {data_path}")
-                    return False
 
-                # We can either pass the class dirs or just the parent
-                # run_training logic was updated to take [parent_path] 
-                
-                # Get labels from config or directory
-                # Get labels from config
-                from core.config import DOMAINS
-                config_labels = DOMAINS.get(domain, [])
-                
-                # Dynamic Discovery from Filesystem
-                fs_labels = [d.name for d in data_path.iterdir() if d.is_dir()]
-                
-                # Merge and Sort
-                labels = sorted(list(set(config_labels + fs_labels)))
-                print(f"Training on labels: {labels}")
-                
-                from core.locks import PREDICTION_LOCK
-                
-                # Run training
-                run_training([str(data_path)], labels, num_clusters=500, domain=domain, file_lock=PREDICTION_LOCK)
-                
-            except Exception as e:
-                print(f"Training failed: {e}")
-            finally:
-                self._is_training = False
-                print("Training job finished.")
-                return True
+    def _run_scheduled_job(self, domain):
+        # Scheduler runner: like run_training_job, but a held lock raises TrainingBusy
+        if domain != SERVED_DOMAIN:
+            # The result could never be promoted (see train.worker.promote_artifact)
+            raise ValueError(f"Only the served '{SERVED_DOMAIN}' model is retrained; got '{domain}'.")
+        if not self.training_lock.acquire(blocking=False):
+            raise TrainingBusy(f"Training already in progress; cannot start {domain}.")
+
+        from train.worker import run_worker, run_in_subprocess, promote_artifact, new_staging_dir, staging_paths
+        staging_dir = new_staging_dir(domain)
+        try:
+            print(f"Starting training job for {domain} (staging: {staging_dir})...")
+
+            on_event = lambda e: self._on_progress(domain, e)
+            if TRAINING_OUT_OF_PROCESS:
+                result = run_in_subprocess(domain, staging_dir, on_event=on_event)
+            else:
+                result = run_worker(domain, staging_dir, threads=None, cpus=None, nice=None, on_event=on_event)
+
+            if not result.get("ok"):
+                print(f"Training failed: {result.get('error')}")
+                return False
+
+            # Load the new model while predictions keep running; the lock only covers
+            # the file swap and the reference switch
+            from core.locks import PREDICTION_LOCK
+            from core.dl_loader import load_trained_model
+            from app.services.model_manager import ModelManager
+            paths = staging_paths(staging_dir)
+            model, classes = load_trained_model(paths["model"], paths["classes"])
+            if model is None:
+                print(f"Training failed: could not load the trained model from {staging_dir}")
+                return False
+            with PREDICTION_LOCK:
+                promote_artifact(staging_dir, domain)
+                ModelManager().install_model(model, classes)
+            return True
+
+        except Exception as e:
+            print(f"Training failed: {e}")
+            return False
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            self.training_lock.release()
+            print("Training job finished.")
+
+    def _on_progress(self, domain, event):
+        self.scheduler.update_progress(domain, event)
+        if event.get("event") == "epoch":
+            print(f"[Worker:{domain}] {event['phase']} epoch {event['epoch']}: {event['logs']}")
 
     async def run_async(self, domain="cars"):
         """
         Async wrapper to be called from FastAPI BackgroundTasks.
         """
         loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self.run_training_job, domain)
+        return await loop.run_in_executor(None, self.run_training_job, domain)
 
     @classmethod
     def run_sync(cls, domain="cars"):
         """
-        Sync wrapper for blocking calls (e.g. from background services).
+        Sync wrapper for blocking calls (e.g. from scripts).
         """
         service = cls()
         return service.run_training_job(domain)
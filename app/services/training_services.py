@@ -5,19 +5,15 @@ Facade for TrainingService to match requested API:
 services.training_services.retrain_domain
 """
 
-from app.services.training import TrainingService
+from app.services.training import TrainingService, PRIORITY_NORMAL
 
 _trainer = TrainingService()
 
-def retrain_domain(domain: str):
+def retrain_domain(domain: str, priority: int = PRIORITY_NORMAL, reason: str = None):
     """
-    Triggers retraining for a domain.
-    Facades TrainingService.run_async (but handled synchronously or async depending on call).
-    The user request background_tasks.add_task(..., retrain_domain, domain=domain).
-    BackgroundTasks runs async functions or standard functions in threadpool.
-    TrainingService.run_training_job is synchronous.
-    TrainingService.run_async is async.
-    
-    If we alias retrain_domain = _trainer.run_training_job, it runs in threadpool.
+    Requests retraining for a domain.
+    Facades TrainingService.request_training: the request is merged into the domain's
+    pending job and returns immediately, so it is safe to call from BackgroundTasks
+    or from a burst of feedback/scraping events.
     """
-    return _trainer.run_training_job(domain=domain)
+    return _trainer.request_training(domain=domain, priority=priority, reason=reason)
@@ -3,60 +3,293 @@ core/active_learning.py
 
 Responsibility:
     - Handles user feedback (saving correct/incorrect images).
+    - Write-ahead feedback log: records are queued, persisted in batches and fsync'ed
+      by a background writer thread so `/feedback` never blocks on disk. Each batch's
+      images are spooled with the records until they are in the dataset; spool files
+      left by a crash are replayed on startup.
+    - Deduplicates feedback images by content hash before they land in data/raw.
+    - Only writes under data/raw/{domain}/{label} for configured domains and plain labels.
     - Triggers model retraining.
-    - (Future) Scrapes new brand images.
 """
 
 import os
-import shutil
-import uuid
+import io
+import re
+import json
+import time
+import queue
+import base64
+import hashlib
+import binascii
+import threading
 import asyncio
+from collections import OrderedDict
 from pathlib import Path
-from core.config import BASE_DIR, CLASS_LABELS
-from train.train_model import run_training
+from PIL import Image
+from core.config import BASE_DIR, CLASS_LABELS, DOMAINS
 
 # Directory to save feedback images
 FEEDBACK_DIR = BASE_DIR / "data" / "feedback"
 os.makedirs(FEEDBACK_DIR, exist_ok=True)
 
-def save_feedback_image(image_bytes: bytes, label: str, domain: str = "cars", brand_new: bool = False):
+FEEDBACK_LOG_PATH = FEEDBACK_DIR / "feedback.log"
+RAW_DATA_DIR = BASE_DIR / "data" / "raw"
+LABEL_PATTERN = re.compile(r"[a-z0-9_-]+")
+
+def _image_ext(image_bytes: bytes) -> str:
+    return "png" if image_bytes.startswith(b'\x89PNG') else "jpg"
+
+def decode_feedback_image(image_base64: str = None, image_bytes: bytes = None):
     """
-    Saves the image to the training dataset structure.
+    Decodes (base64) and validates a feedback image. CPU-bound: call it off the event loop.
+    Returns (image_bytes, sha256 hex digest).
     """
-    # Define target directory
-    # data/raw/{domain}/{label}
-    target_dir = BASE_DIR / "data" / "raw" / domain / label
-    
-    if not target_dir.exists():
-        if brand_new:
-            target_dir.mkdir(parents=True, exist_ok=True)
-        else:
-            # If label is known but folder invalid, create it
-            target_dir.mkdir(parents=True, exist_ok=True)
-            
-    filename = f"feedback_{uuid.uuid4().hex}.jpg"
-    file_path = target_dir / filename
-    
-    with open(file_path, "wb") as f:
+    if image_bytes is None:
+        if not image_base64:
+            raise ValueError("No image provided.")
+        # Accept data URLs as sent by the browser (data:image/png;base64,...)
+        if image_base64.startswith("data:"):
+            image_base64 = image_base64.split(",", 1)[-1]
+        try:
+            image_bytes = base64.b64decode(image_base64, validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise ValueError(f"Invalid base64 payload: {e}")
+
+    # verify() checks the file structure without decoding the pixels
+    try:
+        Image.open(io.BytesIO(image_bytes)).verify()
+    except Exception as e:
+        raise ValueError(f"Invalid image: {e}")
+
+    return image_bytes, hashlib.sha256(image_bytes).hexdigest()
+
+def feedback_target_dir(domain: str, label: str, raw_dir: Path = None) -> Path:
+    """
+    The dataset folder for a feedback label: data/raw/{domain}/{label}.
+    Raises ValueError unless the domain is configured, the label is [a-z0-9_-] only
+    and the resolved folder stays under the raw data directory.
+    """
+    if domain not in DOMAINS:
+        raise ValueError(f"Unknown domain '{domain}'; choose from {sorted(DOMAINS)}.")
+    if not label or not LABEL_PATTERN.fullmatch(label):
+        raise ValueError(f"Invalid label '{label}': use lowercase letters, digits, '-' and '_'.")
+    root = Path(raw_dir or RAW_DATA_DIR).resolve()
+    target = (root / domain / label).resolve()
+    if root not in target.parents:
+        raise ValueError(f"Label '{label}' resolves outside the dataset.")
+    return target
+
+def save_feedback_image(image_bytes: bytes, label: str, domain: str = "cars", brand_new: bool = False, digest: str = None, raw_dir: Path = None):
+    """
+    Saves the image to the training dataset structure: data/raw/{domain}/{label}.
+    Files are named after their content hash, so the same image is only stored once.
+    Returns the file path, or None if the image was already present.
+    """
+    target_dir = feedback_target_dir(domain, label, raw_dir)
+    # Known labels with a missing folder and brand new labels are both created on demand
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    digest = digest or hashlib.sha256(image_bytes).hexdigest()
+    file_path = target_dir / f"feedback_{digest[:16]}.{_image_ext(image_bytes)}"
+    if file_path.exists():
+        return None
+
+    # Write-then-rename so a crash never leaves a truncated image in the dataset
+    tmp_path = file_path.with_suffix(file_path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
         f.write(image_bytes)
-        
+    os.replace(tmp_path, file_path)
+
     return str(file_path)
 
+class FeedbackLog:
+    """
+    Batched, write-ahead persistence for feedback records.
+
+    `submit()` only enqueues. A daemon thread drains the queue in batches
+    (up to `batch_size` records or `max_delay` seconds). Per batch, the records that
+    carry an image are written with it to a spool file, the records are appended to
+    the JSONL log, each fsync'ed once, and then the images are written to the dataset
+    and the spool file is removed. `recover()` finishes batches whose spool file is
+    still there. Recently stored (domain, label, hash) keys are remembered in an LRU
+    of `dedupe_size` entries; older repeats are caught by the content-hash file name.
+    """
+
+    def __init__(self, log_path=FEEDBACK_LOG_PATH, raw_dir=RAW_DATA_DIR, batch_size=64, max_delay=0.05, max_queue=10000,
+                 spool_dir=None, dedupe_size=100_000):
+        self.log_path = Path(log_path)
+        self.raw_dir = Path(raw_dir)
+        self.spool_dir = Path(spool_dir) if spool_dir else self.log_path.parent / "spool"
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.dedupe_size = dedupe_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._seen = OrderedDict()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.stats = {"records": 0, "images_saved": 0, "duplicates": 0, "batches": 0, "recovered": 0}
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, record: dict, image_bytes: bytes = None) -> bool:
+        """
+        Enqueues a record (and optionally its image). Never blocks.
+        Returns False if the queue is full.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((record, image_bytes))
+            return True
+        except queue.Full:
+            return False
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Blocks until everything submitted so far is persisted (used on shutdown and in tests).
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def recover(self) -> int:
+        """
+        Writes the images of batches interrupted after the write-ahead step (their spool
+        files are still present) into the dataset. Called on startup; returns the number
+        of records replayed.
+        """
+        replayed = 0
+        for path in sorted(self.spool_dir.glob("*.jsonl")):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entries = [json.loads(line) for line in f if line.strip()]
+                for entry in entries:
+                    self._apply(entry["record"], base64.b64decode(entry["image"]))
+                replayed += len(entries)
+                path.unlink()
+            except Exception as e:
+                print(f"FeedbackLog: Could not replay {path.name}: {e}")
+        if replayed:
+            self.stats["recovered"] += replayed
+            print(f"FeedbackLog: Recovered {replayed} feedback images from the spool.")
+        return replayed
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._persist(batch)
+            except Exception as e:
+                print(f"FeedbackLog: Failed to persist batch of {len(batch)}: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    @staticmethod
+    def _write_durable(path, text, mode="a"):
+        with open(path, mode, encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _persist(self, batch):
+        # 1. Write-ahead: records and their images are durable before anything lands in the dataset
+        with_images = [(r, img) for r, img in batch if img is not None and r.get("target_label")]
+        spool_path = None
+        if with_images:
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            spool_path = self.spool_dir / f"{time.time_ns()}.jsonl"
+            self._write_durable(spool_path, "".join(
+                json.dumps({"record": r, "image": base64.b64encode(img).decode("ascii")}) + "\n"
+                for r, img in with_images), mode="w")
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self._write_durable(self.log_path, "".join(json.dumps(record, separators=(',', ':')) + "\n" for record, _ in batch))
+
+        # 2. Images, deduplicated by content hash
+        self.stats["records"] += len(batch)
+        for record, image_bytes in with_images:
+            self._apply(record, image_bytes)
+        self.stats["batches"] += 1
+        if spool_path is not None:
+            spool_path.unlink()
+
+    def _apply(self, record, image_bytes):
+        key = (record["domain"], record["target_label"], record["sha256"])
+        if key in self._seen:
+            self._seen.move_to_end(key)
+            self.stats["duplicates"] += 1
+            return
+        self._seen[key] = None
+        if len(self._seen) > self.dedupe_size:
+            self._seen.popitem(last=False)
+        saved = save_feedback_image(image_bytes, record["target_label"], domain=record["domain"],
+                                    digest=record["sha256"], raw_dir=self.raw_dir)
+        if saved:
+            self.stats["images_saved"] += 1
+        else:
+            self.stats["duplicates"] += 1
+
+_feedback_log = None
+_feedback_log_lock = threading.Lock()
+
+def get_feedback_log() -> FeedbackLog:
+    """
+    Returns the process-wide FeedbackLog (created on first use).
+    """
+    global _feedback_log
+    if _feedback_log is None:
+        with _feedback_log_lock:
+            if _feedback_log is None:
+                _feedback_log = FeedbackLog()
+    return _feedback_log
+
+def recover_feedback_log() -> int:
+    """
+    Replays feedback batches a crash left in the spool. Called from the app lifespan on startup.
+    """
+    return get_feedback_log().recover()
+
+def flush_feedback_log(timeout: float = 10.0):
+    """
+    Drains the feedback queue if it was ever used. Called from the app lifespan on shutdown.
+    """
+    if _feedback_log is not None:
+        _feedback_log.flush(timeout)
+
 async def trigger_retraining_task():
     """
     Background task to run training.
     """
     print("Triggering background retraining...")
-    # Run in a separate thread/process so it doesn't block
-    # We can call the run_training function directly if it's thread-safe enough
-    # run_training reloads data from disk, so it should pick up the new file.
-    
+    # Legacy BoVW entry point; imported lazily so feedback ingestion does not depend on it
+    from train.train_model import run_training
+
     # HARDCODED PATHS matching main.py logic for now
     train_path = [
-        str(BASE_DIR / 'data' / 'raw' / 'train' / 'Car_Brand_Logos' / 'Train'), 
+        str(BASE_DIR / 'data' / 'raw' / 'train' / 'Car_Brand_Logos' / 'Train'),
         str(BASE_DIR / 'data' / 'raw' / 'train' / 'Car_Brand_Logos' / 'Test')
     ]
-    
+
     # We need to run this in an executor because it's CPU bound and blocking
     loop = asyncio.get_event_loop()
     await loop.run_in_executor(None, run_training, train_path, CLASS_LABELS, 500)
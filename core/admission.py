@@ -0,0 +1,149 @@
+"""
+core/admission.py
+
+Responsibility:
+    - Bounded admission for the inference endpoints: per client class ("ui", "api") a
+      maximum number of requests in flight and a maximum queue behind them, so a burst
+      of API traffic can neither starve the UI nor buffer unbounded uploads.
+    - Fails fast instead of queueing work that cannot finish in time: 429 when the
+      class's queue is at its configured maximum, 503 when the queue is at the limit
+      the latency SLO allows. Both carry a Retry-After estimate.
+    - Adaptive: the queue limit follows the observed service time (EWMA of admitted
+      request durations). A queued request waits about position x service / in-flight
+      slots, so only as many are queued as can still finish within ADMISSION_SLO_MS.
+    - Queue waits are also bounded by the request's deadline (core/deadline.py):
+      a request whose client has given up leaves the queue with 504.
+    - Runs on the event loop (app/middleware.py), before the request body is read.
+"""
+
+import math
+import time
+import asyncio
+from collections import deque
+
+from core.config import ADMISSION_LIMITS, ADMISSION_SLO_MS, ADMISSION_INITIAL_SERVICE_MS
+from core.deadline import record_expired
+from core import telemetry
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code, detail, retry_after):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class AdmissionController:
+    def __init__(self, limits=ADMISSION_LIMITS, slo_ms=ADMISSION_SLO_MS,
+                 initial_service_ms=ADMISSION_INITIAL_SERVICE_MS, smoothing=0.2):
+        self.limits = {client: dict(limit) for client, limit in limits.items()}
+        self.slo_ms = slo_ms
+        self.service_ms = initial_service_ms
+        self.smoothing = smoothing
+        self._in_flight = {client: 0 for client in self.limits}
+        self._waiting = {client: deque() for client in self.limits}
+        telemetry.ADMISSION_SERVICE_MS.set(self.service_ms)
+
+    def queue_limit(self, client):
+        """
+        Queue length at which a newly queued request would still finish within the SLO.
+        """
+        limit = self.limits[client]
+        if self.service_ms >= self.slo_ms:
+            return 0
+        fits = int((self.slo_ms - self.service_ms) * limit["max_in_flight"] / self.service_ms)
+        return max(0, min(limit["max_queue"], fits))
+
+    def retry_after(self, client):
+        """
+        Seconds until the class's current backlog should have drained (at least 1).
+        """
+        backlog = len(self._waiting[client]) + 1
+        seconds = backlog * self.service_ms / self.limits[client]["max_in_flight"] / 1000.0
+        return max(1, math.ceil(seconds))
+
+    def stats(self):
+        return {client: {"in_flight": self._in_flight[client], "queued": len(self._waiting[client]),
+                         "queue_limit": self.queue_limit(client), **self.limits[client]}
+                for client in self.limits}
+
+    async def acquire(self, client, deadline=None):
+        """
+        Admits a request of `client` class, waiting in its queue if needed (at most
+        the SLO, or until `deadline`). Returns the admission time for `release`;
+        raises AdmissionRejected.
+        """
+        limit = self.limits[client]
+        waiting = self._waiting[client]
+        if deadline is not None and deadline.expired():
+            record_expired("admission")
+            raise AdmissionRejected(504, "Request deadline exceeded before admission.", self.retry_after(client))
+        if self._in_flight[client] < limit["max_in_flight"] and not waiting:
+            self._in_flight[client] += 1
+            telemetry.ADMISSION_IN_FLIGHT.labels(client).inc()
+            telemetry.ADMISSION_TOTAL.labels(client, "admitted").inc()
+            return time.perf_counter()
+
+        if len(waiting) >= limit["max_queue"]:
+            telemetry.ADMISSION_TOTAL.labels(client, "rejected_429").inc()
+            raise AdmissionRejected(429, f"Too many queued requests for {client} clients.", self.retry_after(client))
+        if len(waiting) >= self.queue_limit(client):
+            telemetry.ADMISSION_TOTAL.labels(client, "rejected_503").inc()
+            raise AdmissionRejected(503, "Server overloaded: queued requests would miss the latency SLO.",
+                                    self.retry_after(client))
+
+        slot = asyncio.get_running_loop().create_future()
+        waiting.append(slot)
+        telemetry.ADMISSION_QUEUED.labels(client).inc()
+        timeout_ms = self.slo_ms if deadline is None else min(self.slo_ms, deadline.remaining_ms())
+        try:
+            await asyncio.wait_for(slot, timeout=max(0.0, timeout_ms) / 1000.0)
+        except asyncio.TimeoutError:
+            if deadline is not None and deadline.expired():
+                record_expired("admission")
+                raise AdmissionRejected(504, "Request deadline exceeded in the admission queue.",
+                                        self.retry_after(client))
+            telemetry.ADMISSION_TOTAL.labels(client, "rejected_503").inc()
+            raise AdmissionRejected(503, "Server overloaded: request timed out in the admission queue.",
+                                    self.retry_after(client))
+        except BaseException:
+            # Client went away; pass on a slot that was granted in the meantime
+            if slot.done() and not slot.cancelled():
+                self._pass_on(client)
+            raise
+        finally:
+            if slot in waiting:
+                waiting.remove(slot)
+            telemetry.ADMISSION_QUEUED.labels(client).dec()
+        # The releasing request handed its slot over; in-flight count is unchanged
+        telemetry.ADMISSION_TOTAL.labels(client, "admitted").inc()
+        return time.perf_counter()
+
+    def release(self, client, admitted_at):
+        """
+        Records the service time and hands the slot to the next queued request, if any.
+        """
+        elapsed_ms = (time.perf_counter() - admitted_at) * 1000.0
+        self.service_ms += self.smoothing * (elapsed_ms - self.service_ms)
+        telemetry.ADMISSION_SERVICE_MS.set(self.service_ms)
+        self._pass_on(client)
+
+    def _pass_on(self, client):
+        waiting = self._waiting[client]
+        while waiting:
+            slot = waiting.popleft()
+            if not slot.done():
+                slot.set_result(None)
+                return
+        self._in_flight[client] -= 1
+        telemetry.ADMISSION_IN_FLIGHT.labels(client).dec()
+
+_controller = None
+
+def get_admission_controller() -> AdmissionController:
+    """
+    Returns the process-wide AdmissionController (created on first use).
+    """
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController()
+    return _controller
@@ -0,0 +1,144 @@
+"""
+core/augmentation.py
+
+Responsibility:
+    - Defines augmentation "recipes": the parameters of one synthetic sample (rotation,
+      brightness/contrast, blur) derived from a seed.
+    - Applies recipes to a single image (refinery) or to a whole batch (training pipeline).
+    - Reads/writes the sidecar manifest that replaces materialized `aug_*` files.
+"""
+
+import os
+import json
+import hashlib
+import cv2
+import numpy as np
+
+# Sidecar manifest written at the dataset root by `scripts/refinery.py --virtual`
+MANIFEST_NAME = "augmentation_manifest.json"
+MANIFEST_VERSION = 1
+
+def file_hash(path):
+    """
+    MD5 of the raw file bytes. Used to detect recipes whose source image changed.
+    """
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+def sample_recipe(seed):
+    """
+    Derives the transform parameters for one augmented sample from `seed`.
+    Same seed -> same recipe, so a manifest entry can always be replayed.
+    """
+    rng = np.random.default_rng(seed)
+    angle = float(rng.uniform(-15, 15))
+    # alpha = contrast [0.8, 1.2], beta = brightness [-30, 30]
+    alpha = float(rng.uniform(0.8, 1.2))
+    beta = float(rng.uniform(-30, 30))
+    # Gaussian Blur (slight) - 30% chance
+    blur = int(rng.choice([3, 5])) if rng.random() > 0.7 else 0
+    return {"seed": int(seed), "angle": angle, "alpha": alpha, "beta": beta, "blur": blur}
+
+def _rotate(image, angle):
+    rows, cols = image.shape[:2]
+    M = cv2.getRotationMatrix2D((cols / 2, rows / 2), angle, 1)
+    return cv2.warpAffine(image, M, (cols, rows), borderMode=cv2.BORDER_REFLECT)
+
+def apply_recipe(image, recipe):
+    """
+    Applies one recipe to a single uint8 image of any size.
+    """
+    return apply_recipes_batch(image[np.newaxis], [recipe])[0]
+
+def apply_recipes_batch(images, recipes):
+    """
+    Applies a list of recipes to a batch of same-sized uint8 images (N, H, W, C).
+
+    Rotation is a per-image affine warp; brightness/contrast is computed for the
+    whole batch in one broadcast operation; blur only touches the images that need it.
+    """
+    images = np.asarray(images)
+    if len(images) != len(recipes):
+        raise ValueError(f"Got {len(images)} images for {len(recipes)} recipes.")
+    if len(images) == 0:
+        return images.astype(np.uint8)
+
+    rotated = np.stack([_rotate(img, r["angle"]) for img, r in zip(images, recipes)])
+
+    # Vectorized equivalent of cv2.convertScaleAbs: saturate(|x * alpha + beta|)
+    shape = (-1,) + (1,) * (rotated.ndim - 1)
+    alpha = np.array([r["alpha"] for r in recipes], dtype=np.float32).reshape(shape)
+    beta = np.array([r["beta"] for r in recipes], dtype=np.float32).reshape(shape)
+    out = np.abs(rotated.astype(np.float32) * alpha + beta)
+    out = np.clip(np.rint(out), 0, 255).astype(np.uint8)
+
+    for i, r in enumerate(recipes):
+        if r.get("blur"):
+            out[i] = cv2.GaussianBlur(out[i], (r["blur"], r["blur"]), 0)
+    return out
+
+def build_class_recipes(class_dir, files, needed, seed=None):
+    """
+    Creates `needed` recipes that sample uniformly from `files` in `class_dir`.
+    Returns a list of manifest entries: {source, source_hash, seed, angle, alpha, beta, blur}.
+    """
+    if not files or needed <= 0:
+        return []
+
+    rng = np.random.default_rng(seed)
+    hashes = {}
+    recipes = []
+    for _ in range(needed):
+        source = files[int(rng.integers(len(files)))]
+        if source not in hashes:
+            hashes[source] = file_hash(os.path.join(class_dir, source))
+        entry = {"source": source, "source_hash": hashes[source]}
+        entry.update(sample_recipe(int(rng.integers(2**31 - 1))))
+        recipes.append(entry)
+    return recipes
+
+def manifest_path(dataset_path):
+    return os.path.join(dataset_path, MANIFEST_NAME)
+
+def write_manifest(dataset_path, classes):
+    """
+    Writes {class_name: [recipe, ...]} to the dataset root.
+    """
+    path = manifest_path(dataset_path)
+    with open(path, 'w') as f:
+        json.dump({"version": MANIFEST_VERSION, "classes": classes}, f, separators=(',', ':'))
+    return path
+
+def load_manifest(dataset_path, verify=True):
+    """
+    Loads the sidecar manifest. Returns {} if there is none.
+    With `verify`, recipes whose source file is missing or whose hash changed are dropped.
+    """
+    path = manifest_path(dataset_path)
+    if not os.path.exists(path):
+        return {}
+
+    with open(path, 'r') as f:
+        data = json.load(f)
+    classes = data.get("classes", {})
+    if not verify:
+        return classes
+
+    valid = {}
+    dropped = 0
+    for class_name, recipes in classes.items():
+        class_dir = os.path.join(dataset_path, class_name)
+        hashes = {}
+        kept = []
+        for r in recipes:
+            src = os.path.join(class_dir, r["source"])
+            if r["source"] not in hashes:
+                hashes[r["source"]] = file_hash(src) if os.path.exists(src) else None
+            if hashes[r["source"]] == r["source_hash"]:
+                kept.append(r)
+            else:
+                dropped += 1
+        valid[class_name] = kept
+    if dropped:
+        print(f"Augmentation manifest: dropped {dropped} stale recipes.")
+    return valid
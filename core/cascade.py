@@ -0,0 +1,126 @@
+"""
+core/cascade.py
+
+Responsibility:
+    - Confidence-gated model cascade: a small model answers when its top-1
+      confidence clears a calibrated threshold, otherwise the full model runs.
+    - Threshold calibration for a target accuracy loss, vectorised over all
+      candidate thresholds at once.
+    - Expected cost per request from the measured per-tier latencies.
+"""
+
+import json
+import os
+import numpy as np
+from core.config import VALIDATION_SPLIT
+from core.inference import forward
+
+def model_input_size(model):
+    """
+    (width, height) expected by a Keras image model, for PIL resizing.
+    """
+    _, h, w, _ = model.input_shape
+    return (w, h)
+
+def dataset_split(data_dir, label_to_idx, split=VALIDATION_SPLIT):
+    """
+    (train, validation) lists of (path, label index), split per class the way
+    ImageDataGenerator(validation_split=...) does (first `split` of sorted files validates).
+    Shared by calibration, distillation and pruning so they score on train_cnn.py's split.
+    """
+    train, val = [], []
+    for class_name, idx in sorted(label_to_idx.items()):
+        class_dir = os.path.join(data_dir, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        files = sorted(f for f in os.listdir(class_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg')))
+        cut = int(split * len(files))
+        val.extend((os.path.join(class_dir, f), idx) for f in files[:cut])
+        train.extend((os.path.join(class_dir, f), idx) for f in files[cut:])
+    return train, val
+
+def run_cascade(small_input, make_full_input, small_model, full_model, threshold):
+    """
+    Classifies one image batch. Returns (probabilities, tier) where tier is "small" or "full".
+    `make_full_input()` builds the full-size batch and is only called when the small model escalates.
+    """
+    small_probs = forward(small_model, small_input)
+    if float(np.max(small_probs)) >= threshold:
+        return small_probs, "small"
+    full_probs = forward(full_model, make_full_input())
+    return full_probs, "full"
+
+def cascade_curve(small_probs, full_probs, labels):
+    """
+    Accuracy of the cascade for every distinct small-model confidence used as threshold.
+    Returns (thresholds ascending, accept_rates, accuracies).
+    """
+    small_conf = small_probs.max(axis=1)
+    small_ok = small_probs.argmax(axis=1) == labels
+    full_ok = full_probs.argmax(axis=1) == labels
+
+    order = np.argsort(-small_conf, kind="stable")
+    conf_sorted = small_conf[order]
+    # Accepting the k most confident images: small answers those, full answers the rest
+    small_correct = np.concatenate([[0], np.cumsum(small_ok[order])])
+    full_correct_rest = full_ok.sum() - np.concatenate([[0], np.cumsum(full_ok[order])])
+    n = len(labels)
+    accuracy = (small_correct + full_correct_rest) / n
+
+    # Threshold t accepts every image with confidence >= t; ties must be accepted together
+    thresholds = np.unique(conf_sorted)
+    accepted = n - np.searchsorted(np.sort(small_conf), thresholds, side="left")
+    return thresholds, accepted / n, accuracy[accepted]
+
+def choose_threshold(small_probs, full_probs, labels, max_accuracy_loss=0.01):
+    """
+    Lowest threshold (most images answered by the small model) whose cascade
+    accuracy is within `max_accuracy_loss` of the full model alone.
+    """
+    small_probs = np.asarray(small_probs)
+    full_probs = np.asarray(full_probs)
+    labels = np.asarray(labels)
+    full_accuracy = float(np.mean(full_probs.argmax(axis=1) == labels))
+    small_accuracy = float(np.mean(small_probs.argmax(axis=1) == labels))
+
+    thresholds, accept_rates, accuracies = cascade_curve(small_probs, full_probs, labels)
+    ok = np.nonzero(full_accuracy - accuracies <= max_accuracy_loss)[0]
+    if ok.size:
+        i = ok[0]
+        threshold, accept_rate, accuracy = float(thresholds[i]), float(accept_rates[i]), float(accuracies[i])
+    else:
+        # Nothing qualifies: never trust the small model
+        threshold, accept_rate, accuracy = 1.01, 0.0, full_accuracy
+
+    return {
+        "threshold": threshold,
+        "max_accuracy_loss": max_accuracy_loss,
+        "accept_rate": accept_rate,
+        "cascade_accuracy": accuracy,
+        "full_accuracy": full_accuracy,
+        "small_accuracy": small_accuracy,
+        "samples": int(labels.size),
+    }
+
+def expected_cost_ms(accept_rate, small_ms, full_ms):
+    """
+    Average latency per request: every image pays for the small model,
+    escalated images also pay for the full model.
+    """
+    return small_ms + (1.0 - accept_rate) * full_ms
+
+def load_calibration(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Could not read cascade calibration: {e}")
+        return None
+
+def save_calibration(calibration, path):
+    os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(calibration, f, indent=2)
+    return path
@@ -20,6 +20,97 @@ MODELS_DIR = BASE_DIR / "models"
 # Deep Learning Model (Keras/TensorFlow)
 MODEL_PATH = MODELS_DIR / "car_brand_model.h5"
 CLASS_INDICES_PATH = MODELS_DIR / "class_indices.json"
+# Memory-mapped serving artifact exported from MODEL_PATH (`scripts/model_artifact.py export`).
+# Loaded instead of the .h5 while it matches it. The weights' size and mtime are always checked
+# against the manifest; ARTIFACT_VERIFY also hashes the whole file on every load.
+MODEL_ARTIFACT_PATH = MODELS_DIR / "car_brand_model.omni"
+MODEL_ARTIFACT_VERIFY = os.environ.get("OMNIVISION_ARTIFACT_VERIFY", "0") == "1"
+
+# Cascade: small model (MobileNetV2 alpha=0.35 @ 128px, `train_cnn.py --variant small`)
+# answers when its confidence clears the calibrated threshold, otherwise the full model runs.
+CASCADE_MODEL_PATH = MODELS_DIR / "car_brand_model_small.h5"
+CASCADE_CLASS_INDICES_PATH = MODELS_DIR / "class_indices_small.json"
+CASCADE_CALIBRATION_PATH = MODELS_DIR / "cascade_calibration.json"
+CASCADE_ENABLED = os.environ.get("OMNIVISION_CASCADE", "0") == "1"
+CASCADE_DEFAULT_THRESHOLD = 0.9  # Used until scripts/calibrate_cascade.py has run
+
+# Resolution variants: the same architecture trained at lower input sizes
+# (`train_cnn.py --variant r128`). Requests pick one explicitly or via a latency budget,
+# mapped with the table `scripts/benchmark.py --variants` writes to VARIANT_TABLE_PATH.
+RESOLUTION_VARIANTS = (96, 128, 160, 224)
+VARIANT_TABLE_PATH = MODELS_DIR / "resolution_variants.json"
+
+def variant_paths(resolution):
+    """
+    Model and class-index paths of a resolution variant artifact. The served model
+    (MODEL_PATH) joins the variants under its actual input size, which a tuned retrain
+    may change (see ModelManager.available_variants).
+    """
+    return {
+        "model": MODELS_DIR / f"car_brand_model_{resolution}.h5",
+        "classes": MODELS_DIR / f"class_indices_{resolution}.json",
+    }
+
+# Test-time augmentation: predictions below TTA_THRESHOLD are re-run as one batch of
+# flipped/cropped views. Enabled globally here or per request with /predict?tta=true.
+TTA_ENABLED = os.environ.get("OMNIVISION_TTA", "0") == "1"
+TTA_THRESHOLD = 0.4
+TTA_CROP_FRACTION = 0.9
+
+# Streaming (/ws/predict): pending frames of all connections run as one batch of up to
+# STREAM_MAX_BATCH, waiting at most STREAM_BATCH_DELAY seconds for more to arrive.
+STREAM_MAX_BATCH = 16
+STREAM_BATCH_DELAY = 0.005
+
+# Grad-CAM explanations (/explain): concurrent requests run as one gradient pass of up to
+# EXPLAIN_MAX_BATCH images (waiting EXPLAIN_BATCH_DELAY s for more), on a background thread
+# that holds back while predictions run or wait for the model, for up to EXPLAIN_MAX_DEFER s.
+# Heatmaps are cached by image hash and model version (EXPLAIN_CACHE_SIZE entries); beyond
+# EXPLAIN_MAX_PENDING queued images new requests get 503.
+EXPLAIN_MAX_BATCH = 8
+EXPLAIN_BATCH_DELAY = 0.02
+EXPLAIN_MAX_DEFER = 2.0
+EXPLAIN_CACHE_SIZE = 256
+EXPLAIN_MAX_PENDING = 32
+EXPLAIN_OVERLAY_SIZE = 320  # longest side of the PNG overlay
+
+# Logo search (/predict/search): square tiles at these fractions of the shorter image side,
+# overlapping by SEARCH_OVERLAP; levels stop below SEARCH_MIN_TILE px or past SEARCH_MAX_TILES.
+# Tiles run SEARCH_BATCH_SIZE per forward pass until one clears SEARCH_THRESHOLD or the
+# next pass would exceed SEARCH_MAX_LATENCY_MS.
+SEARCH_SCALES = (0.6, 0.35, 0.2)
+SEARCH_OVERLAP = 0.25
+SEARCH_MIN_TILE = 96
+SEARCH_MAX_TILES = 96
+SEARCH_BATCH_SIZE = 16
+SEARCH_THRESHOLD = 0.8
+SEARCH_MAX_LATENCY_MS = 1500.0
+
+# Admission control for the inference endpoints (app/middleware.py). Requests with
+# `X-Client: ui` (the web UI) and everything else ("api") have separate in-flight and
+# queue limits; the queue is further capped to what still finishes within ADMISSION_SLO_MS
+# at the observed service time (starting from ADMISSION_INITIAL_SERVICE_MS).
+ADMISSION_ENABLED = os.environ.get("OMNIVISION_ADMISSION", "1") == "1"
+ADMISSION_PATHS = ("/predict", "/predict/search")
+ADMISSION_LIMITS = {
+    "ui": {"max_in_flight": 2, "max_queue": 4},
+    "api": {"max_in_flight": 4, "max_queue": 16},
+}
+ADMISSION_SLO_MS = 2000.0
+ADMISSION_INITIAL_SERVICE_MS = 250.0
+
+# Request deadlines: clients send X-Request-Deadline-Ms (their remaining patience);
+# requests without it get REQUEST_DEADLINE_MS. Expired work is dropped before inference.
+REQUEST_DEADLINE_MS = float(os.environ.get("OMNIVISION_REQUEST_DEADLINE_MS", "30000"))
+
+# BoVW fallback (core/vision_logic.py): once BOVW_FALLBACK_QUEUE_DEPTH requests are
+# waiting for the CNN (model lock plus admission queues), or the model lock has been held
+# for BOVW_FALLBACK_LOCK_HELD_MS, plain /predict requests are answered by the per-domain
+# SIFT/ORB + SVM artifacts in models/BOVW_FALLBACK_DOMAIN/ (loaded at startup).
+BOVW_FALLBACK_ENABLED = os.environ.get("OMNIVISION_BOVW_FALLBACK", "1") == "1"
+BOVW_FALLBACK_DOMAIN = "cars"
+BOVW_FALLBACK_QUEUE_DEPTH = 4
+BOVW_FALLBACK_LOCK_HELD_MS = 1000.0
 
 # Legacy Paths (Kept briefly to avoid immediate import errors, but will be phased out)
 CODEBOOK_PATH = MODELS_DIR / "vocabulary.pkl"
@@ -37,14 +128,46 @@ CLASS_LABELS = [
 DOMAINS = {
     "cars": CLASS_LABELS
 }
+# The domain MODEL_PATH / CLASS_INDICES_PATH are trained on: only its retrains are promoted to serving
+SERVED_DOMAIN = "cars"
 
 # Image Configuration
 IMG_SIZE = (224, 224)
 BATCH_SIZE = 32
+# Fraction of each class train_cnn.py validates on (see core.cascade.dataset_split)
+VALIDATION_SPLIT = 0.2
 
 # Metrics Directory
 METRICS_DIR = BASE_DIR / "static" / "metrics"
 
+# CNN hyperparameter search (scripts/tune_hyperparams.py). The best configuration is written
+# to HYPERPARAMS_PATH, which `train/train_cnn.py --hyperparams` applies; backbone features
+# and image arrays of the tuning split are cached under TUNING_CACHE_DIR.
+HYPERPARAMS_PATH = BASE_DIR / "config" / "hyperparams.json"
+TUNING_CACHE_DIR = BASE_DIR / "data" / "cache" / "tuning"
+
+# Retraining Scheduler
+# Requests for a domain are merged into one pending job that starts once no new
+# request arrived for DEBOUNCE seconds, but never later than MAX_DELAY after the first one.
+TRAINING_QUEUE_PATH = BASE_DIR / "data" / "training_queue.json"
+TRAINING_DEBOUNCE_SECONDS = 30
+TRAINING_MAX_DELAY_SECONDS = 300
+
+# Training Worker
+# Retrains run in a separate process so they don't compete with /predict for the GIL.
+# THREADS caps TF intra/inter-op threads, CPUS pins the worker to those cores (Linux), None = no limit.
+TRAINING_OUT_OF_PROCESS = True
+TRAINING_WORKER_THREADS = max(1, (os.cpu_count() or 2) // 2)
+TRAINING_WORKER_CPUS = None
+TRAINING_WORKER_NICE = 10
+TRAINING_STAGING_DIR = MODELS_DIR / "staging"
+
+# Diagnostics
+# SERVER_TIMING adds per-stage timings to /predict responses (Server-Timing header).
+# ADMIN_TOKEN enables the /admin profiling endpoints (sent as X-Admin-Token); unset = disabled.
+SERVER_TIMING_ENABLED = os.environ.get("OMNIVISION_SERVER_TIMING", "0") == "1"
+ADMIN_TOKEN = os.environ.get("OMNIVISION_ADMIN_TOKEN")
+
 def get_model_paths(domain="cars"):
     """
     Returns the paths for the Deep Learning model.
@@ -0,0 +1,70 @@
+"""
+core/deadline.py
+
+Responsibility:
+    - Per-request deadlines. A client sends its remaining patience as
+      `X-Request-Deadline-Ms` (milliseconds from arrival); without the header the
+      server default REQUEST_DEADLINE_MS applies.
+    - Each stage calls `check(stage)` before handing work on (admission queue, upload,
+      decode, batch formation), so work whose client has given up never reaches the model.
+    - Expired requests are counted per stage, together with the inference time they
+      would have cost (the running mean of the inference stage): the work saved.
+"""
+
+import time
+
+from core.config import REQUEST_DEADLINE_MS
+from core import telemetry
+
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+
+class DeadlineExceeded(Exception):
+    def __init__(self, stage):
+        super().__init__(f"Request deadline exceeded at stage '{stage}'.")
+        self.stage = stage
+
+class Deadline:
+    __slots__ = ("start", "budget_ms")
+
+    def __init__(self, budget_ms, start=None):
+        self.budget_ms = float(budget_ms)
+        self.start = time.perf_counter() if start is None else start
+
+    @classmethod
+    def from_header(cls, value, start=None, default_ms=None):
+        """
+        Parses the header value; a missing or malformed value gets the server default.
+        """
+        try:
+            budget_ms = float(value)
+        except (TypeError, ValueError):
+            budget_ms = 0.0
+        if budget_ms <= 0:
+            budget_ms = REQUEST_DEADLINE_MS if default_ms is None else default_ms
+        return cls(budget_ms, start)
+
+    def remaining_ms(self):
+        return self.budget_ms - (time.perf_counter() - self.start) * 1000.0
+
+    def expired(self):
+        return self.remaining_ms() <= 0
+
+    def check(self, stage):
+        """
+        Raises DeadlineExceeded (and records the saved work) once the deadline has passed.
+        """
+        if self.expired():
+            record_expired(stage)
+            raise DeadlineExceeded(stage)
+
+def expected_inference_seconds():
+    """
+    Mean observed inference-stage time, or 0 before the first prediction.
+    """
+    child = telemetry.STAGE_INFERENCE
+    count = sum(child.counts)
+    return child.sum / count if count else 0.0
+
+def record_expired(stage, requests=1):
+    telemetry.DEADLINE_EXPIRED.labels(stage).inc(requests)
+    telemetry.DEADLINE_SAVED_SECONDS.inc(requests * expected_inference_seconds())
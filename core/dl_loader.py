@@ -2,25 +2,42 @@
 import tensorflow as tf
 import os
 import json
-from core.config import MODEL_PATH, CLASS_INDICES_PATH
+from core.config import MODEL_PATH, CLASS_INDICES_PATH, MODEL_ARTIFACT_PATH, MODEL_ARTIFACT_VERIFY
+from core.artifact import is_artifact, is_current, load_artifact
 
-def load_trained_model():
+def load_trained_model(model_path=None, class_indices_path=None):
     """
-    Loads the trained Keras model and class indices.
+    Loads the trained Keras model and class indices (defaults: the served model).
+    The served model comes from the memory-mapped artifact while it matches the .h5;
+    an artifact directory passed as `model_path` carries its own class indices.
     """
-    if not os.path.exists(MODEL_PATH):
-        print(f"Error: Model not found at {MODEL_PATH}")
+    if model_path is None and is_current(MODEL_ARTIFACT_PATH, MODEL_PATH):
+        model_path = MODEL_ARTIFACT_PATH
+    model_path = model_path or MODEL_PATH
+    if is_artifact(model_path):
+        print(f"Loading model artifact from {model_path}...")
+        try:
+            model, class_indices = load_artifact(model_path, verify=MODEL_ARTIFACT_VERIFY)
+            print("Model loaded successfully.")
+            return model, class_indices
+        except Exception as e:
+            print(f"Failed to load model artifact: {e}")
+            return None, None
+
+    class_indices_path = class_indices_path or CLASS_INDICES_PATH
+    if not os.path.exists(model_path):
+        print(f"Error: Model not found at {model_path}")
         return None, None
 
-    if not os.path.exists(CLASS_INDICES_PATH):
-        print(f"Error: Class indices not found at {CLASS_INDICES_PATH}")
+    if not os.path.exists(class_indices_path):
+        print(f"Error: Class indices not found at {class_indices_path}")
         return None, None
 
-    print(f"Loading model from {MODEL_PATH}...")
+    print(f"Loading model from {model_path}...")
     try:
-        model = tf.keras.models.load_model(MODEL_PATH)
+        model = tf.keras.models.load_model(model_path)
         
-        with open(CLASS_INDICES_PATH, 'r') as f:
+        with open(class_indices_path, 'r') as f:
             class_indices = json.load(f)
             
         print("Model loaded successfully.")
@@ -0,0 +1,240 @@
+"""
+core/explain.py
+
+Responsibility:
+    - Grad-CAM heatmaps for the CNN (the /explain endpoint): gradients of the predicted
+      class score with respect to the last convolutional feature map, pooled into
+      per-channel weights, give a coarse map of the regions that drove the prediction.
+    - One compiled gradient pass per model covers a whole batch of images.
+    - ExplainService batches concurrent requests on a background thread, caches heatmaps
+      by (image hash, model version) and merges duplicate in-flight requests. It runs
+      without PREDICTION_LOCK and holds back new batches (for up to EXPLAIN_MAX_DEFER)
+      while predictions run or wait for the model, so gradient passes don't compete
+      with them for CPU.
+"""
+
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from core.config import (EXPLAIN_MAX_BATCH, EXPLAIN_BATCH_DELAY, EXPLAIN_MAX_DEFER, EXPLAIN_CACHE_SIZE,
+                         EXPLAIN_MAX_PENDING, EXPLAIN_OVERLAY_SIZE)
+from core.cascade import model_input_size
+from core.streaming import _label
+from core.locks import PREDICTION_LOCK
+from core import telemetry
+
+_compiled = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+def gradcam_layer(model):
+    """
+    The last layer with a spatial (batch, h, w, channels) output, e.g. MobileNetV2's out_relu.
+    """
+    for layer in reversed(model.layers):
+        if isinstance(layer, tf.keras.layers.InputLayer):
+            continue
+        try:
+            rank = len(layer.output.shape)
+        except (AttributeError, ValueError):  # unbuilt or shared layer
+            continue
+        if rank == 4:
+            return layer
+    raise ValueError("Model has no convolutional feature map to explain.")
+
+def _compile(model):
+    grad_model = tf.keras.Model(model.inputs, [gradcam_layer(model).output, model.output])
+
+    @tf.function(reduce_retracing=True)
+    def cams(batch):
+        with tf.GradientTape() as tape:
+            features, probs = grad_model(batch, training=False)
+            # Samples are independent, so the gradient of the summed top scores is per-image
+            top = tf.reduce_max(probs, axis=1)
+        grads = tape.gradient(top, features)
+        weights = tf.reduce_mean(grads, axis=(1, 2), keepdims=True)
+        cam = tf.nn.relu(tf.reduce_sum(weights * features, axis=-1))
+        cam = tf.math.divide_no_nan(cam, tf.reduce_max(cam, axis=(1, 2), keepdims=True))
+        return cam, probs
+
+    return cams
+
+def gradcam(model, x):
+    """
+    (heatmaps (n, h, w) in [0, 1] at feature-map resolution, probabilities (n, classes))
+    for a preprocessed batch.
+    """
+    fn = _compiled.get(model)
+    if fn is None:
+        with _lock:
+            fn = _compiled.get(model)
+            if fn is None:
+                fn = _compiled[model] = _compile(model)
+    cam, probs = fn(tf.convert_to_tensor(x, dtype=tf.float32))
+    return cam.numpy(), probs.numpy()
+
+def overlay_png(image_bytes, heatmap, alpha=0.4, max_side=EXPLAIN_OVERLAY_SIZE):
+    """
+    PNG of the image (longest side at most `max_side`) blended with the colour-mapped heatmap.
+    """
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image bytes.")
+    h, w = image.shape[:2]
+    scale = min(1.0, max_side / max(h, w))
+    if scale < 1.0:
+        w, h = max(1, round(w * scale)), max(1, round(h * scale))
+        image = cv2.resize(image, (w, h), interpolation=cv2.INTER_AREA)
+    heat = cv2.resize(np.asarray(heatmap, dtype=np.float32), (w, h), interpolation=cv2.INTER_LINEAR)
+    colored = cv2.applyColorMap(np.uint8(np.clip(heat, 0, 1) * 255), cv2.COLORMAP_JET)
+    _, buf = cv2.imencode(".png", cv2.addWeighted(colored, alpha, image, 1 - alpha, 0))
+    return buf.tobytes()
+
+class ExplainQueueFull(Exception):
+    pass
+
+class ExplainService:
+    """
+    Batched, cached Grad-CAM. `get_model()` returns (model, class indices),
+    `get_version()` the model version for cache keys and `preprocess(bytes, (w, h))`
+    a (1, h, w, 3) array. `submit()` returns a Future resolving to
+    {label, confidence, heatmap (float16), cached}.
+    """
+
+    def __init__(self, get_model, get_version, preprocess, max_batch=8, max_delay=0.02, max_defer=2.0,
+                 cache_size=256, max_pending=32):
+        self.get_model = get_model
+        self.get_version = get_version
+        self.preprocess = preprocess
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_defer = max_defer
+        self.cache_size = cache_size
+        self.max_pending = max_pending
+        self._cache = OrderedDict()  # key -> result, least recently used first
+        self._in_flight = {}         # key -> Future
+        self._pending = []           # (key, image bytes), oldest first
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {"hits": 0, "computed": 0, "batches": 0}
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._cond:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="explainer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, image_bytes):
+        """
+        Never blocks. Raises ExplainQueueFull when max_pending images are already queued.
+        """
+        key = (hashlib.sha256(image_bytes).hexdigest(), self.get_version())
+        with self._cond:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+                telemetry.EXPLAIN_TOTAL.labels("hit").inc()
+                future = Future()
+                future.set_result(dict(cached, cached=True))
+                return future
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+            if len(self._pending) >= self.max_pending:
+                telemetry.EXPLAIN_TOTAL.labels("rejected").inc()
+                raise ExplainQueueFull(f"{len(self._pending)} explanations already queued; retry shortly.")
+            future = self._in_flight[key] = Future()
+            self._pending.append((key, image_bytes))
+            self._cond.notify()
+        self._ensure_started()
+        return future
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_delay
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _yield_to_predict(self):
+        # Lock held = a /predict, stream batch or search pass is running; depth = more are waiting
+        give_up = time.monotonic() + self.max_defer
+        while ((PREDICTION_LOCK.locked() or telemetry.INFERENCE_QUEUE_DEPTH.total() > 0)
+               and time.monotonic() < give_up):
+            time.sleep(0.01)
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            self._yield_to_predict()
+            try:
+                outcomes = self._explain(batch)
+            except Exception as e:
+                print(f"ExplainService: Batch of {len(batch)} failed: {e}")
+                outcomes = [RuntimeError(f"Explanation failed: {e}")] * len(batch)
+            with self._cond:
+                for (key, _), outcome in zip(batch, outcomes):
+                    if not isinstance(outcome, Exception):
+                        self._cache[key] = outcome
+                        if len(self._cache) > self.cache_size:
+                            self._cache.popitem(last=False)
+                    future = self._in_flight.pop(key)
+                    if isinstance(outcome, Exception):
+                        telemetry.EXPLAIN_TOTAL.labels("error").inc()
+                        future.set_exception(outcome)
+                    else:
+                        future.set_result(dict(outcome, cached=False))
+
+    def _explain(self, batch):
+        model, classes = self.get_model()
+        if model is None:
+            return [RuntimeError("Model not initialized or available.")] * len(batch)
+
+        size = model_input_size(model)
+        outcomes = [None] * len(batch)
+        inputs, rows = [], []
+        for i, (_, image_bytes) in enumerate(batch):
+            try:
+                inputs.append(self.preprocess(image_bytes, size))
+                rows.append(i)
+            except Exception as e:
+                outcomes[i] = ValueError(f"Invalid image: {e}")
+        if inputs:
+            cams, probs = gradcam(model, np.concatenate(inputs))
+            telemetry.EXPLAIN_BATCH_SIZE.observe(len(inputs))
+            telemetry.EXPLAIN_TOTAL.labels("computed").inc(len(inputs))
+            self.stats["batches"] += 1
+            self.stats["computed"] += len(inputs)
+            for i, cam, p in zip(rows, cams, probs):
+                outcomes[i] = dict(_label(p, classes), heatmap=cam.astype(np.float16))
+        return outcomes
+
+_explainer = None
+_explainer_lock = threading.Lock()
+
+def get_explainer(get_model, get_version, preprocess) -> ExplainService:
+    """
+    Returns the process-wide ExplainService (created on first use with these callables).
+    """
+    global _explainer
+    if _explainer is None:
+        with _explainer_lock:
+            if _explainer is None:
+                _explainer = ExplainService(get_model, get_version, preprocess, EXPLAIN_MAX_BATCH, EXPLAIN_BATCH_DELAY,
+                                            EXPLAIN_MAX_DEFER, EXPLAIN_CACHE_SIZE, EXPLAIN_MAX_PENDING)
+    return _explainer
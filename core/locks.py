@@ -4,7 +4,47 @@ core/locks.py
 Global lock definitions to prevent race conditions.
 """
 import threading
+import time
+
+
+class TimedLock:
+    """
+    threading.Lock that remembers when it was acquired, so the event loop can see how
+    long the current holder (a stream batch, search pass, reload...) has had the model.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._acquired_at = None
+
+    def acquire(self, blocking=True, timeout=-1):
+        acquired = self._lock.acquire(blocking, timeout)
+        if acquired:
+            self._acquired_at = time.perf_counter()
+        return acquired
+
+    def release(self):
+        self._acquired_at = None
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def held_for(self):
+        """
+        Seconds the lock has been held by its current owner (0.0 if free).
+        """
+        acquired_at = self._acquired_at
+        return 0.0 if acquired_at is None else time.perf_counter() - acquired_at
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
 
 # Lock to coordinate between prediction (read) and model reloading/saving (write)
 # Used in app/routes.py (predict) and app/services/training.py (retrain/save)
-PREDICTION_LOCK = threading.Lock()
+PREDICTION_LOCK = TimedLock()
@@ -0,0 +1,120 @@
+"""
+core/profiling.py
+
+Responsibility:
+    - `server_timing_header`: Formats per-request stage timings for the Server-Timing header.
+    - `SamplingProfiler`: On-demand wall-clock sampler over all threads that produces
+      collapsed stacks (`frame;frame;frame count`) for flamegraph.pl / speedscope.
+    - tracemalloc helpers: start tracing, diff the current heap against a baseline, stop.
+    Nothing here runs unless explicitly invoked, so it costs nothing when off.
+"""
+
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter
+
+def server_timing_header(stages):
+    """
+    {"decode": 0.0012, ...} (seconds) -> 'decode;dur=1.200, ...' (milliseconds).
+    """
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in stages.items())
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", code.co_filename)
+    return f"{module}:{code.co_name}"
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread every `interval` seconds for `duration` seconds.
+    Only one profile can run at a time per process.
+    """
+
+    _running = threading.Lock()
+
+    def __init__(self, duration=10.0, interval=0.005):
+        self.duration = duration
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+
+    def run(self):
+        """
+        Blocks for `duration` seconds and returns the collapsed-stack text.
+        Raises RuntimeError if another profile is in progress.
+        """
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("A profile is already running.")
+        try:
+            own_ident = threading.get_ident()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            deadline = time.perf_counter() + self.duration
+            while time.perf_counter() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_name(frame))
+                        frame = frame.f_back
+                    thread = names.get(ident, f"thread-{ident}").replace(" ", "_")
+                    self.stacks[";".join([thread] + stack[::-1])] += 1
+                self.samples += 1
+                time.sleep(self.interval)
+        finally:
+            self._running.release()
+        return self.collapsed()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_baseline = None
+
+def tracemalloc_start(frames=10):
+    """
+    Starts tracemalloc (if needed) and records the baseline snapshot.
+    """
+    global _tracemalloc_baseline
+    with _tracemalloc_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        _tracemalloc_baseline = tracemalloc.take_snapshot()
+    return {"tracing": True, "frames": tracemalloc.get_traceback_limit()}
+
+def tracemalloc_diff(limit=25, group_by="lineno", reset=False):
+    """
+    Compares the current heap to the baseline. Returns the top `limit` differences.
+    With `reset`, the current snapshot becomes the new baseline.
+    """
+    global _tracemalloc_baseline
+    with _tracemalloc_lock:
+        if not tracemalloc.is_tracing() or _tracemalloc_baseline is None:
+            raise RuntimeError("tracemalloc is not running.")
+        snapshot = tracemalloc.take_snapshot()
+        stats = snapshot.compare_to(_tracemalloc_baseline, group_by)
+        if reset:
+            _tracemalloc_baseline = snapshot
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "traced_current_bytes": current,
+        "traced_peak_bytes": peak,
+        "top": [
+            {
+                "location": str(stat.traceback),
+                "size_diff_bytes": stat.size_diff,
+                "size_bytes": stat.size,
+                "count_diff": stat.count_diff,
+            }
+            for stat in stats[:limit]
+        ],
+    }
+
+def tracemalloc_stop():
+    global _tracemalloc_baseline
+    with _tracemalloc_lock:
+        tracemalloc.stop()
+        _tracemalloc_baseline = None
+    return {"tracing": False}
@@ -0,0 +1,102 @@
+"""
+core/search.py
+
+Responsibility:
+    - Logo search over large images: instead of squashing the whole upload to the
+      model's input size, classifies square tiles over a scale pyramid, coarse to fine
+      (full frame first), so a small logo is seen at a usable resolution.
+    - All tiles are cut and resized by one crop_and_resize op per batch and classified
+      in batched forward passes; the search stops at the first pass whose best tile
+      clears the confidence threshold, or before a pass that would exceed the latency cap.
+    - The tile count follows the image size: finer levels are only added while their
+      tiles stay above SEARCH_MIN_TILE pixels and the total stays within SEARCH_MAX_TILES.
+"""
+
+import math
+import time
+import numpy as np
+import tensorflow as tf
+
+from core.config import (SEARCH_SCALES, SEARCH_OVERLAP, SEARCH_MIN_TILE, SEARCH_MAX_TILES,
+                         SEARCH_BATCH_SIZE, SEARCH_THRESHOLD, SEARCH_MAX_LATENCY_MS)
+from core.locks import PREDICTION_LOCK
+from core.cascade import model_input_size
+from core.inference import forward
+
+IGNORED_LABELS = ("background",)
+
+def search_boxes(width, height, scales=SEARCH_SCALES, overlap=SEARCH_OVERLAP,
+                 min_tile=SEARCH_MIN_TILE, max_tiles=SEARCH_MAX_TILES):
+    """
+    Normalised [y1, x1, y2, x2] boxes: the full frame, then square tiles per scale
+    (tile side = scale x shorter image side), coarse to fine.
+    """
+    boxes = [[0.0, 0.0, 1.0, 1.0]]
+    short = min(width, height)
+    for scale in scales:
+        side = short * scale
+        if side < min_tile:
+            break
+        stride = side * (1.0 - overlap)
+        nx = max(1, math.ceil((width - side) / stride) + 1)
+        ny = max(1, math.ceil((height - side) / stride) + 1)
+        if len(boxes) + nx * ny > max_tiles:
+            break
+        for y in np.linspace(0, height - side, ny):
+            for x in np.linspace(0, width - side, nx):
+                boxes.append([y / height, x / width, (y + side) / height, (x + side) / width])
+    return np.array(boxes, dtype=np.float32)
+
+def search_image(model, image, classes, threshold=SEARCH_THRESHOLD, max_latency_ms=SEARCH_MAX_LATENCY_MS,
+                 batch_size=SEARCH_BATCH_SIZE):
+    """
+    Runs the pyramid search on an (H, W, 3) uint8 image. Returns the best tile's
+    label, confidence and pixel box [x1, y1, x2, y2] with search statistics.
+    """
+    start = time.perf_counter()
+    height, width = image.shape[:2]
+    boxes = search_boxes(width, height)
+    in_w, in_h = model_input_size(model)
+    ignored = [int(i) for i, label in classes.items() if str(label).lower() in IGNORED_LABELS]
+    pixels = tf.convert_to_tensor(image[None])
+
+    best = {"confidence": -1.0}
+    passes = evaluated = 0
+    stopped, pass_ms = "exhausted", 0.0
+    for i in range(0, len(boxes), batch_size):
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        if passes and elapsed_ms + pass_ms > max_latency_ms:
+            stopped = "latency"
+            break
+        t_pass = time.perf_counter()
+        chunk = boxes[i:i + batch_size]
+        crops = tf.image.crop_and_resize(pixels, chunk, tf.zeros(len(chunk), dtype=tf.int32), (in_h, in_w)) / 255.0
+        with PREDICTION_LOCK:
+            probs = forward(model, crops)
+        pass_ms = (time.perf_counter() - t_pass) * 1000.0
+        passes += 1
+        evaluated += len(chunk)
+
+        scored = probs.copy()
+        scored[:, ignored] = 0.0
+        row, idx = np.unravel_index(int(np.argmax(scored)), scored.shape)
+        if scored[row, idx] > best["confidence"]:
+            y1, x1, y2, x2 = chunk[row]
+            best = {"confidence": float(scored[row, idx]), "index": int(idx),
+                    "box": [int(round(x1 * width)), int(round(y1 * height)),
+                            int(round(x2 * width)), int(round(y2 * height))]}
+        if best["confidence"] >= threshold:
+            stopped = "confident"
+            break
+
+    label = classes.get(str(best["index"])) or classes.get(best["index"], "Unknown")
+    return {
+        "label": label,
+        "confidence": best["confidence"],
+        "box": best["box"],
+        "tiles_evaluated": evaluated,
+        "tiles_total": len(boxes),
+        "passes": passes,
+        "stopped": stopped,
+        "elapsed_ms": (time.perf_counter() - start) * 1000.0,
+    }
@@ -0,0 +1,198 @@
+"""
+core/streaming.py
+
+Responsibility:
+    - Micro-batched classification of live camera frames (the /ws/predict endpoint).
+    - Each connection owns a FrameStream holding at most one pending frame: a newer
+      frame replaces it (the stale one is dropped and counted). A frame is picked up
+      only once the connection's previous result has been sent, so per-connection lag
+      is bounded to one frame in flight plus one pending, whatever the client's rate.
+    - One daemon thread takes the pending frames of all connections, runs them as a
+      single batch under PREDICTION_LOCK and hands each result back in frame order.
+    - Frames older than the connection's deadline budget when the batch is formed are
+      answered with an error instead of being classified (core/deadline.py).
+"""
+
+import threading
+import time
+import numpy as np
+
+from core.config import STREAM_MAX_BATCH, STREAM_BATCH_DELAY
+from core.locks import PREDICTION_LOCK
+from core.cascade import model_input_size
+from core.inference import forward
+from core.deadline import record_expired
+from core import telemetry
+
+class FrameStream:
+    """
+    Per-connection state. `deliver(result)` is called from the batcher thread;
+    `budget_ms` is how old a frame may get before it is no longer worth classifying.
+    """
+
+    def __init__(self, deliver, budget_ms=None):
+        self.deliver = deliver
+        self.budget_ms = budget_ms
+        self.next_seq = 0
+        self.pending = None  # (seq, frame bytes, received_at)
+        self.busy = False    # a frame is in the model or its result is unsent
+        self.closed = False
+        self.dropped = 0
+
+class FrameBatcher:
+    """
+    Shares one batched forward pass across all streaming connections.
+    `get_model()` returns (model, class indices); `preprocess(frame_bytes, (w, h))`
+    returns a (1, h, w, 3) array.
+    """
+
+    def __init__(self, get_model, preprocess, max_batch=16, max_delay=0.005):
+        self.get_model = get_model
+        self.preprocess = preprocess
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._ready = []  # streams with a pending frame that may run, oldest first
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {"frames": 0, "dropped": 0, "batches": 0}
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._cond:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="frame-batcher", daemon=True)
+                    self._thread.start()
+
+    def open(self, deliver, budget_ms=None):
+        self._ensure_started()
+        telemetry.STREAM_CONNECTIONS.inc()
+        return FrameStream(deliver, budget_ms)
+
+    def submit(self, stream, frame):
+        """
+        Queues `frame` as the stream's newest frame and returns its sequence number.
+        Never blocks; an older frame that has not started is dropped.
+        """
+        with self._cond:
+            seq = stream.next_seq
+            stream.next_seq += 1
+            if stream.pending is not None:
+                stream.dropped += 1
+                self.stats["dropped"] += 1
+                telemetry.STREAM_DROPPED.inc()
+            elif not stream.busy:
+                self._ready.append(stream)
+                self._cond.notify()
+            stream.pending = (seq, frame, time.perf_counter())
+        return seq
+
+    def release(self, stream):
+        """
+        Called once the stream's last result has been sent; lets its next frame run.
+        """
+        with self._cond:
+            stream.busy = False
+            if stream.pending is not None and not stream.closed:
+                self._ready.append(stream)
+                self._cond.notify()
+
+    def close(self, stream):
+        with self._cond:
+            stream.closed = True
+            stream.pending = None
+            if stream in self._ready:
+                self._ready.remove(stream)
+        telemetry.STREAM_CONNECTIONS.dec()
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._ready:
+                self._cond.wait()
+            # Give frames from other connections a moment to join the batch
+            deadline = time.monotonic() + self.max_delay
+            while len(self._ready) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = []
+            for stream in self._ready[:self.max_batch]:
+                batch.append((stream,) + stream.pending)
+                stream.pending = None
+                stream.busy = True
+            del self._ready[:self.max_batch]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            now = time.perf_counter()
+            expired = [s.budget_ms is not None and (now - received) * 1000.0 > s.budget_ms
+                       for s, _, _, received in batch]
+            live = [item for item, late in zip(batch, expired) if not late]
+            if len(live) < len(batch):
+                record_expired("batch", len(batch) - len(live))
+            try:
+                live_results = iter(self._classify(live) if live else [])
+            except Exception as e:
+                print(f"FrameBatcher: Batch of {len(live)} failed: {e}")
+                live_results = iter([{"error": f"Prediction Internal Error: {e}"}] * len(live))
+            results = [{"error": "Frame deadline exceeded before inference.", "expired": True} if late
+                       else next(live_results) for late in expired]
+            for (stream, seq, _, received), result in zip(batch, results):
+                result = dict(result, seq=seq, dropped=stream.dropped,
+                              latency_ms=(time.perf_counter() - received) * 1000.0)
+                if stream.closed:
+                    continue
+                try:
+                    stream.deliver(result)
+                except Exception as e:  # connection's event loop already gone
+                    print(f"FrameBatcher: Could not deliver frame {seq}: {e}")
+
+    def _classify(self, batch):
+        model, classes = self.get_model()
+        if model is None:
+            return [{"error": "Model not initialized or available."}] * len(batch)
+
+        size = model_input_size(model)
+        results = [None] * len(batch)
+        inputs, rows = [], []
+        for i, (_, _, frame, _) in enumerate(batch):
+            try:
+                inputs.append(self.preprocess(frame, size))
+                rows.append(i)
+            except Exception as e:
+                telemetry.STREAM_INVALID.inc()
+                results[i] = {"error": f"Invalid image: {e}"}
+        if inputs:
+            with PREDICTION_LOCK:
+                probs = forward(model, np.concatenate(inputs))
+            telemetry.STREAM_BATCH_SIZE.observe(len(inputs))
+            self.stats["batches"] += 1
+            self.stats["frames"] += len(inputs)
+            telemetry.STREAM_PROCESSED.inc(len(inputs))
+            for i, p in zip(rows, probs):
+                results[i] = _label(p, classes)
+        return results
+
+def _label(probs, classes):
+    confidence = float(np.max(probs))
+    idx = int(np.argmax(probs))
+    label = classes.get(str(idx)) or classes.get(idx, "Unknown")
+    if confidence < 0.4:
+        return {"label": "Uncertain", "confidence": confidence}
+    return {"label": label.title(), "confidence": confidence}
+
+_frame_batcher = None
+_frame_batcher_lock = threading.Lock()
+
+def get_frame_batcher(get_model, preprocess) -> FrameBatcher:
+    """
+    Returns the process-wide FrameBatcher (created on first use with these callables).
+    """
+    global _frame_batcher
+    if _frame_batcher is None:
+        with _frame_batcher_lock:
+            if _frame_batcher is None:
+                _frame_batcher = FrameBatcher(get_model, preprocess, STREAM_MAX_BATCH, STREAM_BATCH_DELAY)
+    return _frame_batcher
@@ -0,0 +1,223 @@
+"""
+core/telemetry.py
+
+Responsibility:
+    - Minimal in-process metrics (Counter, Gauge, Histogram) rendered in the
+      Prometheus text exposition format, without a client library dependency.
+    - Hot-path cost is one lock and a bisect per observation; bind label
+      children once (`.labels(...)`) and reuse them.
+    - Defines the serving metrics used by app/routes.py.
+"""
+
+import threading
+from bisect import bisect_left
+
+class _Child:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = float(value)
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        return _Child()
+
+    def labels(self, *values):
+        """
+        Returns the child for these label values (created on first use).
+        """
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _label_str(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in list(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{self._label_str(key)} {_fmt(child.value)}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0):
+        self._children[()].inc(amount)
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1.0):
+        self._children[()].inc(amount)
+
+    def dec(self, amount=1.0):
+        self._children[()].dec(amount)
+
+    def set(self, value):
+        self._children[()].set(value)
+
+    def total(self):
+        """
+        Sum over all label children (e.g. requests queued across client classes).
+        """
+        return sum(child.value for child in list(self._children.values()))
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    # Seconds; tuned for per-stage serving latencies (sub-ms decode up to multi-second inference)
+    DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._children[()].observe(value)
+
+    def _render_child(self, key, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), list(child.counts)):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _fmt(bound)
+            lines.append(f"{self.name}_bucket{self._label_str(key, ('le', le))} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_str(key)} {_fmt(child.sum)}")
+        lines.append(f"{self.name}_count{self._label_str(key)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        """
+        Prometheus text format (version 0.0.4).
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+def _fmt(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- Serving metrics ---
+
+PREDICT_STAGE_SECONDS = Histogram(
+    "omnivision_predict_stage_seconds",
+    "Time spent in each /predict stage (read, decode, preprocess, queue_wait, inference, total).",
+    ["stage"],
+)
+STAGE_READ = PREDICT_STAGE_SECONDS.labels("read")
+STAGE_DECODE = PREDICT_STAGE_SECONDS.labels("decode")
+STAGE_PREPROCESS = PREDICT_STAGE_SECONDS.labels("preprocess")
+STAGE_QUEUE_WAIT = PREDICT_STAGE_SECONDS.labels("queue_wait")
+STAGE_INFERENCE = PREDICT_STAGE_SECONDS.labels("inference")
+STAGE_TOTAL = PREDICT_STAGE_SECONDS.labels("total")
+
+PREDICTIONS_TOTAL = Counter("omnivision_predictions_total", "Predictions returned, by label.", ["label"])
+UNCERTAIN_TOTAL = Counter("omnivision_uncertain_predictions_total", "Predictions below the confidence threshold.")
+ERRORS_TOTAL = Counter("omnivision_errors_total", "Failed /predict requests, by error type.", ["type"])
+MODEL_CACHE_TOTAL = Counter("omnivision_model_cache_total", "ModelManager lookups, by result (hit/miss).", ["result"])
+CACHE_HIT = MODEL_CACHE_TOTAL.labels("hit")
+CACHE_MISS = MODEL_CACHE_TOTAL.labels("miss")
+
+CASCADE_TOTAL = Counter("omnivision_cascade_total", "Cascade predictions, by the tier that answered (small/full).", ["tier"])
+CASCADE_SMALL = CASCADE_TOTAL.labels("small")
+CASCADE_FULL = CASCADE_TOTAL.labels("full")
+
+TTA_TOTAL = Counter("omnivision_tta_total", "Test-time augmentation passes, by outcome (rescued/uncertain).", ["outcome"])
+TTA_RESCUED = TTA_TOTAL.labels("rescued")
+TTA_UNCERTAIN = TTA_TOTAL.labels("uncertain")
+
+SEARCH_TOTAL = Counter("omnivision_search_total", "Logo searches, by why they stopped (confident/latency/exhausted).", ["stopped"])
+SEARCH_TILES = Histogram("omnivision_search_tiles", "Tiles classified per logo search.", buckets=(1, 4, 8, 16, 32, 64, 128))
+
+STREAM_FRAMES_TOTAL = Counter("omnivision_stream_frames_total", "/ws/predict frames, by outcome (processed/dropped/invalid).", ["outcome"])
+STREAM_PROCESSED = STREAM_FRAMES_TOTAL.labels("processed")
+STREAM_DROPPED = STREAM_FRAMES_TOTAL.labels("dropped")
+STREAM_INVALID = STREAM_FRAMES_TOTAL.labels("invalid")
+STREAM_BATCH_SIZE = Histogram("omnivision_stream_batch_size", "Frames per /ws/predict forward pass.", buckets=(1, 2, 4, 8, 16, 32, 64))
+STREAM_CONNECTIONS = Gauge("omnivision_stream_connections", "Open /ws/predict connections.")
+
+EXPLAIN_TOTAL = Counter("omnivision_explain_total", "/explain requests, by result (hit/computed/rejected/error).", ["result"])
+EXPLAIN_BATCH_SIZE = Histogram("omnivision_explain_batch_size", "Images per Grad-CAM gradient pass.", buckets=(1, 2, 4, 8, 16, 32))
+
+ADMISSION_TOTAL = Counter("omnivision_admission_total", "Admission decisions, by client class and outcome.", ["client", "outcome"])
+ADMISSION_IN_FLIGHT = Gauge("omnivision_admission_in_flight", "Admitted inference requests in progress, by client class.", ["client"])
+ADMISSION_QUEUED = Gauge("omnivision_admission_queued", "Requests waiting for admission, by client class.", ["client"])
+ADMISSION_SERVICE_MS = Gauge("omnivision_admission_service_ms", "Smoothed service time of admitted requests (ms).")
+
+DEADLINE_EXPIRED = Counter("omnivision_deadline_expired_total", "Requests/frames dropped after their deadline, by stage.", ["stage"])
+DEADLINE_SAVED_SECONDS = Counter("omnivision_deadline_saved_seconds_total", "Estimated inference time not spent on expired requests.")
+
+BOVW_FALLBACK_TOTAL = Counter("omnivision_bovw_fallback_total", "/predict requests served by the BoVW fallback under CNN backlog.")
+BOVW_STAGE_SECONDS = Histogram("omnivision_bovw_stage_seconds", "Time spent in each BoVW fallback stage (decode, features, quantize, classify).", ["stage"])
+
+INFERENCE_QUEUE_DEPTH = Gauge("omnivision_inference_queue_depth", "Requests waiting for the model lock.")
+MODEL_VERSION = Gauge("omnivision_model_version", "Version of the loaded model (artifact mtime, 0 if none).")
@@ -0,0 +1,52 @@
+"""
+core/tta.py
+
+Responsibility:
+    - Test-time augmentation for low-confidence predictions.
+    - All views (full frame, centre and corner crops, each also mirrored) are
+      built as one batch with a single crop_and_resize op and classified in one
+      forward pass, so the extra cost is one batched call, not one call per view.
+    - Views are combined by averaging log-probabilities (equivalent to averaging
+      logits for a softmax head) and renormalising.
+"""
+
+import numpy as np
+import tensorflow as tf
+from core.inference import forward
+
+def tta_boxes(crop=0.9):
+    """
+    Normalised [y1, x1, y2, x2] boxes: full frame, centre, top-left and bottom-right crops.
+    """
+    m = (1.0 - crop) / 2.0
+    return np.array([
+        [0.0, 0.0, 1.0, 1.0],
+        [m, m, 1.0 - m, 1.0 - m],
+        [0.0, 0.0, crop, crop],
+        [1.0 - crop, 1.0 - crop, 1.0, 1.0],
+    ], dtype=np.float32)
+
+def build_tta_batch(x, crop=0.9):
+    """
+    (1, H, W, 3) preprocessed image -> (8, H, W, 3) batch of crops and their mirror images.
+    """
+    _, h, w, _ = x.shape
+    boxes = tta_boxes(crop)
+    crops = tf.image.crop_and_resize(tf.convert_to_tensor(x, dtype=tf.float32), boxes,
+                                     tf.zeros(len(boxes), dtype=tf.int32), (h, w))
+    return tf.concat([crops, tf.reverse(crops, axis=[2])], axis=0)
+
+def combine_views(probs, eps=1e-7):
+    """
+    (V, C) per-view softmax outputs -> (1, C) averaged in log space.
+    """
+    logits = np.log(np.clip(probs, eps, 1.0)).mean(axis=0)
+    exp = np.exp(logits - logits.max())
+    return (exp / exp.sum())[np.newaxis, :]
+
+def tta_predict(model, x, crop=0.9):
+    """
+    Classifies all augmented views of `x` in one forward pass. Returns (1, C) probabilities.
+    """
+    probs = forward(model, build_tta_batch(x, crop))
+    return combine_views(probs)
@@ -0,0 +1,40 @@
+"""
+core/variants.py
+
+Responsibility:
+    - Maps a request's latency budget to a resolution variant of the model,
+      using the accuracy/latency table written by `scripts/benchmark.py --variants`.
+    - Without measurements there is nothing to map against and the default model serves.
+"""
+
+import json
+import os
+
+def load_variant_table(path):
+    """
+    {resolution: {"p50_ms", "p95_ms", "accuracy", ...}} with int keys, or {} if missing.
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"Could not read variant table: {e}")
+        return {}
+    return {int(res): row for res, row in data.get("variants", {}).items()}
+
+def pick_variant(budget_ms, available, table):
+    """
+    Most accurate available variant whose p95 latency fits `budget_ms`
+    (largest resolution breaks ties and stands in for unknown accuracy).
+    If nothing fits, the fastest one. Returns None when no available variant was measured.
+    """
+    measured = [r for r in available if r in table]
+    if not measured:
+        return None
+
+    fits = [r for r in measured if table[r].get("p95_ms", float("inf")) <= budget_ms]
+    if not fits:
+        return min(measured, key=lambda r: table[r].get("p95_ms", float("inf")))
+    return max(fits, key=lambda r: (table[r].get("accuracy") or 0.0, r))
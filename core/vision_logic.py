@@ -1,5 +1,174 @@
 """
-DEPRECATED.
-This file contained legacy Computer Vision logic (ORB features, Bag of Visual Words).
-The new system uses end-to-end Deep Learning (CNNs).
+core/vision_logic.py
+
+Responsibility:
+    - Bag of Visual Words (BoVW) fallback engine: local descriptors -> visual-word
+      histogram -> scaler -> SVM, using the per-domain artifacts shipped in
+      `models/{domain}/` (kmeans.pkl, scaler.pkl, svm.pkl, classes.pkl).
+    - CPU-cheap and lock-free, so /predict can divert to it while the CNN queue is
+      backed up (see BOVW_FALLBACK_QUEUE_DEPTH).
+    - Quantization assigns all descriptors of an image with one batched
+      nearest-centroid matrix product (|x|^2 - 2 x.C^T + |c|^2) instead of a
+      per-descriptor `kmeans.predict`.
+    - Artifacts are loaded with joblib `mmap_mode='r'`, so their arrays are mapped
+      from disk instead of copied into every worker.
 """
+
+import os
+import time
+import cv2
+import joblib
+import numpy as np
+
+from core.config import MODELS_DIR, BOVW_FALLBACK_DOMAIN
+
+SIFT_DIM = 128
+ORB_DIM = 32
+ORB_FEATURES = 500
+
+def extract_sift_features(gray):
+    """
+    (keypoints, float32 descriptors of shape (n, 128)); descriptors are None without keypoints.
+    """
+    return cv2.SIFT_create().detectAndCompute(gray, None)
+
+def extract_orb_features(gray, n_features=ORB_FEATURES):
+    """
+    ORB descriptors (n, 32) of a grayscale image, or None if it has no keypoints.
+    """
+    _, descriptors = extractor_for(ORB_DIM, n_features)(gray)
+    return descriptors
+
+def extractor_for(dim, n_features=ORB_FEATURES):
+    """
+    detectAndCompute-style callable (gray -> (keypoints, descriptors)) matching a
+    codebook's descriptor dimension: SIFT for 128, ORB for 32. The one place ORB is
+    configured, so training features and the fallback engine always agree.
+    """
+    if dim == SIFT_DIM:
+        return extract_sift_features
+    return lambda gray: cv2.ORB_create(nfeatures=n_features).detectAndCompute(gray, None)
+
+def quantize(descriptors, centers, centers_sq=None):
+    """
+    Nearest visual word for every descriptor in one matrix product.
+    Returns (word indices, squared distances).
+    """
+    x = np.asarray(descriptors, dtype=np.float32)
+    if centers_sq is None:
+        centers_sq = np.einsum("ij,ij->i", centers, centers)
+    d2 = (x * x).sum(axis=1)[:, None] - 2.0 * (x @ centers.T) + centers_sq[None, :]
+    words = np.argmin(d2, axis=1)
+    return words, np.maximum(d2[np.arange(len(x)), words], 0.0)
+
+def build_histogram(descriptors, kmeans):
+    """
+    Visual-word counts (length n_clusters). Uses the batched quantizer when the codebook
+    exposes its centers, `kmeans.predict` otherwise.
+    """
+    hist = np.zeros(kmeans.n_clusters, dtype=np.float32)
+    if descriptors is None or len(descriptors) == 0:
+        return hist
+    centers = getattr(kmeans, "cluster_centers_", None)
+    if centers is not None:
+        words, _ = quantize(descriptors, np.asarray(centers, dtype=np.float32))
+    else:
+        words = kmeans.predict(np.asarray(descriptors, dtype=np.float32))
+    hist += np.bincount(words, minlength=kmeans.n_clusters).astype(np.float32)
+    return hist
+
+def normalize_histogram(hist):
+    """
+    L1-normalises a histogram (an all-zero histogram stays zero).
+    """
+    total = float(np.sum(hist))
+    return hist / total if total > 0 else hist
+
+class BoVWEngine:
+    """
+    Descriptor extraction, quantization and SVM classification for one domain.
+    """
+
+    def __init__(self, kmeans, scaler, svm, classes):
+        self.kmeans = kmeans
+        self.scaler = scaler
+        self.svm = svm
+        self.classes = list(classes)
+        self.centers = np.ascontiguousarray(kmeans.cluster_centers_, dtype=np.float32)
+        self.centers_sq = np.einsum("ij,ij->i", self.centers, self.centers)
+        self.extract = extractor_for(self.centers.shape[1])
+
+    @classmethod
+    def load(cls, domain="cars", models_dir=MODELS_DIR):
+        """
+        Loads `models/{domain}/` with memory-mapped arrays. Raises on missing or
+        unreadable artifacts (e.g. Git LFS pointers that were never pulled).
+        """
+        base = os.path.join(str(models_dir), domain)
+        parts = {name: joblib.load(os.path.join(base, f"{name}.pkl"), mmap_mode="r")
+                 for name in ("kmeans", "scaler", "svm", "classes")}
+        return cls(parts["kmeans"], parts["scaler"], parts["svm"], parts["classes"])
+
+    def encode(self, descriptors):
+        """
+        L1-normalised visual-word histogram of one image's descriptors.
+        """
+        if descriptors is None or len(descriptors) == 0:
+            return np.zeros(len(self.centers), dtype=np.float32)
+        words, _ = quantize(descriptors, self.centers, self.centers_sq)
+        return normalize_histogram(np.bincount(words, minlength=len(self.centers)).astype(np.float32))
+
+    def classify(self, hist):
+        """
+        (label, confidence) for one normalised histogram.
+        """
+        features = self.scaler.transform(hist[None, :])
+        try:
+            probs = self.svm.predict_proba(features)[0]
+        except AttributeError:  # SVC trained without probability estimates
+            scores = np.atleast_1d(self.svm.decision_function(features)[0])
+            if scores.size == 1:
+                scores = np.array([-scores[0], scores[0]])
+            probs = np.exp(scores - scores.max())
+            probs /= probs.sum()
+        idx = int(np.argmax(probs))
+        label = self.svm.classes_[idx]
+        if isinstance(label, (int, np.integer)) and 0 <= label < len(self.classes):
+            label = self.classes[label]
+        return str(label), float(probs[idx])
+
+    def predict(self, image_bytes):
+        """
+        Classifies encoded image bytes. Returns (label, confidence, per-stage seconds).
+        """
+        t0 = time.perf_counter()
+        gray = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError("Could not decode image bytes.")
+        t1 = time.perf_counter()
+        _, descriptors = self.extract(gray)
+        t2 = time.perf_counter()
+        hist = self.encode(descriptors)
+        t3 = time.perf_counter()
+        label, confidence = self.classify(hist)
+        t4 = time.perf_counter()
+        return label, confidence, {"decode": t1 - t0, "features": t2 - t1, "quantize": t3 - t2, "classify": t4 - t3}
+
+_engine = None
+_engine_loaded = False
+
+def get_bovw_engine():
+    """
+    Returns the process-wide BoVWEngine for BOVW_FALLBACK_DOMAIN, or None if its
+    artifacts cannot be loaded (tried once; the fallback then stays off).
+    """
+    global _engine, _engine_loaded
+    if not _engine_loaded:
+        try:
+            _engine = BoVWEngine.load(BOVW_FALLBACK_DOMAIN)
+            print(f"BoVW fallback loaded ({len(_engine.centers)} visual words).")
+        except Exception as e:
+            print(f"BoVW fallback unavailable: {e}")
+            _engine = None
+        _engine_loaded = True
+    return _engine
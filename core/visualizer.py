@@ -5,16 +5,25 @@ Responsibility:
     - Visual Debugging: Generates images to explain model decisions.
     - Keypoint Rendering: Visualizes SIFT keypoints on an image.
     - Visual Word Montage: Visualizes what the "Visual Words" (clusters) represent.
+      Images are scanned as a stream over a process pool; each word keeps only a
+      fixed-size heap of its nearest patches, so memory is bounded by the montage size.
 """
 
 import cv2
 import numpy as np
 import os
+import heapq
+import random
+import itertools
 import joblib
-from core.vision_logic import extract_sift_features
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from core.vision_logic import extractor_for, quantize
 from core.image_utils import load_image
 from core.config import MODELS_DIR, CODEBOOK_PATH
 
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
 def visualize_keypoints(image_path, save_path=None):
     """
     Draws SIFT keypoints on the image and saves/returns it.
@@ -37,107 +46,130 @@ def visualize_keypoints(image_path, save_path=None):
         
     return img_with_keypoints
 
-def generate_visual_word_montage(dataset_paths, save_path="static/vocab_montage.png", num_words=10, patch_size=20):
+def list_images(dataset_paths):
+    """
+    Paths of all images under the given directories.
+    """
+    paths = []
+    for base in dataset_paths:
+        for root, _, files in os.walk(base):
+            paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+# Per-process scan state, set once by _init_scanner instead of pickled with every task
+_scanner = {}
+
+def _init_scanner(centers, target_words, per_word, patch_size):
+    centers = np.ascontiguousarray(centers, dtype=np.float32)
+    _scanner.update(centers=centers, centers_sq=np.einsum("ij,ij->i", centers, centers),
+                    extract=extractor_for(centers.shape[1]), target=np.asarray(target_words),
+                    per_word=per_word, patch_size=patch_size)
+
+def _scan_image(path):
+    """
+    The `per_word` nearest patches of one image for every target word:
+    {word: [(squared distance, patch), ...]}. Descriptors are quantized once and only the
+    selected keypoints are cropped, so the result never exceeds per_word patches per word.
+    """
+    img = cv2.imread(path)
+    if img is None:
+        return {}
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    keypoints, descriptors = _scanner["extract"](gray)
+    if descriptors is None or len(descriptors) == 0:
+        return {}
+
+    words, d2 = quantize(descriptors, _scanner["centers"], _scanner["centers_sq"])
+    per_word, patch_size = _scanner["per_word"], _scanner["patch_size"]
+    found = {}
+    for word in np.intersect1d(words, _scanner["target"]):
+        idx = np.flatnonzero(words == word)
+        if len(idx) > per_word:
+            idx = idx[np.argpartition(d2[idx], per_word - 1)[:per_word]]
+        patches = []
+        for i in idx:
+            x, y = int(keypoints[i].pt[0]), int(keypoints[i].pt[1])
+            r = max(int(keypoints[i].size / 2), patch_size // 2)
+            patch = img[max(0, y - r):min(gray.shape[0], y + r), max(0, x - r):min(gray.shape[1], x + r)]
+            if patch.size > 0:
+                patches.append((float(d2[i]), cv2.resize(patch, (patch_size, patch_size))))
+        found[int(word)] = patches
+    return found
+
+def _scan_all(paths, workers, init_args):
+    """
+    Yields per-image scan results, keeping at most 2 * workers images in flight.
+    workers=0 scans in this process.
+    """
+    if workers == 0:
+        _init_scanner(*init_args)
+        yield from map(_scan_image, paths)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_scanner, initargs=init_args) as pool:
+        pending = set()
+        for path in paths:
+            pending.add(pool.submit(_scan_image, path))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from (f.result() for f in done)
+        yield from (f.result() for f in as_completed(pending))
+
+def generate_visual_word_montage(dataset_paths, save_path="static/vocab_montage.png", num_words=10, patch_size=20,
+                                 per_word=9, max_images=200, workers=None, codebook_path=CODEBOOK_PATH, seed=0):
     """
-    Generates a montage of the top `num_words` visual words (cluster centers).
-    For each word, it finds the top 9 patches from the dataset that are closest to the center.
+    Generates a montage of the first `num_words` visual words (cluster centers): for each
+    word, a 3-column grid of the `per_word` dataset patches closest to its center.
+    Scans up to `max_images` images over a process pool (`workers`, default all CPUs;
+    0 = in-process). Each word keeps a fixed-size heap of its nearest patches, so memory
+    stays bounded however many images are scanned. Returns the montage, or None.
     """
     print("Generating Visual Word Montage...")
-    
-    # Load KMeans
-    if not os.path.exists(CODEBOOK_PATH):
+
+    if not os.path.exists(codebook_path):
         print("Model not trained yet. Cannot generate montage.")
-        return
+        return None
 
-    kmeans = joblib.load(CODEBOOK_PATH)
-    centers = kmeans.cluster_centers_
-    
-    # We want to find patches for the first `num_words` clusters (or random ones)
-    # Let's pick the most populated ones? Or just the first k.
-    # KMeans labels are arbitrary, so 0..k-1.
-    target_clusters = range(num_words)
-    
-    # Store patches: {cluster_idx: [(distance, patch), ...]}
-    cluster_patches = {i: [] for i in target_clusters}
-    
-    # Collect patches from dataset
-    # We need to traverse a subset of images to find good matches
-    from train.train_model import load_dataset
-    from core.config import CLASS_LABELS
-    
-    # Load a subset of images to save time
-    image_paths, _ = load_dataset(dataset_paths, CLASS_LABELS)
-    np.random.shuffle(image_paths)
-    subset_paths = image_paths[:200]  # Check 200 images
-    
-    sift = cv2.SIFT_create()
-    
-    print(f"Scanning {len(subset_paths)} images for visual words...")
-    
-    for path in subset_paths:
-        img = cv2.imread(path)
-        if img is None: continue
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        kp, des = sift.detectAndCompute(gray, None)
-        if des is None: continue
-        
-        # Predict clusters for these descriptors
-        des = des.astype(np.float32)
-        predictions = kmeans.predict(des)
-        
-        # Calculate distance to center
-        # transform() returns distance to all centers, we pick the one for the prediction
-        dists = kmeans.transform(des)
-        
-        for i, (pred, kpoint) in enumerate(zip(predictions, kp)):
-            if pred in target_clusters:
-                dist = dists[i][pred]
-                
-                # Extract patch
-                x, y = int(kpoint.pt[0]), int(kpoint.pt[1])
-                r = int(kpoint.size / 2)
-                # Ensure meaningful patch size
-                r = max(r, patch_size // 2)
-                
-                # Crop patch
-                y1, y2 = max(0, y-r), min(gray.shape[0], y+r)
-                x1, x2 = max(0, x-r), min(gray.shape[1], x+r)
-                patch = img[y1:y2, x1:x2]
-                
-                if patch.size > 0:
-                    patch = cv2.resize(patch, (patch_size, patch_size))
-                    cluster_patches[pred].append((dist, patch))
-                    
-    # Sort and pick top 9 for each cluster
-    montage_rows = []
-    
-    for cluster_id in target_clusters:
-        patches = cluster_patches[cluster_id]
-        patches.sort(key=lambda x: x[0]) # Sort by distance (ascending)
-        top_patches = [p[1] for p in patches[:9]]
-        
-        # Pad if not enough
-        while len(top_patches) < 9:
-            top_patches.append(np.zeros((patch_size, patch_size, 3), dtype=np.uint8))
-            
-        # Create a 3x3 grid for this cluster
-        row1 = np.hstack(top_patches[0:3])
-        row2 = np.hstack(top_patches[3:6])
-        row3 = np.hstack(top_patches[6:9])
-        cluster_grid = np.vstack([row1, row2, row3])
-        
-        # Add a border or label?
-        # Let's just stack them horizontally with others
-        montage_rows.append(cluster_grid)
-        
-    # Stack all cluster grids horizontally
-    if montage_rows:
-        full_montage = np.hstack(montage_rows)
-        cv2.imwrite(save_path, full_montage)
-        print(f"Saved montage to {save_path}")
-    else:
+    centers = joblib.load(codebook_path).cluster_centers_
+    target_words = list(range(min(num_words, len(centers))))
+
+    paths = list_images(dataset_paths)
+    random.Random(seed).shuffle(paths)
+    paths = paths[:max_images]
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    print(f"Scanning {len(paths)} images for visual words ({workers or 'no'} worker processes)...")
+
+    # Max-heaps (by distance) of at most `per_word` entries: (-distance, tiebreak, patch)
+    heaps = {word: [] for word in target_words}
+    tiebreak = itertools.count()
+    for found in _scan_all(paths, workers, (centers, target_words, per_word, patch_size)):
+        for word, patches in found.items():
+            heap = heaps[word]
+            for dist, patch in patches:
+                entry = (-dist, next(tiebreak), patch)
+                if len(heap) < per_word:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+
+    if not any(heaps.values()):
         print("Could not generate montage (no patches found).")
+        return None
+
+    blank = np.zeros((patch_size, patch_size, 3), dtype=np.uint8)
+    rows = -(-per_word // 3)
+    grids = []
+    for word in target_words:
+        top = [patch for _, _, patch in sorted(heaps[word], reverse=True)]  # nearest first
+        top += [blank] * (rows * 3 - len(top))
+        grids.append(np.vstack([np.hstack(top[r * 3:(r + 1) * 3]) for r in range(rows)]))
+
+    montage = np.hstack(grids)
+    if save_path:
+        cv2.imwrite(save_path, montage)
+        print(f"Saved montage to {save_path}")
+    return montage
 
 if __name__ == "__main__":
     # Test run
@@ -146,10 +178,13 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--image", type=str, help="Image to visualize keypoints")
     parser.add_argument("--dataset", type=str, help="Dataset path for montage")
+    parser.add_argument("--workers", type=int, default=None, help="Montage scan processes (0 = in-process)")
+    parser.add_argument("--max-images", type=int, default=200, help="Images to scan for the montage")
     args = parser.parse_args()
     
     if args.image:
         visualize_keypoints(args.image, "static/keypoints_debug.jpg")
         
     if args.dataset:
-        generate_visual_word_montage([args.dataset], "static/vocab_montage.png")
+        generate_visual_word_montage([args.dataset], "static/vocab_montage.png",
+                                     max_images=args.max_images, workers=args.workers)
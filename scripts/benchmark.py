@@ -2,107 +2,433 @@
 scripts/benchmark.py
 
 Responsibility:
-    - Measures latency of the pipeline components: SIFT, Quantization, SVM.
-    - Ensures the system is real-time compatible.
+    - Benchmarks the CNN serving path stage by stage: decode, preprocess, inference.
+    - Sweeps inference batch sizes (1..64) and TF thread settings (one child process per
+      setting, since TF thread pools are fixed once the runtime starts).
+    - Times the BoVW fallback (core/vision_logic.py) per stage: decode, features,
+      quantize, classify (a random stand-in codebook/SVM if models/cars/ can't be loaded).
+    - Reports cold-start model load time, steady-state throughput and peak RSS.
+    - Writes machine-readable JSON to static/metrics/benchmarks/ for run-to-run comparison.
+    - `--variants`: accuracy/latency table of the resolution variants, written to
+      VARIANT_TABLE_PATH where the server uses it to map latency budgets to variants.
+    - Works without a trained model: synthetic images and a tiny stand-in network.
+
+Usage:
+    python scripts/benchmark.py
+    python scripts/benchmark.py --threads 1,2,4 --batch-sizes 1,8,32 --standin
+    python scripts/benchmark.py --compare static/metrics/benchmarks/latest.json
+    python scripts/benchmark.py --variants --data-dir data/raw/cars
 """
 
-import time
 import os
 import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
 import numpy as np
 import cv2
-import joblib
 
 # Add project root to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.vision_logic import extract_sift_features, build_histogram, normalize_histogram
-from core.image_utils import load_image
-from core.config import MOD_DIR, CODEBOOK_PATH, SCALER_PATH, SVM_PATH, CLASS_LABELS
-# Note: core.config might define MODELS_DIR instead of MOD_DIR, checking import below.
-from core.config import MODELS_DIR
+from core.config import IMG_SIZE, METRICS_DIR, MODEL_PATH, RESOLUTION_VARIANTS, VARIANT_TABLE_PATH, variant_paths
+
+BENCHMARK_DIR = METRICS_DIR / "benchmarks"
+DEFAULT_BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64]
+
+def make_synthetic_images(n=32, size=(640, 480), seed=0):
+    """
+    Deterministic JPEG-encoded test images (noise background + logo-like shapes).
+    """
+    rng = np.random.default_rng(seed)
+    images = []
+    w, h = size
+    for _ in range(n):
+        img = rng.integers(0, 255, (h, w, 3), dtype=np.uint8)
+        cx, cy = int(rng.integers(w // 4, 3 * w // 4)), int(rng.integers(h // 4, 3 * h // 4))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.circle(img, (cx, cy), int(min(w, h) // 5), color, -1)
+        cv2.putText(img, "LOGO", (cx - 60, cy + 15), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3)
+        _, buf = cv2.imencode(".jpg", img)
+        images.append(buf.tobytes())
+    return images
+
+def load_image_dir(data_dir, n=32):
+    """
+    Raw bytes of up to `n` images found under `data_dir`.
+    """
+    paths = []
+    for root, _, files in os.walk(data_dir):
+        paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(('.png', '.jpg', '.jpeg')))
+    images = []
+    for path in sorted(paths)[:n]:
+        with open(path, 'rb') as f:
+            images.append(f.read())
+    return images
+
+def build_standin_model(num_classes=9, input_size=IMG_SIZE, seed=0):
+    """
+    Tiny deterministic CNN with the serving input/output contract, used when no
+    trained model exists. Much cheaper than MobileNetV2; only relative numbers matter.
+    """
+    import tensorflow as tf
+    tf.keras.utils.set_random_seed(seed)
+    inputs = tf.keras.Input(shape=tuple(input_size) + (3,))
+    x = tf.keras.layers.Conv2D(16, 3, strides=2, activation='relu')(inputs)
+    x = tf.keras.layers.Conv2D(32, 3, strides=2, activation='relu')(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(num_classes, activation='softmax')(x)
+    return tf.keras.Model(inputs, outputs)
+
+def build_standin_bovw(n_words=200, classes=("audi", "bmw", "mercedes"), seed=0):
+    """
+    BoVWEngine with a random SIFT codebook and an SVM fitted on random histograms:
+    realistic stage costs for the fallback without the trained artifacts.
+    """
+    from types import SimpleNamespace
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.svm import SVC
+    from core.vision_logic import BoVWEngine, SIFT_DIM
+    rng = np.random.default_rng(seed)
+    kmeans = SimpleNamespace(cluster_centers_=rng.random((n_words, SIFT_DIM), dtype=np.float32) * 100,
+                             n_clusters=n_words)
+    hists = rng.dirichlet(np.ones(n_words), size=20 * len(classes)).astype(np.float32)
+    labels = np.repeat(np.arange(len(classes)), 20)
+    scaler = StandardScaler().fit(hists)
+    svm = SVC(random_state=seed).fit(scaler.transform(hists), labels)
+    return BoVWEngine(kmeans, scaler, svm, classes)
+
+def load_model_for_benchmark(standin=False):
+    """
+    Returns (model, source, load_seconds). Falls back to the stand-in model.
+    """
+    start = time.perf_counter()
+    if not standin and os.path.exists(MODEL_PATH):
+        from core.dl_loader import load_trained_model
+        model, _ = load_trained_model()
+        if model is not None:
+            return model, "trained", time.perf_counter() - start
+    model = build_standin_model()
+    return model, "standin", time.perf_counter() - start
+
+def summarize(samples):
+    """
+    Latency statistics (milliseconds) for a list of durations in seconds.
+    """
+    arr = np.asarray(samples, dtype=np.float64) * 1000.0
+    if arr.size == 0:
+        return {}
+    return {
+        "n": int(arr.size),
+        "mean_ms": float(arr.mean()),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "min_ms": float(arr.min()),
+    }
+
+def time_calls(fn, items, repeat=1):
+    samples = []
+    for _ in range(repeat):
+        for item in items:
+            start = time.perf_counter()
+            fn(item)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+def bench_stages(images, repeat=3, size=IMG_SIZE):
+    """
+    Times decode and preprocess (resize + normalize to `size`) separately, exactly as /predict does.
+    """
+    from app.routes import decode_image, prepare_image
+    decoded = [decode_image(b) for b in images]
+    return {
+        "decode": summarize(time_calls(decode_image, images, repeat)),
+        "preprocess": summarize(time_calls(lambda img: prepare_image(img, size), decoded, repeat)),
+    }
+
+def bench_bovw(images, repeat=3, standin=False):
+    """
+    Per-stage latency of the BoVW fallback, as /predict serves it under CNN backlog.
+    """
+    from core.config import BOVW_FALLBACK_DOMAIN
+    from core.vision_logic import BoVWEngine
+    engine, source = None, "standin"
+    if not standin:
+        try:
+            engine, source = BoVWEngine.load(BOVW_FALLBACK_DOMAIN), "trained"
+        except Exception as e:
+            print(f"  BoVW artifacts unavailable ({e}); using stand-in")
+    if engine is None:
+        engine = build_standin_bovw()
+
+    samples = {"decode": [], "features": [], "quantize": [], "classify": [], "total": []}
+    for _ in range(repeat):
+        for image in images:
+            _, _, stages = engine.predict(image)
+            for stage, seconds in stages.items():
+                samples[stage].append(seconds)
+            samples["total"].append(sum(stages.values()))
+    result = {stage: summarize(values) for stage, values in samples.items()}
+    result["source"] = source
+    result["visual_words"] = len(engine.centers)
+    return result
+
+def bench_inference(model, batch_sizes, iters=10, warmup=2):
+    """
+    Per batch size: latency of one forward pass and steady-state images/sec,
+    through `model.predict` (the default serving call), an eager `model(x)` call and
+    the compiled forward pass used by the cascade/variant/TTA paths.
+    """
+    from core.inference import forward
+    from core.cascade import model_input_size
+    w, h = model_input_size(model)
+    rng = np.random.default_rng(0)
+    results = {}
+    for bs in batch_sizes:
+        x = rng.random((bs, h, w, 3), dtype=np.float32)
+        entry = {}
+        for mode, fn in (("predict", lambda: model.predict(x, verbose=0)),
+                         ("call", lambda: model(x, training=False)),
+                         ("compiled", lambda: forward(model, x))):
+            for _ in range(warmup):
+                fn()
+            samples = time_calls(lambda _: fn(), range(iters))
+            stats = summarize(samples)
+            stats["images_per_sec"] = bs * len(samples) / sum(samples)
+            entry[mode] = stats
+        results[str(bs)] = entry
+        print(f"  batch {bs:>3}: predict p50 {entry['predict']['p50_ms']:.2f} ms "
+              f"({entry['predict']['images_per_sec']:.1f} img/s), call p50 {entry['call']['p50_ms']:.2f} ms, "
+              f"compiled p50 {entry['compiled']['p50_ms']:.2f} ms")
+    return results
+
+def bench_variants(images, iters=20, standin=False, data_dir=None, limit=None):
+    """
+    Per resolution variant: end-to-end single-image latency (resize + normalize +
+    compiled forward pass, as /predict serves variants) and, with labelled `data_dir`, validation accuracy.
+    Untrained variants are skipped unless `standin` is set.
+    """
+    from app.routes import decode_image, prepare_image
+    from core.dl_loader import load_trained_model
+    from core.inference import forward
+    from scripts.calibrate_cascade import validation_files, predict_files
+    from core.cascade import model_input_size
+    decoded = [decode_image(b) for b in images]
+
+    # The served model is measured under its actual input size, as ModelManager serves it
+    served, served_res = (None, None), None
+    if not standin and os.path.exists(MODEL_PATH):
+        served = load_trained_model()
+        if served[0] is not None:
+            served_res = model_input_size(served[0])[0]
+
+    table = {}
+    for res in RESOLUTION_VARIANTS:
+        paths = variant_paths(res)
+        if standin:
+            model, classes = build_standin_model(input_size=(res, res)), None
+        elif res == served_res:
+            model, classes = served
+        elif os.path.exists(paths["model"]):
+            model, classes = load_trained_model(paths["model"], paths["classes"])
+        else:
+            continue
+        if model is None:
+            continue
+
+        serve = lambda img: forward(model, prepare_image(img, (res, res)))
+        for img in decoded[:2]:
+            serve(img)
+        stats = summarize(time_calls(serve, (decoded[i % len(decoded)] for i in range(iters))))
 
-def run_benchmark(dataset_path, num_samples=50):
-    print("Loading models...")
+        accuracy = None
+        if data_dir and classes:
+            items = validation_files(data_dir, {label: int(idx) for idx, label in classes.items()}, limit=limit)
+            if items:
+                probs = predict_files(model, [p for p, _ in items])
+                accuracy = float(np.mean(probs.argmax(axis=1) == np.array([label for _, label in items])))
+
+        table[str(res)] = {"p50_ms": stats["p50_ms"], "p95_ms": stats["p95_ms"], "accuracy": accuracy,
+                           "throughput_rps": 1000.0 / stats["mean_ms"]}
+        acc = f"{accuracy:.3f}" if accuracy is not None else "  n/a"
+        print(f"  {res:>3}px: p50 {stats['p50_ms']:7.2f} ms | p95 {stats['p95_ms']:7.2f} ms | "
+              f"{table[str(res)]['throughput_rps']:7.1f} img/s | accuracy {acc}")
+    return table
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def run_single(args):
+    """
+    One benchmark run in this process (fixed TF thread setting).
+    """
+    if args.threads_child:
+        for var in ("TF_NUM_INTRAOP_THREADS", "OMP_NUM_THREADS"):
+            os.environ[var] = str(args.threads_child)
+    import tensorflow as tf
+    if args.threads_child:
+        tf.config.threading.set_intra_op_parallelism_threads(args.threads_child)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    images = load_image_dir(args.data_dir, args.images) if args.data_dir else []
+    if not images:
+        images = make_synthetic_images(args.images)
+
+    print(f"[threads={args.threads_child or 'default'}] Loading model...")
+    model, source, load_s = load_model_for_benchmark(args.standin)
+    print(f"  model: {source}, load {load_s * 1000:.1f} ms")
+
+    # Sized from the model: a tuned retrain may serve another input size than IMG_SIZE
+    from core.cascade import model_input_size
+    input_size = model_input_size(model)
+    stages = bench_stages(images, repeat=args.repeat, size=input_size)
+    print(f"  decode p50 {stages['decode']['p50_ms']:.2f} ms, preprocess p50 {stages['preprocess']['p50_ms']:.2f} ms")
+
+    bovw = bench_bovw(images, repeat=args.repeat, standin=args.standin)
+    print("  bovw " + ", ".join(f"{k} p50 {bovw[k]['p50_ms']:.2f} ms" for k in ("features", "quantize", "classify", "total")))
+
+    first_start = time.perf_counter()
+    model.predict(np.zeros((1, input_size[1], input_size[0], 3), dtype=np.float32), verbose=0)
+    first_s = time.perf_counter() - first_start
+
+    inference = bench_inference(model, args.batch_sizes, iters=args.iters)
+    return {
+        "threads": args.threads_child or 0,
+        "model_source": source,
+        "img_size": list(input_size),
+        "input_source": "dir" if args.data_dir else "synthetic",
+        "cold_start": {"load_ms": load_s * 1000.0, "first_inference_ms": first_s * 1000.0},
+        "stages": stages,
+        "bovw": bovw,
+        "inference": inference,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run_child(args, threads):
+    """
+    Runs `run_single` in a fresh interpreter so the thread setting and cold start are real.
+    """
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+        out_path = tmp.name
+    cmd = [sys.executable, os.path.abspath(__file__), "--child-out", out_path,
+           "--threads-child", str(threads),
+           "--batch-sizes", ",".join(map(str, args.batch_sizes)),
+           "--images", str(args.images), "--iters", str(args.iters), "--repeat", str(args.repeat)]
+    if args.standin:
+        cmd.append("--standin")
+    if args.data_dir:
+        cmd += ["--data-dir", args.data_dir]
     try:
-        kmeans = joblib.load(CODEBOOK_PATH)
-        scaler = joblib.load(SCALER_PATH)
-        svm = joblib.load(SVM_PATH)
-    except FileNotFoundError:
-        print("Models not found. Run training/tuning first.")
-        return
-
-    print(f"Benchmarking on {num_samples} random images from {dataset_path}...")
-    
-    # Collect sample images
-    image_paths = []
-    for root, dirs, files in os.walk(dataset_path):
-        for file in files:
-            if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                image_paths.append(os.path.join(root, file))
-                
-    if not image_paths:
-        print("No images found.")
-        return
-        
-    np.random.shuffle(image_paths)
-    samples = image_paths[:num_samples]
-    
-    sift_times = []
-    quant_times = []
-    svm_times = []
-    
-    for path in samples:
-        img = load_image(path)
-        
-        # 1. SIFT Extraction
-        start = time.perf_counter()
-        descriptors = extract_sift_features(img)
-        end = time.perf_counter()
-        sift_duration = end - start
-        sift_times.append(sift_duration)
-        
-        if descriptors is None or len(descriptors) == 0:
+        subprocess.run(cmd, check=True)
+        with open(out_path, 'r') as f:
+            return json.load(f)
+    finally:
+        os.remove(out_path)
+
+def compare(current, baseline, label="baseline"):
+    """
+    Prints p50 deltas against a previous results dict.
+    """
+    base_runs = {r["threads"]: r for r in baseline.get("runs", [])}
+    print(f"\n--- Comparison with {label} ---")
+    for run in current["runs"]:
+        base = base_runs.get(run["threads"])
+        if not base:
             continue
-            
-        # 2. Quantization
-        # Convert for KMeans
-        des_float = descriptors.astype(np.float32)
-        start = time.perf_counter()
-        hist = build_histogram(des_float, kmeans)
-        end = time.perf_counter()
-        quant_duration = end - start
-        quant_times.append(quant_duration)
-        
-        # Normalization (fast, but part of loop)
-        hist_norm = normalize_histogram(hist).reshape(1, -1)
-        
-        # 3. SVM Inference
-        start = time.perf_counter()
-        hist_scaled = scaler.transform(hist_norm)
-        _ = svm.predict_proba(hist_scaled)
-        end = time.perf_counter()
-        svm_duration = end - start
-        svm_times.append(svm_duration)
-
-    avg_sift = np.mean(sift_times)
-    avg_quant = np.mean(quant_times)
-    avg_svm = np.mean(svm_times)
-    
-    print("\n--- Benchmark Results ---")
-    print(f"Average SIFT Extraction Time: {avg_sift*1000:.2f} ms")
-    print(f"Average Quantization Time:    {avg_quant*1000:.2f} ms")
-    print(f"Average SVM Inference Time:   {avg_svm*1000:.2f} ms")
-    print(f"Total Pipeline Latency:       {(avg_sift + avg_quant + avg_svm)*1000:.2f} ms")
-    
-    # Optimization Suggestion
-    if avg_sift > 1.0:
-        print("\n[WARNING] SIFT extraction is slow (> 1s).")
-        print("Suggestion: Limit keypoints using cv2.SIFT_create(nfeatures=500)")
-    else:
-        print("\n[OK] Performance is within acceptable limits.")
+        for stage in ("decode", "preprocess"):
+            old, new = base["stages"][stage]["p50_ms"], run["stages"][stage]["p50_ms"]
+            print(f"threads={run['threads']} {stage:<10} p50 {old:8.2f} -> {new:8.2f} ms ({(new - old) / old * 100:+.1f}%)")
+        for bs, entry in run["inference"].items():
+            if bs in base["inference"]:
+                old = base["inference"][bs]["predict"]["p50_ms"]
+                new = entry["predict"]["p50_ms"]
+                print(f"threads={run['threads']} batch {bs:<5} p50 {old:8.2f} -> {new:8.2f} ms ({(new - old) / old * 100:+.1f}%)")
+
+def save_results(results, output=None):
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    path = output or os.path.join(BENCHMARK_DIR, f"cnn_serving_{results['run_id']}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    with open(os.path.join(BENCHMARK_DIR, "latest.json"), 'w') as f:
+        json.dump(results, f, indent=2)
+    return path
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CNN serving benchmark suite")
+    parser.add_argument("--threads", type=parse_int_list, default=[0, 1, os.cpu_count() or 1],
+                        help="TF intra-op thread settings to sweep (0 = TF default)")
+    parser.add_argument("--batch-sizes", type=parse_int_list, default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--images", type=int, default=32, help="Number of test images")
+    parser.add_argument("--iters", type=int, default=10, help="Timed forward passes per batch size")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the images for decode/preprocess")
+    parser.add_argument("--data-dir", type=str, default=None, help="Use real images from this directory")
+    parser.add_argument("--standin", action="store_true", help="Use the tiny stand-in model even if a trained one exists")
+    parser.add_argument("--output", type=str, default=None, help="Results path (default: static/metrics/benchmarks/)")
+    parser.add_argument("--compare", type=str, default=None, help="Previous results file to compare against")
+    parser.add_argument("--variants", action="store_true", help="Benchmark the resolution variants instead")
+    parser.add_argument("--limit", type=int, default=None, help="--variants: at most N validation images")
+    # Internal: single-setting run in a child process
+    parser.add_argument("--child-out", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--threads-child", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child_out:
+        result = run_single(args)
+        with open(args.child_out, 'w') as f:
+            json.dump(result, f)
+        return result
+
+    if args.variants:
+        images = load_image_dir(args.data_dir, args.images) if args.data_dir else []
+        print("--- Resolution Variants ---")
+        table = bench_variants(images or make_synthetic_images(args.images), iters=args.iters * 2,
+                               standin=args.standin, data_dir=args.data_dir, limit=args.limit)
+        result = {"run_id": time.strftime("%Y%m%d-%H%M%S"), "variants": table, "standin": args.standin}
+        os.makedirs(BENCHMARK_DIR, exist_ok=True)
+        path = args.output or os.path.join(BENCHMARK_DIR, f"variants_{result['run_id']}.json")
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        # Stand-in numbers must not drive serving decisions
+        if table and not args.standin:
+            with open(VARIANT_TABLE_PATH, 'w') as f:
+                json.dump(result, f, indent=2)
+            print(f"Variant table written to {VARIANT_TABLE_PATH}")
+        print(f"Results saved to {path}")
+        return result
+
+    # Read the baseline before this run overwrites latest.json
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+    results = {
+        "run_id": time.strftime("%Y%m%d-%H%M%S"),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {"batch_sizes": args.batch_sizes, "images": args.images, "iters": args.iters},
+        "runs": [run_child(args, t) for t in dict.fromkeys(args.threads)],
+    }
+    # The served model's input size, as each child measured it
+    results["config"]["img_size"] = results["runs"][0]["img_size"] if results["runs"] else list(IMG_SIZE)
+    path = save_results(results, args.output)
+    print(f"\nBenchmark results saved to {path}")
+
+    if baseline:
+        compare(results, baseline, args.compare)
+    return results
 
 if __name__ == "__main__":
-    # Default path
-    default_path = 'data/raw/train/Car_Brand_Logos/Train'
-    run_benchmark(default_path)
+    main()
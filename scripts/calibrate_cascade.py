@@ -0,0 +1,147 @@
+"""
+scripts/calibrate_cascade.py
+
+Responsibility:
+    - Calibrates the small/full model cascade (see core/cascade.py).
+    - Runs both models over the validation split, picks the lowest confidence
+      threshold whose accuracy loss versus the full model stays within the target,
+      and writes it to CASCADE_CALIBRATION_PATH (read by ModelManager).
+    - Reports the average cost per request (measured single-image latencies
+      weighted by the escalation rate) against the full model alone.
+
+Usage:
+    python train/train_cnn.py --variant small
+    python scripts/calibrate_cascade.py --max-loss 0.01
+    OMNIVISION_CASCADE=1 uvicorn app.main:app
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import (MODEL_PATH, CLASS_INDICES_PATH, CASCADE_MODEL_PATH, CASCADE_CLASS_INDICES_PATH,
+                         CASCADE_CALIBRATION_PATH, METRICS_DIR, VALIDATION_SPLIT)
+from core.cascade import choose_threshold, expected_cost_ms, model_input_size, save_calibration, dataset_split
+from core.inference import forward
+
+LOSS_TABLE = [0.0, 0.005, 0.01, 0.02, 0.05]
+
+def validation_files(data_dir, label_to_idx, split=VALIDATION_SPLIT, limit=None):
+    """
+    (path, label index) pairs from the same split train_cnn.py validates on
+    (see core.cascade.dataset_split), optionally a fixed random sample of `limit`.
+    """
+    _, items = dataset_split(data_dir, label_to_idx, split)
+    if limit:
+        rng = np.random.default_rng(0)
+        keep = rng.permutation(len(items))[:limit]
+        items = [items[i] for i in sorted(keep)]
+    return items
+
+def predict_files(model, paths, batch_size=32):
+    """
+    Softmax outputs for image files, resized to the model's own input size.
+    """
+    size = model_input_size(model)
+    outputs = []
+    for i in range(0, len(paths), batch_size):
+        batch = np.stack([
+            np.asarray(Image.open(p).convert('RGB').resize(size), dtype=np.float32) / 255.0
+            for p in paths[i:i + batch_size]
+        ])
+        outputs.append(forward(model, batch))
+    return np.concatenate(outputs) if outputs else np.zeros((0, 0))
+
+def single_image_latency_ms(model, iters=30, warmup=3):
+    """
+    Median latency of one single-image forward pass (the cascade's serving call).
+    """
+    w, h = model_input_size(model)
+    x = np.random.default_rng(0).random((1, h, w, 3), dtype=np.float32)
+    for _ in range(warmup):
+        forward(model, x)
+    samples = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        forward(model, x)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(samples))
+
+def cost_report(small_probs, full_probs, labels, small_ms, full_ms, losses=LOSS_TABLE):
+    """
+    One row per target accuracy loss: threshold, escalation rate, accuracy and cost.
+    """
+    rows = []
+    for loss in losses:
+        cal = choose_threshold(small_probs, full_probs, labels, loss)
+        cost = expected_cost_ms(cal["accept_rate"], small_ms, full_ms)
+        rows.append(dict(cal, cost_ms=cost, speedup=full_ms / cost if cost else 0.0))
+    return rows
+
+def main(argv=None):
+    default_data = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'raw', 'cars')
+    parser = argparse.ArgumentParser(description="Calibrate the small/full model cascade")
+    parser.add_argument("--data_dir", type=str, default=default_data)
+    parser.add_argument("--max-loss", type=float, default=0.01, help="Allowed accuracy loss vs. the full model")
+    parser.add_argument("--limit", type=int, default=None, help="Use at most N validation images")
+    parser.add_argument("--full-model", type=str, default=str(MODEL_PATH))
+    parser.add_argument("--small-model", type=str, default=str(CASCADE_MODEL_PATH))
+    parser.add_argument("--output", type=str, default=str(CASCADE_CALIBRATION_PATH))
+    args = parser.parse_args(argv)
+
+    from core.dl_loader import load_trained_model
+    full_model, classes = load_trained_model(args.full_model, CLASS_INDICES_PATH)
+    small_model, small_classes = load_trained_model(args.small_model, CASCADE_CLASS_INDICES_PATH)
+    if full_model is None or small_model is None:
+        print("Both the full and the small model are required (train_cnn.py --variant small).")
+        return 1
+    if classes != small_classes:
+        print("Error: the small and full models were trained on different classes.")
+        return 1
+
+    label_to_idx = {label: int(idx) for idx, label in classes.items()}
+    items = validation_files(args.data_dir, label_to_idx, limit=args.limit)
+    if not items:
+        print(f"No validation images found in {args.data_dir}")
+        return 1
+    paths = [p for p, _ in items]
+    labels = np.array([label for _, label in items])
+
+    print(f"--- Cascade Calibration ({len(paths)} validation images) ---")
+    small_probs = predict_files(small_model, paths)
+    full_probs = predict_files(full_model, paths)
+    small_ms = single_image_latency_ms(small_model)
+    full_ms = single_image_latency_ms(full_model)
+    print(f"Single-image latency: small {small_ms:.2f} ms, full {full_ms:.2f} ms")
+
+    rows = cost_report(small_probs, full_probs, labels, small_ms, full_ms)
+    print(f"\n{'max loss':>8} {'threshold':>9} {'small %':>8} {'accuracy':>8} {'cost ms':>8} {'speedup':>7}")
+    for r in rows:
+        print(f"{r['max_accuracy_loss']:8.3f} {r['threshold']:9.3f} {r['accept_rate'] * 100:7.1f}% "
+              f"{r['cascade_accuracy']:8.3f} {r['cost_ms']:8.2f} {r['speedup']:6.2f}x")
+
+    calibration = choose_threshold(small_probs, full_probs, labels, args.max_loss)
+    calibration.update({
+        "small_ms": small_ms,
+        "full_ms": full_ms,
+        "cost_ms": expected_cost_ms(calibration["accept_rate"], small_ms, full_ms),
+        "calibrated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+    save_calibration(calibration, args.output)
+    print(f"\nThreshold {calibration['threshold']:.3f} saved to {args.output} "
+          f"(avg cost {calibration['cost_ms']:.2f} ms vs {full_ms:.2f} ms full-only).")
+
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    with open(os.path.join(METRICS_DIR, "cascade_report.json"), 'w') as f:
+        json.dump({"calibration": calibration, "table": rows}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
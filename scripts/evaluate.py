@@ -0,0 +1,271 @@
+"""
+scripts/evaluate.py
+
+Responsibility:
+    - Offline evaluation of the served CNN on a held-out split (by default the validation
+      split train_cnn.py holds out), producing the files the report and UI read:
+      static/confusion_matrix.json (scripts/generate_report.py) and
+      static/metrics/{domain}_metrics.json (aggregated into static/metrics_data.json).
+    - Streams the split: class directories are listed one at a time, a thread pool decodes
+      and resizes batches ahead of the model (bounded prefetch), and every batch runs as one
+      compiled forward pass. Memory does not grow with the number of images.
+    - Metrics are accumulated, not stored per image: the confusion matrix from
+      np.bincount over flattened (true, predicted) index pairs, flushed in large chunks;
+      calibration from per-bin confidence/correct sums. Per-class precision, recall and
+      F1 follow from the matrix, vectorized over all classes.
+
+Usage:
+    python scripts/evaluate.py --data-dir data/raw/cars
+    python scripts/evaluate.py --data-dir data/raw/cars --split all --batch-size 128 --workers 8
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import BASE_DIR, METRICS_DIR, MODEL_PATH, CLASS_INDICES_PATH
+from core.cascade import model_input_size
+from core.inference import forward
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+CONFUSION_MATRIX_PATH = BASE_DIR / "static" / "confusion_matrix.json"
+
+def iter_split(data_dir, label_to_idx, split=0.2, subset="validation"):
+    """
+    Yields (path, label index) class by class. "validation" is the first `split` of each
+    class's sorted files (the subset train_cnn.py validates on), "training" the rest,
+    "all" everything. Class directories the model has no label for are skipped.
+    """
+    for class_name in sorted(os.listdir(data_dir)):
+        class_dir = os.path.join(data_dir, class_name)
+        if class_name not in label_to_idx or not os.path.isdir(class_dir):
+            continue
+        files = sorted(f for f in os.listdir(class_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+        n_val = int(split * len(files))
+        if subset == "validation":
+            files = files[:n_val]
+        elif subset == "training":
+            files = files[n_val:]
+        idx = label_to_idx[class_name]
+        for f in files:
+            yield os.path.join(class_dir, f), idx
+
+def load_batch(items, size):
+    """
+    Decoded, resized and normalised images of a chunk (as /predict prepares them),
+    with their labels. Unreadable files are left out and counted.
+    """
+    images, labels = [], []
+    for path, label in items:
+        try:
+            with Image.open(path) as img:
+                images.append(np.asarray(img.convert('RGB').resize(size), dtype=np.float32) / 255.0)
+            labels.append(label)
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+    x = np.stack(images) if images else np.zeros((0, size[1], size[0], 3), np.float32)
+    return x, np.array(labels, dtype=np.int64), len(items) - len(images)
+
+def stream_batches(items, size, batch_size=64, workers=4, prefetch=4):
+    """
+    Yields (x, labels, skipped) in order while up to `prefetch` later batches decode
+    on `workers` threads.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < prefetch:
+                chunk = [item for _, item in zip(range(batch_size), items)]
+                if not chunk:
+                    break
+                pending.append(pool.submit(load_batch, chunk, size))
+            if not pending:
+                return
+            yield pending.popleft().result()
+
+class EvaluationAccumulator:
+    """
+    Streaming confusion counts and calibration statistics for `num_classes` classes.
+    (true, predicted) pairs are buffered as flat indices and counted with one bincount
+    per `flush_size` pairs, so per-batch cost doesn't include a num_classes^2 pass.
+    """
+
+    def __init__(self, num_classes, n_bins=15, flush_size=1 << 20):
+        self.num_classes = num_classes
+        self.n_bins = n_bins
+        self.flush_size = flush_size
+        self.counts = np.zeros(num_classes * num_classes, dtype=np.int64)
+        self._buffer = []
+        self._buffered = 0
+        self.bin_count = np.zeros(n_bins, dtype=np.int64)
+        self.bin_confidence = np.zeros(n_bins)
+        self.bin_correct = np.zeros(n_bins)
+        self.nll = 0.0
+        self.total = 0
+
+    def update(self, probs, labels):
+        probs = np.asarray(probs)
+        labels = np.asarray(labels, dtype=np.int64)
+        pred = probs.argmax(axis=1)
+        confidence = probs[np.arange(len(labels)), pred]
+        self._buffer.append(labels * self.num_classes + pred)
+        self._buffered += len(labels)
+        if self._buffered >= self.flush_size:
+            self._flush()
+
+        bins = np.minimum((confidence * self.n_bins).astype(np.int64), self.n_bins - 1)
+        self.bin_count += np.bincount(bins, minlength=self.n_bins)
+        self.bin_confidence += np.bincount(bins, weights=confidence, minlength=self.n_bins)
+        self.bin_correct += np.bincount(bins, weights=(pred == labels), minlength=self.n_bins)
+        self.nll -= float(np.log(np.clip(probs[np.arange(len(labels)), labels], 1e-12, 1.0)).sum())
+        self.total += len(labels)
+
+    def _flush(self):
+        if self._buffer:
+            self.counts += np.bincount(np.concatenate(self._buffer), minlength=self.counts.size)
+            self._buffer, self._buffered = [], 0
+
+    def confusion(self):
+        """
+        (num_classes, num_classes) counts; rows are true classes, columns predictions.
+        """
+        self._flush()
+        return self.counts.reshape(self.num_classes, self.num_classes)
+
+    def calibration(self):
+        """
+        Expected and maximum calibration error over equal-width confidence bins, and the
+        mean negative log-likelihood.
+        """
+        used = self.bin_count > 0
+        conf = np.divide(self.bin_confidence, self.bin_count, out=np.zeros(self.n_bins), where=used)
+        acc = np.divide(self.bin_correct, self.bin_count, out=np.zeros(self.n_bins), where=used)
+        gap = np.abs(acc - conf)
+        total = max(self.total, 1)
+        return {
+            "ece": float((self.bin_count / total * gap).sum()),
+            "mce": float(gap[used].max()) if used.any() else 0.0,
+            "nll": self.nll / total,
+            "bins": [{"lower": i / self.n_bins, "upper": (i + 1) / self.n_bins, "count": int(self.bin_count[i]),
+                      "confidence": float(conf[i]), "accuracy": float(acc[i])} for i in range(self.n_bins)],
+        }
+
+def classification_report(matrix, classes):
+    """
+    Per-class precision/recall/F1/support plus accuracy and macro/weighted averages,
+    in the layout of sklearn's classification_report(output_dict=True).
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    tp = np.diag(matrix)
+    support = matrix.sum(axis=1)
+    predicted = matrix.sum(axis=0)
+    precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+    recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros_like(tp), where=(precision + recall) > 0)
+    total = support.sum()
+
+    report = {name: {"precision": float(p), "recall": float(r), "f1-score": float(f), "support": float(s)}
+              for name, p, r, f, s in zip(classes, precision, recall, f1, support)}
+    report["accuracy"] = float(tp.sum() / total) if total else 0.0
+    weights = support / total if total else np.zeros_like(support)
+    report["macro avg"] = {"precision": float(precision.mean()), "recall": float(recall.mean()),
+                           "f1-score": float(f1.mean()), "support": float(total)}
+    report["weighted avg"] = {"precision": float(weights @ precision), "recall": float(weights @ recall),
+                              "f1-score": float(weights @ f1), "support": float(total)}
+    return report
+
+def evaluate(model, classes, items, batch_size=64, workers=4, prefetch=4, n_bins=15):
+    """
+    Streams `items` ((path, label index) pairs) through `model` and returns the results
+    dict written by `write_results`. `classes` maps index (str) -> label.
+    """
+    names = [classes[str(i)] for i in range(len(classes))]
+    acc = EvaluationAccumulator(len(names), n_bins)
+    size = model_input_size(model)
+    skipped = 0
+    start = time.perf_counter()
+    for x, labels, bad in stream_batches(items, size, batch_size, workers, prefetch):
+        skipped += bad
+        if len(labels):
+            acc.update(forward(model, x), labels)
+    elapsed = time.perf_counter() - start
+
+    matrix = acc.confusion()
+    report = classification_report(matrix, names)
+    return {
+        "classes": names,
+        "matrix": matrix.tolist(),
+        "accuracy": report["accuracy"],
+        "report": report,
+        "calibration": acc.calibration(),
+        "evaluation": {"images": acc.total, "skipped": skipped, "seconds": round(elapsed, 2),
+                       "images_per_sec": round(acc.total / elapsed, 1) if elapsed > 0 else None},
+    }
+
+def write_results(results, output=CONFUSION_MATRIX_PATH, metrics_dir=METRICS_DIR, domain=None):
+    """
+    Writes the report's confusion-matrix file and, with `domain`, the UI's per-domain
+    metrics file (then re-aggregates static/metrics_data.json).
+    """
+    os.makedirs(os.path.dirname(str(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f)
+    print(f"Confusion matrix saved to {output}")
+    if domain:
+        os.makedirs(metrics_dir, exist_ok=True)
+        path = os.path.join(str(metrics_dir), f"{domain}_metrics.json")
+        with open(path, 'w') as f:
+            json.dump(dict(results, domain=domain), f, indent=4)
+        print(f"Metrics saved to {path}")
+        from scripts.aggregate_metrics import aggregate
+        aggregate()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batched offline evaluation of the CNN")
+    parser.add_argument("--data-dir", type=str, default=os.path.join(BASE_DIR, 'data', 'raw', 'cars'))
+    parser.add_argument("--domain", type=str, default="cars", help="Metrics file to write ('' to skip)")
+    parser.add_argument("--split", choices=["validation", "training", "all"], default="validation")
+    parser.add_argument("--val-split", type=float, default=0.2)
+    parser.add_argument("--model", type=str, default=str(MODEL_PATH))
+    parser.add_argument("--classes", type=str, default=str(CLASS_INDICES_PATH))
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1), help="Decode threads")
+    parser.add_argument("--prefetch", type=int, default=4, help="Batches decoded ahead of the model")
+    parser.add_argument("--bins", type=int, default=15, help="Calibration bins")
+    parser.add_argument("--output", type=str, default=str(CONFUSION_MATRIX_PATH))
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.data_dir):
+        print(f"Error: Data directory '{args.data_dir}' does not exist.")
+        return None
+    from core.dl_loader import load_trained_model
+    model, classes = load_trained_model(args.model, args.classes)
+    if model is None:
+        print("Error: No trained model available.")
+        return None
+
+    label_to_idx = {label: int(idx) for idx, label in classes.items()}
+    items = iter_split(args.data_dir, label_to_idx, args.val_split, args.split)
+    print(f"Evaluating {args.split} split of {args.data_dir} ({len(classes)} classes)...")
+    results = evaluate(model, classes, items, args.batch_size, args.workers, args.prefetch, args.bins)
+    results["evaluation"].update(split=args.split, data_dir=args.data_dir, model=args.model)
+
+    ev, cal = results["evaluation"], results["calibration"]
+    print(f"{ev['images']} images ({ev['skipped']} skipped) in {ev['seconds']} s, {ev['images_per_sec']} img/s")
+    print(f"Accuracy {results['accuracy']:.4f} | macro F1 {results['report']['macro avg']['f1-score']:.4f} | "
+          f"ECE {cal['ece']:.4f}")
+    write_results(results, args.output, domain=args.domain or None)
+    return results
+
+if __name__ == "__main__":
+    main()
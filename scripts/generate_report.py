@@ -5,6 +5,8 @@ Responsibility:
     - Analyzes training results.
     - Generates a Markdown report `metrics/REPORT_Car_Brand_Logos.md`.
     - Identifies top confused class pairs.
+    - Includes per-class precision/recall/F1 and calibration when the confusion matrix
+      comes from scripts/evaluate.py.
 """
 
 import json
@@ -17,6 +19,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.config import BASE_DIR
 
+MAX_MATRIX_CLASSES = 30  # larger matrices stay in the JSON only
+
 def generate_report(domain_name="Car_Brand_Logos"):
     print(f"Generating report for {domain_name}...")
     
@@ -46,30 +50,35 @@ def generate_report(domain_name="Car_Brand_Logos"):
     matrix = np.array(cm_data['matrix'])
     accuracy = cm_data['accuracy']
     
-    # Calculate Top 3 Confused Pairs
-    confusions = []
-    num_classes = len(classes)
-    for i in range(num_classes):
-        for j in range(num_classes):
-            if i != j:
-                count = matrix[i][j]
-                if count > 0:
-                    confusions.append((classes[i], classes[j], count))
-                    
-    # Sort by count descending
-    confusions.sort(key=lambda x: x[2], reverse=True)
-    top_3_confused = confusions[:3]
-    
+    # Calculate Top 3 Confused Pairs (vectorized: the matrix may cover thousands of classes)
+    off_diagonal = matrix.copy()
+    np.fill_diagonal(off_diagonal, 0)
+    flat = off_diagonal.ravel()
+    top = np.argsort(flat)[::-1][:3]
+    top_3_confused = [(classes[i // len(classes)], classes[i % len(classes)], int(flat[i])) for i in top if flat[i] > 0]
+
     # Generate Markdown
     md_content = f"""# Model Training Report: {domain_name}
 
 **Status**: Training Completed
 **Accuracy**: {accuracy * 100:.2f}%
-**Best Vocabulary Size (k)**: {hyperparams.get('best_k', 'N/A')}
 
 ## Hyperparameter Tuning
 """
-    if 'all_results' in hyperparams:
+    if 'best' in hyperparams:
+        # CNN search (scripts/tune_hyperparams.py)
+        best_acc = hyperparams.get('best_accuracy', {})
+        md_content += "| Hyperparameter | Best Value |\n|---|---|\n"
+        for name, value in hyperparams['best'].items():
+            md_content += f"| {name} | {value} |\n"
+        for stage in ('head', 'fine_tune'):
+            if best_acc.get(stage) is not None:
+                md_content += f"\n**Validation accuracy ({stage.replace('_', '-')})**: {best_acc[stage] * 100:.2f}%"
+        search = hyperparams.get('search', {})
+        md_content += (f"\n\n{len(hyperparams.get('trials', []))} trials, {search.get('scheduler', 'asha').upper()} "
+                       f"with eta={search.get('eta')}, {search.get('workers')} workers, {search.get('seconds')} s.\n")
+    elif 'all_results' in hyperparams:
+        md_content += f"**Best Vocabulary Size (k)**: {hyperparams.get('best_k', 'N/A')}\n\n"
         md_content += "| k (Vocab Size) | Accuracy |\n|---|---|\n"
         for k, acc in hyperparams['all_results'].items():
             md_content += f"| {k} | {acc * 100:.2f}% |\n"
@@ -88,15 +97,32 @@ The model most frequently confuses:
     else:
         md_content += "- None (Perfect Classification)\n"
         
-    md_content += "\n### Full Confusion Matrix\n"
-    # Create an ASCII table for the matrix
-    # Header
-    md_content += "| Actual \ Predicted | " + " | ".join(classes) + " |\n"
-    md_content += "|---|" + "|".join(["---"] * len(classes)) + "|\n"
-    
-    for i, row in enumerate(matrix):
-        row_str = " | ".join(map(str, row))
-        md_content += f"| **{classes[i]}** | {row_str} |\n"
+    # Written by scripts/evaluate.py
+    if 'report' in cm_data:
+        report = cm_data['report']
+        md_content += "\n## Per-Class Metrics\n| Class | Precision | Recall | F1 | Support |\n|---|---|---|---|---|\n"
+        for name in classes + ['macro avg', 'weighted avg']:
+            r = report.get(name)
+            if r:
+                md_content += (f"| {name} | {r['precision']:.3f} | {r['recall']:.3f} | {r['f1-score']:.3f} | "
+                               f"{int(r['support'])} |\n")
+    if 'calibration' in cm_data:
+        cal = cm_data['calibration']
+        md_content += (f"\n## Calibration\n**ECE**: {cal['ece']:.4f} | **MCE**: {cal['mce']:.4f} | "
+                       f"**NLL**: {cal['nll']:.4f}\n")
+
+    if len(classes) > MAX_MATRIX_CLASSES:
+        md_content += f"\n### Full Confusion Matrix\nOmitted ({len(classes)} classes); see `static/confusion_matrix.json`.\n"
+    else:
+        md_content += "\n### Full Confusion Matrix\n"
+        # Create an ASCII table for the matrix
+        # Header
+        md_content += "| Actual \ Predicted | " + " | ".join(classes) + " |\n"
+        md_content += "|---|" + "|".join(["---"] * len(classes)) + "|\n"
+
+        for i, row in enumerate(matrix):
+            row_str = " | ".join(map(str, row))
+            md_content += f"| **{classes[i]}** | {row_str} |\n"
         
     # Save Report
     report_path = os.path.join(metrics_dir, f'REPORT_{domain_name}.md')
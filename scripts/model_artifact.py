@@ -0,0 +1,208 @@
+"""
+scripts/model_artifact.py
+
+Responsibility:
+    - Exports the served `.h5` model as the memory-mapped serving artifact (see core/artifact.py).
+    - Benchmarks cold-start load time of both formats, each load in a fresh interpreter
+      (the situation of a starting uvicorn worker), and writes the comparison to
+      static/metrics/artifact_load.json.
+
+Usage:
+    python scripts/model_artifact.py export
+    python scripts/model_artifact.py bench --runs 5
+    python scripts/model_artifact.py bench --standin     # no trained model needed
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+import numpy as np
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import MODEL_PATH, CLASS_INDICES_PATH, MODEL_ARTIFACT_PATH, METRICS_DIR, IMG_SIZE
+
+REPORT_PATH = METRICS_DIR / "artifact_load.json"
+
+def export(model_path=MODEL_PATH, classes_path=CLASS_INDICES_PATH, output_dir=MODEL_ARTIFACT_PATH):
+    """
+    Loads the `.h5` and writes it as an artifact stamped with the source file. Returns the manifest.
+    """
+    from core.dl_loader import load_trained_model
+    from core.artifact import export_artifact
+
+    model, classes = load_trained_model(model_path, classes_path)
+    if model is None:
+        raise FileNotFoundError(f"Model not available at {model_path}")
+    manifest = export_artifact(model, classes, output_dir, source_path=model_path)
+    size_mb = manifest["weights"]["size"] / (1024 * 1024)
+    print(f"Exported {len(manifest['tensors'])} tensors ({size_mb:.1f} MB) to {output_dir}")
+    return manifest
+
+def build_standin(workdir):
+    """
+    Untrained full-size serving architecture saved as .h5 + artifact, for machines without a model.
+    """
+    from train.train_cnn import build_model
+    from core.artifact import export_artifact
+
+    classes = {str(i): f"class_{i}" for i in range(9)}
+    model, _ = build_model(len(classes), IMG_SIZE, weights=None)
+    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+    h5_path = os.path.join(workdir, "standin.h5")
+    classes_path = os.path.join(workdir, "standin_classes.json")
+    model.save(h5_path)
+    with open(classes_path, 'w') as f:
+        json.dump(classes, f)
+    export_artifact(model, classes, os.path.join(workdir, "standin.omni"), source_path=h5_path)
+    return h5_path, classes_path, os.path.join(workdir, "standin.omni")
+
+def rss_mb():
+    """
+    Current resident set size in MB (Linux), or None.
+    """
+    try:
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def load_once(path, classes_path, verify=False):
+    """
+    Child side: times one load (TF import excluded) and the first inference.
+    """
+    import tensorflow as tf  # noqa: F401  (imported before the timer starts)
+    from core.artifact import is_artifact, load_artifact
+
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    if is_artifact(path):
+        model, classes = load_artifact(path, verify=verify)
+    else:
+        model = tf.keras.models.load_model(path)
+        with open(classes_path, 'r') as f:
+            classes = json.load(f)
+    load_s = time.perf_counter() - start
+
+    x = np.zeros((1,) + tuple(model.input_shape[1:]), dtype=np.float32)
+    start = time.perf_counter()
+    model.predict(x, verbose=0)
+    first_s = time.perf_counter() - start
+    rss_after = rss_mb()
+    return {
+        "load_ms": load_s * 1000.0,
+        "first_inference_ms": first_s * 1000.0,
+        "classes": len(classes),
+        "load_rss_mb": (rss_after - rss_before) if rss_before is not None and rss_after is not None else None,
+    }
+
+def run_child(path, classes_path, verify=False):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+        out_path = tmp.name
+    cmd = [sys.executable, os.path.abspath(__file__), "bench", "--child-out", out_path,
+           "--child-path", str(path), "--classes", str(classes_path)]
+    if verify:
+        cmd.append("--verify")
+    try:
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+        with open(out_path, 'r') as f:
+            return json.load(f)
+    finally:
+        os.remove(out_path)
+
+def summarize_runs(runs):
+    out = {"runs": len(runs)}
+    for key in ("load_ms", "first_inference_ms", "load_rss_mb"):
+        values = [r[key] for r in runs if r.get(key) is not None]
+        if values:
+            out[f"{key}_median"] = float(np.median(values))
+            out[f"{key}_min"] = float(np.min(values))
+    return out
+
+def bench(h5_path, classes_path, artifact_path, runs=5, verify=False):
+    """
+    Alternates fresh-process loads of both formats `runs` times and summarizes them.
+    """
+    results = {"h5": [], "artifact": []}
+    for i in range(runs):
+        results["h5"].append(run_child(h5_path, classes_path))
+        results["artifact"].append(run_child(artifact_path, classes_path, verify=verify))
+        print(f"  run {i + 1}/{runs}: h5 {results['h5'][-1]['load_ms']:.0f} ms, "
+              f"artifact {results['artifact'][-1]['load_ms']:.0f} ms")
+    summary = {fmt: summarize_runs(r) for fmt, r in results.items()}
+    summary["speedup"] = summary["h5"]["load_ms_median"] / summary["artifact"]["load_ms_median"]
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memory-mapped model artifact: export and load benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_export = sub.add_parser("export", help="Write the served .h5 as an artifact")
+    p_export.add_argument("--model", type=str, default=str(MODEL_PATH))
+    p_export.add_argument("--classes", type=str, default=str(CLASS_INDICES_PATH))
+    p_export.add_argument("--output", type=str, default=str(MODEL_ARTIFACT_PATH))
+
+    p_bench = sub.add_parser("bench", help="Cold-start load time: .h5 vs artifact")
+    p_bench.add_argument("--runs", type=int, default=5, help="Fresh-process loads per format")
+    p_bench.add_argument("--model", type=str, default=str(MODEL_PATH))
+    p_bench.add_argument("--classes", type=str, default=str(CLASS_INDICES_PATH))
+    p_bench.add_argument("--artifact", type=str, default=str(MODEL_ARTIFACT_PATH))
+    p_bench.add_argument("--standin", action="store_true", help="Benchmark an untrained stand-in model")
+    p_bench.add_argument("--verify", action="store_true", help="Include the artifact's full checksum in its load time")
+    p_bench.add_argument("--output", type=str, default=str(REPORT_PATH))
+    # Internal: single load in a child process
+    p_bench.add_argument("--child-out", type=str, default=None, help=argparse.SUPPRESS)
+    p_bench.add_argument("--child-path", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export(args.model, args.classes, args.output)
+        return 0
+
+    if args.child_out:
+        result = load_once(args.child_path, args.classes, verify=args.verify)
+        with open(args.child_out, 'w') as f:
+            json.dump(result, f)
+        return 0
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.standin:
+            h5_path, classes_path, artifact_path = build_standin(workdir)
+        else:
+            h5_path, classes_path, artifact_path = args.model, args.classes, args.artifact
+            if not os.path.exists(artifact_path):
+                export(h5_path, classes_path, artifact_path)
+
+        print(f"--- Model load benchmark ({args.runs} fresh processes per format) ---")
+        summary = bench(h5_path, classes_path, artifact_path, runs=args.runs, verify=args.verify)
+        summary.update({
+            "run_id": time.strftime("%Y%m%d-%H%M%S"),
+            "standin": args.standin,
+            "verify": args.verify,
+            "h5_size_mb": os.path.getsize(h5_path) / (1024 * 1024),
+            "weights_size_mb": os.path.getsize(os.path.join(artifact_path, "weights.bin")) / (1024 * 1024),
+        })
+
+    print(f"\n{'format':<9} {'load ms':>9} {'first inf ms':>12} {'load RSS MB':>11}")
+    for fmt in ("h5", "artifact"):
+        s = summary[fmt]
+        rss = f"{s['load_rss_mb_median']:.1f}" if "load_rss_mb_median" in s else "n/a"
+        print(f"{fmt:<9} {s['load_ms_median']:9.1f} {s['first_inference_ms_median']:12.1f} {rss:>11}")
+    print(f"Artifact loads {summary['speedup']:.2f}x faster (median).")
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"Report saved to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+"""
+scripts/perf_gate.py
+
+Responsibility:
+    - Performance regression gate for the hot paths: preprocess_image, ModelManager
+      model load, single/batch inference on a tiny deterministic model, the refinery
+      hashing pass and augmentation manifest scans.
+    - Each stage is measured as several repeats of an inner loop; the gate compares
+      the median against a committed baseline with a noise-aware tolerance
+      (relative slack AND a multiple of the median absolute deviation).
+    - Hardware-independent: every run also times a fixed single-core reference workload,
+      and baseline timings are rescaled by (current reference / baseline reference)
+      before comparing, so a baseline recorded on one machine gates runs on another.
+    - Self-contained: synthetic images, a stand-in model and a temporary dataset.
+
+Usage:
+    python scripts/perf_gate.py                    # check against tests/perf_baseline.json
+    python scripts/perf_gate.py --update-baseline  # re-record the baseline on this machine
+    python scripts/perf_gate.py --stages preprocess_image,inference_batch
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import shutil
+import argparse
+import platform
+import tempfile
+from unittest import mock
+import numpy as np
+import cv2
+
+# Add project root to sys.path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_ROOT)
+
+BASELINE_PATH = os.path.join(PROJECT_ROOT, "tests", "perf_baseline.json")
+
+# Gate defaults: a stage regresses only if its median moved by more than
+# REL_TOLERANCE of the baseline AND by more than MAD_FACTOR scaled MADs.
+REL_TOLERANCE = 0.25
+MAD_FACTOR = 4.0
+# MAD -> standard deviation for normally distributed noise
+MAD_SCALE = 1.4826
+
+BATCH_SIZE = 16
+STANDIN_INPUT = (96, 96)
+
+# Machine-speed yardstick measured with every run; not gated itself
+REFERENCE_STAGE = "reference"
+_REFERENCE_DATA = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+
+def reference_workload():
+    """
+    Fixed single-threaded CPU work of the kinds the stages do: interpreter loop,
+    hashing and an image resize.
+    """
+    total = 0
+    for i in range(20000):
+        total += i * i
+    hashlib.sha256(_REFERENCE_DATA.tobytes()).digest()
+    cv2.resize(_REFERENCE_DATA, (224, 224), interpolation=cv2.INTER_AREA)
+    return total
+
+def median_mad(samples):
+    arr = np.asarray(samples, dtype=np.float64)
+    median = float(np.median(arr))
+    return median, float(np.median(np.abs(arr - median)))
+
+def measure(fn, repeats=7, inner=5, warmup=1):
+    """
+    Runs `fn` `warmup` times, then `repeats` x `inner` times.
+    Returns {"median_ms", "mad_ms", "samples_ms"} over the per-call mean of each repeat.
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(inner):
+            fn()
+        samples.append((time.perf_counter() - start) / inner * 1000.0)
+    median, mad = median_mad(samples)
+    return {"median_ms": median, "mad_ms": mad, "samples_ms": [round(s, 4) for s in samples]}
+
+class PerfWorkspace:
+    """
+    Temporary inputs shared by the stages: encoded images, a saved stand-in
+    model with class indices, and a small dataset with an augmentation manifest.
+    """
+
+    def __init__(self, n_images=16, n_files=24):
+        from scripts.benchmark import make_synthetic_images, build_standin_model
+        from core.augmentation import build_class_recipes, write_manifest
+
+        self.root = tempfile.mkdtemp(prefix="perf_gate_")
+        self.images = make_synthetic_images(n_images, size=(320, 240))
+
+        self.model = build_standin_model(num_classes=4, input_size=STANDIN_INPUT)
+        self.model_path = os.path.join(self.root, "model.h5")
+        self.classes_path = os.path.join(self.root, "class_indices.json")
+        self.model.save(self.model_path)
+        with open(self.classes_path, 'w') as f:
+            json.dump({str(i): f"class_{i}" for i in range(4)}, f)
+
+        rng = np.random.default_rng(0)
+        self.dataset = os.path.join(self.root, "dataset")
+        self.class_dir = os.path.join(self.dataset, "class_a")
+        os.makedirs(self.class_dir)
+        for i in range(n_files):
+            img = rng.integers(0, 255, (128, 128, 3), dtype=np.uint8)
+            cv2.imwrite(os.path.join(self.class_dir, f"img_{i:03d}.png"), img)
+        files = sorted(os.listdir(self.class_dir))
+        write_manifest(self.dataset, {"class_a": build_class_recipes(self.class_dir, files, 100, seed=0)})
+
+        self.single = rng.random((1,) + STANDIN_INPUT + (3,), dtype=np.float32)
+        self.batch = rng.random((BATCH_SIZE,) + STANDIN_INPUT + (3,), dtype=np.float32)
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+def build_stages(ws):
+    """
+    Returns {stage name: (callable, inner loop count)}.
+    """
+    from app.routes import preprocess_image
+    from app.services.model_manager import ModelManager
+    from scripts.refinery import compute_phash
+    from core.augmentation import load_manifest
+
+    def preprocess():
+        for b in ws.images:
+            preprocess_image(b)
+
+    def model_load():
+        manager = ModelManager()
+        manager._model = None
+        manager.get_model()
+
+    def refinery_hash():
+        for name in os.listdir(ws.class_dir):
+            compute_phash(os.path.join(ws.class_dir, name))
+
+    return {
+        REFERENCE_STAGE: (reference_workload, 5),
+        "preprocess_image": (preprocess, 3),
+        "model_load": (model_load, 1),
+        "inference_single": (lambda: ws.model.predict(ws.single, verbose=0), 5),
+        "inference_batch": (lambda: ws.model.predict(ws.batch, verbose=0), 5),
+        "refinery_hash": (refinery_hash, 3),
+        "manifest_scan": (lambda: load_manifest(ws.dataset, verify=True), 5),
+    }
+
+def run_gate_stages(stages=None, repeats=7):
+    """
+    Measures the selected stages and returns {stage: stats}. The ModelManager
+    singleton is pointed at the workspace model and restored afterwards.
+    """
+    from app.services.model_manager import ModelManager
+    ws = PerfWorkspace()
+    manager = ModelManager()
+    saved = (manager._model, manager._classes, manager._version)
+    results = {}
+    try:
+        with mock.patch("core.dl_loader.MODEL_PATH", ws.model_path), \
+             mock.patch("core.dl_loader.CLASS_INDICES_PATH", ws.classes_path), \
+             mock.patch("app.services.model_manager.MODEL_PATH", ws.model_path):
+            for name, (fn, inner) in build_stages(ws).items():
+                if stages and name not in stages and name != REFERENCE_STAGE:
+                    continue
+                results[name] = measure(fn, repeats=repeats, inner=inner)
+                print(f"  {name:<18} median {results[name]['median_ms']:9.3f} ms  MAD {results[name]['mad_ms']:7.3f} ms")
+    finally:
+        manager._model, manager._classes, manager._version = saved
+        ws.cleanup()
+    return results
+
+def host_info():
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def machine_scale(current, baseline):
+    """
+    How much slower this machine is than the baseline's (current / baseline reference
+    median); 1.0 when either run lacks the reference stage.
+    """
+    cur, base = current.get(REFERENCE_STAGE), baseline.get(REFERENCE_STAGE)
+    if not cur or not base or not base["median_ms"]:
+        return 1.0
+    return cur["median_ms"] / base["median_ms"]
+
+def compare_to_baseline(current, baseline, rel_tolerance=REL_TOLERANCE, mad_factor=MAD_FACTOR):
+    """
+    Returns a list of per-stage verdicts:
+    {"stage", "baseline_ms", "current_ms", "delta_pct", "threshold_ms", "regressed"}.
+    Baseline timings are first rescaled to this machine (`machine_scale`); "baseline_ms"
+    is the rescaled median. A stage regresses when its median exceeds that by more than
+    both the relative tolerance and `mad_factor` scaled MADs (the larger of the two runs'
+    MAD). Stages missing from either side, and the reference stage, are skipped.
+    """
+    scale = machine_scale(current, baseline)
+    verdicts = []
+    for stage, cur in current.items():
+        base = baseline.get(stage)
+        if not base or stage == REFERENCE_STAGE:
+            continue
+        base_median = base["median_ms"] * scale
+        noise = MAD_SCALE * max(base["mad_ms"] * scale, cur["mad_ms"])
+        allowed = max(rel_tolerance * base_median, mad_factor * noise)
+        threshold = base_median + allowed
+        delta = cur["median_ms"] - base_median
+        verdicts.append({
+            "stage": stage,
+            "baseline_ms": base_median,
+            "current_ms": cur["median_ms"],
+            "delta_pct": delta / base_median * 100 if base_median else 0.0,
+            "threshold_ms": threshold,
+            "regressed": cur["median_ms"] > threshold,
+        })
+    return verdicts
+
+def format_verdicts(verdicts):
+    lines = [f"{'stage':<18} {'baseline':>10} {'current':>10} {'delta':>8} {'limit':>10}"]
+    for v in verdicts:
+        mark = "REGRESSED" if v["regressed"] else "ok"
+        lines.append(f"{v['stage']:<18} {v['baseline_ms']:8.3f}ms {v['current_ms']:8.3f}ms "
+                     f"{v['delta_pct']:+7.1f}% {v['threshold_ms']:8.3f}ms  {mark}")
+    return "\n".join(lines)
+
+def run_gate(baseline_stages, stages=None, repeats=7, retries=1, rel_tolerance=REL_TOLERANCE, mad_factor=MAD_FACTOR):
+    """
+    Measures the stages and compares them to the baseline. Stages that regress are
+    measured again (with the reference) up to `retries` times and only count as
+    regressed if every attempt does. Returns (first measurement, verdicts).
+    """
+    current = run_gate_stages(stages, repeats=repeats)
+    print(f"Machine speed vs. baseline host: {machine_scale(current, baseline_stages):.2f}x reference time")
+    verdicts = compare_to_baseline(current, baseline_stages, rel_tolerance, mad_factor)
+    for _ in range(retries):
+        regressed = {v["stage"] for v in verdicts if v["regressed"]}
+        if not regressed:
+            break
+        print(f"Re-measuring {', '.join(sorted(regressed))}...")
+        again = {v["stage"]: v for v in compare_to_baseline(run_gate_stages(regressed, repeats=repeats),
+                                                             baseline_stages, rel_tolerance, mad_factor)}
+        verdicts = [again.get(v["stage"], v) if v["regressed"] else v for v in verdicts]
+    return current, verdicts
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_baseline(results, path=BASELINE_PATH):
+    data = {"recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "host": host_info(), "stages": results}
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Performance regression gate")
+    parser.add_argument("--baseline", type=str, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Record the current run as the baseline")
+    parser.add_argument("--stages", type=str, default=None, help="Comma-separated subset of stages")
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--tolerance", type=float, default=REL_TOLERANCE, help="Relative slack (0.25 = 25%%)")
+    parser.add_argument("--mad-factor", type=float, default=MAD_FACTOR)
+    parser.add_argument("--retries", type=int, default=1, help="Re-measurements before a regression counts")
+    args = parser.parse_args(argv)
+
+    stages = set(args.stages.split(",")) if args.stages else None
+    print("--- Performance Gate ---")
+    if args.update_baseline:
+        current = run_gate_stages(stages, repeats=args.repeats)
+        print(f"Baseline written to {save_baseline(current, args.baseline)}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --update-baseline first.")
+        return 1
+
+    _, verdicts = run_gate(baseline["stages"], stages, args.repeats, args.retries, args.tolerance, args.mad_factor)
+    print("\n" + format_verdicts(verdicts))
+    regressed = [v["stage"] for v in verdicts if v["regressed"]]
+    if regressed:
+        print(f"\nRegressed stages: {', '.join(regressed)}")
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
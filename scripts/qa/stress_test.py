@@ -1,116 +1,255 @@
-import sys
+"""
+scripts/qa/stress_test.py
+
+Responsibility:
+    - Offline HTTP load generator for /predict (no external downloads).
+    - Targets: the FastAPI app in-process (ASGI), a local uvicorn it starts, or an existing URL.
+    - Traffic: closed-loop (N concurrent clients back-to-back) or open-loop (fixed arrival
+      rate; latency is measured from the scheduled send time, so queueing is not hidden).
+    - Reports throughput, p50/p95/p99/p99.9 latency and error rate per level and finds
+      the saturation point automatically.
+
+Usage:
+    python scripts/qa/stress_test.py --standin
+    python scripts/qa/stress_test.py --pattern open --levels 5,10,20,40 --duration 15
+    python scripts/qa/stress_test.py --target uvicorn --levels 1,2,4,8,16
+"""
+
 import os
-import cv2
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
 import numpy as np
-import joblib
-import requests
 
 # Add project root
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(PROJECT_ROOT)
 
-from core.vision_logic import predict_pipeline
-from core.image_utils import read_image_file
-from core.config import CODEBOOK_PATH, SCALER_PATH, SVM_PATH, CLASS_LABELS
-
-def add_noise(image):
-    """Adds Salt and Pepper noise."""
-    row, col = image.shape
-    s_vs_p = 0.5
-    amount = 0.05
-    out = np.copy(image)
-    
-    # Salt mode
-    num_salt = np.ceil(amount * image.size * s_vs_p)
-    coords = [np.random.randint(0, i - 1, int(num_salt)) for i in image.shape]
-    out[tuple(coords)] = 255
-
-    # Pepper mode
-    num_pepper = np.ceil(amount * image.size * (1. - s_vs_p))
-    coords = [np.random.randint(0, i - 1, int(num_pepper)) for i in image.shape]
-    out[tuple(coords)] = 0
-    return out
-
-def rotate_image(image, angle):
-    """Rotates an image 90 degrees."""
-    if angle == 90:
-        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
-    elif angle == 180:
-        return cv2.rotate(image, cv2.ROTATE_180)
-    elif angle == 270:
-        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
-    return image
-
-def run_stress_test():
-    print("--- QA Adversarial Stress Test ---")
-    
-    # 1. Load Models
-    if not os.path.exists(CODEBOOK_PATH):
-        print("!!! Models not found. Please train the model first.")
-        return
-
-    print("Loading models...")
-    kmeans = joblib.load(CODEBOOK_PATH)
-    scaler = joblib.load(SCALER_PATH)
-    svm = joblib.load(SVM_PATH)
-    
-    # 2. Get Golden Sample (BMW)
-    img_url = "https://upload.wikimedia.org/wikipedia/commons/thumb/4/44/BMW.svg/2048px-BMW.svg.png"
-    print("Downloading 'Golden Sample' (BMW)...")
+from core.config import METRICS_DIR
+
+async def _send(client, image, path):
+    start = time.perf_counter()
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        resp = requests.get(img_url, headers=headers, stream=True)
-        resp.raise_for_status()
-        img_array = np.asarray(bytearray(resp.content), dtype=np.uint8)
-        # Decode and resize/grayscale using our core util
-        # read_image_file expects bytes, but we can just use cv2.imdecode directly here
-        # Actually core/image_utils.read_image_file calls standard cv2 logic logic.
-        # Let's verify what read_image_file expects. It expects `file` object usually from FastAPI UploadFile.
-        # We'll just replicate the loading:
-        image = cv2.imdecode(img_array, cv2.IMREAD_GRAYSCALE)
-        image = cv2.resize(image, (256, 256))
+        response = await client.post(path, files={"file": ("load.jpg", image, "image/jpeg")})
+        status = str(response.status_code)
     except Exception as e:
-        print(f"Failed to download sample: {e}")
-        return
-
-    # Check "background" class index if it exists in current model
-    # Note: CLASS_LABELS in config might not match the trained model if we patched it.
-    # We should trust the prediction index.
-    # Let's assume BMW is in the list.
-    target_label = "bmw" # lowercase in config
-    if target_label not in CLASS_LABELS:
-        print(f"Warning: {target_label} not in config CLASS_LABELS. Might be hard to map.")
-
-    # 3. Baseline Prediction
-    idx, conf = predict_pipeline(image, kmeans, scaler, svm)
-    
-    # We need to map index to label. The trained SVM might have different classes than config
-    # if we used the patch.
-    # But usually classes are sorted alphabetically.
-    # Let's print the raw index and confidence for now.
-    print(f"Baseline Prediction: Index {idx} | Conf: {conf:.2f}")
-
-    # 4. Noise Test
-    print("\n[Test 1] Noise Injection (Salt & Pepper)...")
-    noisy_img = add_noise(image)
-    idx_noise, conf_noise = predict_pipeline(noisy_img, kmeans, scaler, svm)
-    print(f"Noisy Prediction: Index {idx_noise} | Conf: {conf_noise:.2f}")
-    
-    if idx == idx_noise:
-        print(">>> PASSED: Prediction Stable")
-    else:
-        print("!!! FAILED: Prediction Flipped!")
+        status = type(e).__name__
+    return time.perf_counter() - start, status
+
+def summarize_level(level, latencies, statuses, elapsed, offered=None):
+    """
+    Throughput, latency percentiles (ms) and error rate for one load level.
+    """
+    lat = np.asarray(latencies, dtype=np.float64) * 1000.0
+    ok = sum(1 for s in statuses if s == "200")
+    total = len(statuses)
+    errors = {}
+    for s in statuses:
+        if s != "200":
+            errors[s] = errors.get(s, 0) + 1
+    result = {
+        "level": level,
+        "requests": total,
+        "throughput_rps": ok / elapsed if elapsed > 0 else 0.0,
+        "error_rate": (total - ok) / total if total else 0.0,
+        "errors": errors,
+    }
+    if offered is not None:
+        result["offered_rps"] = offered
+    if lat.size:
+        for name, q in (("p50_ms", 50), ("p95_ms", 95), ("p99_ms", 99), ("p999_ms", 99.9)):
+            result[name] = float(np.percentile(lat, q))
+        result["mean_ms"] = float(lat.mean())
+    return result
+
+async def closed_loop(client, images, concurrency, duration, path="/predict"):
+    """
+    `concurrency` clients, each sending its next request as soon as the previous returns.
+    """
+    latencies, statuses = [], []
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(i):
+        k = i
+        while time.perf_counter() < deadline:
+            latency, status = await _send(client, images[k % len(images)], path)
+            latencies.append(latency)
+            statuses.append(status)
+            k += concurrency
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(i) for i in range(concurrency)))
+    return summarize_level(concurrency, latencies, statuses, time.perf_counter() - start)
+
+async def open_loop(client, images, rate, duration, path="/predict"):
+    """
+    Requests arrive at a fixed `rate` per second regardless of completions.
+    Latency includes any time a request waited past its scheduled start.
+    """
+    latencies, statuses = [], []
+
+    async def timed(scheduled, image):
+        _, status = await _send(client, image, path)
+        latencies.append(time.perf_counter() - scheduled)
+        statuses.append(status)
+
+    tasks = []
+    start = time.perf_counter()
+    for i in range(max(1, int(rate * duration))):
+        scheduled = start + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(timed(scheduled, images[i % len(images)])))
+    await asyncio.gather(*tasks)
+    return summarize_level(rate, latencies, statuses, time.perf_counter() - start, offered=rate)
 
-    # 5. Rotation Test
-    print("\n[Test 2] Rotation Invariance (90 deg)...")
-    rot_img = rotate_image(image, 90)
-    idx_rot, conf_rot = predict_pipeline(rot_img, kmeans, scaler, svm)
-    print(f"Rotated Prediction: Index {idx_rot} | Conf: {conf_rot:.2f}")
+def find_saturation(results, min_gain=0.05, max_error_rate=0.01, slo_ms=None):
+    """
+    First level where adding load stops paying off: throughput gains less than
+    `min_gain`, errors exceed `max_error_rate`, p99 breaks the SLO, or (open loop)
+    the server completes less than 95% of the offered rate.
+    Returns {"level": last healthy level, "reason": ...}.
+    """
+    best = None
+    for r in results:
+        reason = None
+        if r["error_rate"] > max_error_rate:
+            reason = f"error rate {r['error_rate']:.1%} at level {r['level']}"
+        elif slo_ms is not None and r.get("p99_ms", 0) > slo_ms:
+            reason = f"p99 {r['p99_ms']:.1f} ms > SLO {slo_ms} ms at level {r['level']}"
+        elif "offered_rps" in r and r["throughput_rps"] < 0.95 * r["offered_rps"]:
+            reason = f"served {r['throughput_rps']:.1f} of {r['offered_rps']} req/s at level {r['level']}"
+        elif best is not None and r["throughput_rps"] < best["throughput_rps"] * (1 + min_gain):
+            reason = f"throughput gain < {min_gain:.0%} at level {r['level']}"
+        if reason:
+            return {"level": best["level"] if best else None, "reason": reason}
+        best = r
+    return {"level": best["level"] if best else None, "reason": "not reached"}
 
-    if idx == idx_rot:
-        print(">>> PASSED: Prediction Stable")
+def install_standin_model():
+    """
+    In-process only: serve the benchmark's tiny stand-in model when none is trained.
+    """
+    from scripts.benchmark import build_standin_model
+    from app.services.model_manager import ModelManager
+    manager = ModelManager()
+    if manager.get_model()[0] is None:
+        model = build_standin_model(num_classes=2)
+        manager._model = model
+        manager._classes = {"0": "background", "1": "standin"}
+        print("Using stand-in model (no trained model found).")
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_uvicorn(port, timeout=120):
+    import httpx
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+                            cwd=PROJECT_ROOT)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        if proc.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup.")
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("uvicorn did not become healthy in time.")
+
+async def run_levels(client, images, pattern, levels, duration, path="/predict"):
+    results = []
+    for level in levels:
+        if pattern == "open":
+            result = await open_loop(client, images, level, duration, path)
+        else:
+            result = await closed_loop(client, images, int(level), duration, path)
+        results.append(result)
+        print(f"level {level:>6}: {result['throughput_rps']:8.1f} req/s | p50 {result.get('p50_ms', 0):8.1f} | "
+              f"p95 {result.get('p95_ms', 0):8.1f} | p99 {result.get('p99_ms', 0):8.1f} | "
+              f"p99.9 {result.get('p999_ms', 0):8.1f} ms | errors {result['error_rate']:.1%}")
+    return results
+
+async def run_load_test(target="inprocess", url=None, pattern="closed", levels=(1, 2, 4, 8), duration=10.0,
+                        images=None, slo_ms=None, timeout=60.0):
+    import httpx
+    from scripts.benchmark import make_synthetic_images
+    images = images or make_synthetic_images(16)
+
+    if target == "inprocess":
+        from app.main import app
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as client:
+            results = await run_levels(client, images, pattern, levels, duration)
     else:
-        print("!!! FAILED: Prediction Flipped!")
+        async with httpx.AsyncClient(base_url=url, timeout=timeout,
+                                     limits=httpx.Limits(max_connections=None, max_keepalive_connections=None)) as client:
+            results = await run_levels(client, images, pattern, levels, duration)
+
+    return {
+        "target": target,
+        "pattern": pattern,
+        "duration_s": duration,
+        "levels": results,
+        "saturation": find_saturation(results, slo_ms=slo_ms),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline /predict load generator")
+    parser.add_argument("--target", choices=["inprocess", "uvicorn", "url"], default="inprocess")
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:8000", help="Server for --target url")
+    parser.add_argument("--pattern", choices=["closed", "open"], default="closed",
+                        help="closed: levels are concurrency; open: levels are arrival rates (req/s)")
+    parser.add_argument("--levels", type=str, default="1,2,4,8,16", help="Comma-separated load levels")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per level")
+    parser.add_argument("--slo-ms", type=float, default=None, help="p99 latency SLO used for saturation")
+    parser.add_argument("--data-dir", type=str, default=None, help="Use local images instead of synthetic ones")
+    parser.add_argument("--standin", action="store_true", help="In-process: use a tiny stand-in model if none is trained")
+    parser.add_argument("--output", type=str, default=None, help="Results JSON path")
+    args = parser.parse_args(argv)
+
+    levels = [float(v) if args.pattern == "open" else int(v) for v in args.levels.split(",")]
+    images = None
+    if args.data_dir:
+        from scripts.benchmark import load_image_dir
+        images = load_image_dir(args.data_dir, 64) or None
+
+    if args.standin and args.target == "inprocess":
+        install_standin_model()
+
+    proc = None
+    url = args.url
+    if args.target == "uvicorn":
+        port = _free_port()
+        proc = start_uvicorn(port)
+        url = f"http://127.0.0.1:{port}"
+
+    print(f"--- Load Test ({args.target}, {args.pattern} loop, {args.duration}s per level) ---")
+    try:
+        report = asyncio.run(run_load_test(args.target, url, args.pattern, levels, args.duration, images, args.slo_ms))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    sat = report["saturation"]
+    print(f"\nSaturation: level {sat['level']} ({sat['reason']})")
+
+    output = args.output or os.path.join(METRICS_DIR, "benchmarks", f"loadtest_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output}")
+    return report
 
 if __name__ == "__main__":
-    run_stress_test()
+    main()
@@ -5,9 +5,11 @@ Responsibility:
     - Data Cleaning: Deduplicates images using Perceptual Hashing (pHash).
     - Data Augmentation: Expands the dataset using synthetic transformations (Rotation, Brightness, Blur).
     - Ensures every class has at least 100 samples.
+    - `--virtual`: records augmentation recipes in a sidecar manifest instead of writing `aug_*` files.
 
 Usage:
     python scripts/refinery.py --dataset_path "data/raw/train/Car_Brand_Logos/Train"
+    python scripts/refinery.py --dataset_path "data/raw/cars" --virtual
 """
 
 import os
@@ -19,9 +21,11 @@ from PIL import Image
 import imagehash
 import shutil
 
-# Add project root to sys.path to ensure we can import core if needed (though not strictly needed here)
+# Add project root to sys.path to ensure we can import core
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from core.augmentation import sample_recipe, apply_recipe, build_class_recipes, write_manifest
+
 def compute_phash(image_path):
     """
     Computes Perceptual Hash for an image.
@@ -67,40 +71,29 @@ def deduplicate_class(class_dir):
 def augment_image(image):
     """
     Generates an augmented version of the image.
-    Applies random rotation, brightness/contrast, or blur.
+    Applies random rotation, brightness/contrast, or blur (see core.augmentation.sample_recipe).
     """
-    rows, cols = image.shape[:2]
-    
-    # 1. Rotation (+- 15 degrees)
-    angle = np.random.uniform(-15, 15)
-    M = cv2.getRotationMatrix2D((cols/2, rows/2), angle, 1)
-    aug_img = cv2.warpAffine(image, M, (cols, rows), borderMode=cv2.BORDER_REFLECT)
-    
-    # 2. Brightness/Contrast
-    # alpha = contrast [0.8, 1.2], beta = brightness [-30, 30]
-    alpha = np.random.uniform(0.8, 1.2)
-    beta = np.random.uniform(-30, 30)
-    aug_img = cv2.convertScaleAbs(aug_img, alpha=alpha, beta=beta)
-    
-    # 3. Gaussian Blur (slight) - 30% chance
-    if np.random.rand() > 0.7:
-        ksize = np.random.choice([3, 5])
-        aug_img = cv2.GaussianBlur(aug_img, (ksize, ksize), 0)
-        
-    return aug_img
+    recipe = sample_recipe(np.random.randint(2**31 - 1))
+    return apply_recipe(image, recipe)
 
-def augment_class(class_dir, target_count=100):
+def augment_class(class_dir, target_count=100, virtual=False):
     """
     Augments images in a class directory to reach target_count.
+    With `virtual`, nothing is written: the recipes are returned for the sidecar manifest.
     """
     files = [f for f in os.listdir(class_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))]
     current_count = len(files)
     
     if current_count >= target_count:
         print(f"Class {os.path.basename(class_dir)} has {current_count} images. No augmentation needed.")
-        return
+        return []
         
     needed = target_count - current_count
+
+    if virtual:
+        print(f"Augmenting {os.path.basename(class_dir)}: {current_count} -> {target_count} (Recording {needed} recipes)")
+        return build_class_recipes(class_dir, files, needed, seed=np.random.randint(2**31 - 1))
+
     print(f"Augmenting {os.path.basename(class_dir)}: {current_count} -> {target_count} (Generating {needed} new images)")
     
     # Load all images to sample from
@@ -113,7 +106,7 @@ def augment_class(class_dir, target_count=100):
             
     if not images:
         print("No valid images to augment.")
-        return
+        return []
 
     generated = 0
     while generated < needed:
@@ -126,12 +119,15 @@ def augment_class(class_dir, target_count=100):
         new_filename = f"aug_{generated}_{base_filename}"
         cv2.imwrite(os.path.join(class_dir, new_filename), aug_img)
         generated += 1
+    return []
 
-def run_refinery(dataset_path):
+def run_refinery(dataset_path, virtual=False):
     if not os.path.exists(dataset_path):
         print(f"Dataset path not found: {dataset_path}")
         return
 
+    recipes = {}
+
     # Iterate over class directories
     for class_name in os.listdir(dataset_path):
         class_dir = os.path.join(dataset_path, class_name)
@@ -142,12 +138,20 @@ def run_refinery(dataset_path):
         deduplicate_class(class_dir)
         
         # 2. Augment
-        augment_class(class_dir, target_count=100)
+        class_recipes = augment_class(class_dir, target_count=100, virtual=virtual)
+        if virtual:
+            recipes[class_name] = class_recipes
+
+    if virtual:
+        path = write_manifest(dataset_path, recipes)
+        total = sum(len(r) for r in recipes.values())
+        print(f"Augmentation manifest saved to {path} ({total} recipes)")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="OmniVision Data Refinery")
     parser.add_argument("--dataset_path", type=str, required=True, help="Path to the dataset (e.g., data/raw/train/Car_Brand_Logos/Train)")
+    parser.add_argument("--virtual", action="store_true", help="Record augmentation recipes in a manifest instead of writing aug_* files")
     
     args = parser.parse_args()
     
-    run_refinery(args.dataset_path)
+    run_refinery(args.dataset_path, virtual=args.virtual)
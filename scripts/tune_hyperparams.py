@@ -2,65 +2,396 @@
 scripts/tune_hyperparams.py
 
 Responsibility:
-    - Runs a Grid Search on Vocabulary Size (k).
-    - Suggests the optimal k.
-    - Saves config/hyperparams.json.
+    - Hyperparameter search for the CNN (train/train_cnn.py): head learning rate, dropout,
+      head width and input size, then the fine-tuning learning rate and depth (fine_tune_at).
+    - Asynchronous successive halving (ASHA): every trial starts on a small epoch budget and
+      only the top 1/eta of a rung is promoted to eta times more epochs. Promotions are
+      decided as results arrive, so the process pool never idles waiting for a rung to fill.
+    - Head-only trials train on cached backbone features (one MobileNetV2 pass per input
+      size, stored under TUNING_CACHE_DIR), so a trial costs a few dense layers, not a CNN.
+    - Fine-tuning trials (second stage) start from the best head and train the unfrozen
+      backbone on the cached image arrays.
+    - Writes config/hyperparams.json, which `train/train_cnn.py --hyperparams` applies.
+
+Usage:
+    python scripts/tune_hyperparams.py --data-dir data/raw/cars
+    python scripts/tune_hyperparams.py --trials 40 --workers 4 --max-epochs 27 --fine-tune-trials 6
+    python scripts/tune_hyperparams.py --weights none --sizes 96 --fine-tune-trials 0   # smoke run
 """
 
 import os
 import sys
 import json
+import time
+import hashlib
 import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future, FIRST_COMPLETED, wait
+import numpy as np
+from PIL import Image
 
 # Add project root to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from train.train_model import run_training
-from core.config import CLASS_LABELS
+from core.config import BASE_DIR, BATCH_SIZE, RESOLUTION_VARIANTS, HYPERPARAMS_PATH, TUNING_CACHE_DIR
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+HEAD_UNITS = (0, 256, 512, 1024)
+FINE_TUNE_AT = (50, 100, 120, 140)  # MobileNetV2 has 154 layers
+
+class ASHA:
+    """
+    Asynchronous successive halving (Li et al., 2018) over the epoch budgets
+    min_epochs * eta^k, capped at max_epochs. `sample()` draws a new configuration.
+    """
+
+    def __init__(self, sample, n_trials, min_epochs=1, max_epochs=9, eta=3):
+        self.sample = sample
+        self.n_trials = n_trials
+        self.eta = eta
+        self.budgets = []
+        budget = min_epochs
+        while budget < max_epochs:
+            self.budgets.append(budget)
+            budget *= eta
+        self.budgets.append(max_epochs)
+        self.trials = []
+        self.rungs = [{} for _ in self.budgets]  # per rung: trial id -> score
+        self.promoted = [set() for _ in self.budgets]
+
+    def next_job(self):
+        """
+        (trial, rung) to run next: a promotion if any rung has one due, else a new trial.
+        None once all trials are sampled and nothing is promotable yet.
+        """
+        for k in reversed(range(len(self.budgets) - 1)):
+            scores = self.rungs[k]
+            for tid in sorted(scores, key=scores.get, reverse=True)[:len(scores) // self.eta]:
+                if tid not in self.promoted[k]:
+                    self.promoted[k].add(tid)
+                    return self.trials[tid], k + 1
+        if len(self.trials) < self.n_trials:
+            trial = {"id": len(self.trials), "config": self.sample(), "scores": {}}
+            self.trials.append(trial)
+            return trial, 0
+        return None
 
-def tune_k(dataset_paths, k_values=[50, 100, 200, 500]):
-    best_k = k_values[0]
-    best_acc = 0.0
-    results = {}
+    def report(self, trial, rung, score):
+        trial["scores"][self.budgets[rung]] = score
+        self.rungs[rung][trial["id"]] = score
 
-    for k in k_values:
-        print(f"\n[Auto-Tuner] Testing k={k}...")
+    def best(self):
+        """
+        (trial, score, epochs) of the best trial on the highest rung reached.
+        """
+        for k in reversed(range(len(self.budgets))):
+            scores = self.rungs[k]
+            if scores:
+                tid = max(scores, key=scores.get)
+                return self.trials[tid], scores[tid], self.budgets[k]
+        return None, None, None
+
+class _InlineExecutor:
+    """
+    Runs jobs in this process (workers=0), behind the executor interface.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, *args):
+        future = Future()
         try:
-            acc = run_training(dataset_paths, CLASS_LABELS, num_clusters=k, save_model=False)
-            results[k] = acc
-            print(f"[Auto-Tuner] k={k} => Accuracy: {acc*100:.2f}%")
-            
-            if acc > best_acc:
-                best_acc = acc
-                best_k = k
+            future.set_result(fn(*args))
         except Exception as e:
-            print(f"[Auto-Tuner] Error testing k={k}: {e}")
-            
-    print(f"\n[Auto-Tuner] Best k found: {best_k} with {best_acc*100:.2f}% accuracy.")
-    
-    # Save results
-    config_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config')
-    os.makedirs(config_dir, exist_ok=True)
-    
-    config_path = os.path.join(config_dir, 'hyperparams.json')
-    with open(config_path, 'w') as f:
-        json.dump({
-            "best_k": best_k,
-            "best_accuracy": best_acc,
-            "all_results": results
-        }, f, indent=4)
-        
-    print(f"[Auto-Tuner] Results saved to {config_path}")
-    
-    # Retrain with best K
-    print(f"[Auto-Tuner] Retraining final model with best k={best_k}...")
-    run_training(dataset_paths, CLASS_LABELS, num_clusters=best_k, save_model=True)
+            future.set_exception(e)
+        return future
+
+def run_asha(asha, executor, workers, evaluate, cache_dirs, seed=0, label="trial"):
+    """
+    Keeps up to `workers` evaluations in flight until the scheduler runs out of jobs.
+    `evaluate(cache_dir, config, epochs, seed)` returns a validation accuracy.
+    """
+    running = {}
+    while True:
+        while len(running) < max(workers, 1):
+            job = asha.next_job()
+            if job is None:
+                break
+            trial, rung = job
+            cache_dir = cache_dirs[tuple(trial["config"]["img_size"])]
+            future = executor.submit(evaluate, cache_dir, trial["config"], asha.budgets[rung], seed + trial["id"])
+            running[future] = (trial, rung)
+        if not running:
+            return asha.best()
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            trial, rung = running.pop(future)
+            try:
+                score = float(future.result())
+            except Exception as e:
+                print(f"[Auto-Tuner] {label} {trial['id']} failed: {e}")
+                score = 0.0
+            asha.report(trial, rung, score)
+            print(f"[Auto-Tuner] {label} {trial['id']:>3} | {asha.budgets[rung]:>3} epochs | acc {score:.3f} | {trial['config']}")
+
+# --- Data and caches ---
+
+def split_dataset(data_dir, val_split=0.2, seed=0):
+    """
+    Per-class shuffled train/validation split: (classes, [(path, label)], [(path, label)]).
+    """
+    classes = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    rng = np.random.default_rng(seed)
+    train, val = [], []
+    for label, name in enumerate(classes):
+        files = sorted(f for f in os.listdir(os.path.join(data_dir, name)) if f.lower().endswith(IMAGE_EXTENSIONS))
+        rng.shuffle(files)
+        n_val = int(round(len(files) * val_split)) if len(files) > 1 else 0
+        items = [(os.path.join(data_dir, name, f), label) for f in files]
+        val.extend(items[:n_val])
+        train.extend(items[n_val:])
+    return classes, train, val
+
+def load_images(items, img_size):
+    out = np.empty((len(items),) + tuple(img_size) + (3,), dtype=np.uint8)
+    for i, (path, _) in enumerate(items):
+        with Image.open(path) as img:
+            out[i] = np.asarray(img.convert('RGB').resize(tuple(img_size)))
+    return out
+
+def cache_key(items, img_size, weights):
+    h = hashlib.sha256()
+    for path, label in items:
+        st = os.stat(path)
+        h.update(f"{path}|{label}|{st.st_size}|{int(st.st_mtime)}\n".encode())
+    h.update(f"{tuple(img_size)}|{weights}".encode())
+    return h.hexdigest()[:16]
+
+def build_cache(data_dir, img_size, weights='imagenet', val_split=0.2, seed=0, cache_dir=TUNING_CACHE_DIR):
+    """
+    Image arrays, labels and pooled backbone features of the tuning split for one input
+    size, plus the backbone weights they came from. Reused while the data is unchanged.
+    Returns the cache directory.
+    """
+    classes, train, val = split_dataset(data_dir, val_split, seed)
+    path = os.path.join(str(cache_dir), f"{img_size[0]}x{img_size[1]}_{cache_key(train + val, img_size, weights)}")
+    if os.path.exists(os.path.join(path, "meta.json")):
+        return path
+
+    import tensorflow as tf
+    from tensorflow.keras.applications import MobileNetV2
+    from core.inference import forward
+    os.makedirs(path, exist_ok=True)
+    base = MobileNetV2(weights=weights, include_top=False, input_shape=tuple(img_size) + (3,))
+    extractor = tf.keras.Sequential([base, tf.keras.layers.GlobalAveragePooling2D()])
+    for split, items in (("train", train), ("val", val)):
+        images = load_images(items, img_size)
+        features = [forward(extractor, images[i:i + BATCH_SIZE].astype(np.float32) / 255.0)
+                    for i in range(0, len(images), BATCH_SIZE)]
+        np.save(os.path.join(path, f"x_{split}.npy"), images)
+        np.save(os.path.join(path, f"y_{split}.npy"), np.array([label for _, label in items], dtype=np.int64))
+        np.save(os.path.join(path, f"f_{split}.npy"), np.concatenate(features) if features else
+                np.zeros((0, extractor.output_shape[-1]), np.float32))
+    base.save_weights(os.path.join(path, "backbone.weights.h5"))
+    with open(os.path.join(path, "meta.json"), 'w') as f:
+        json.dump({"classes": classes, "img_size": list(img_size), "weights": weights,
+                   "train": len(train), "val": len(val)}, f, indent=2)
+    print(f"[Auto-Tuner] Cached {len(train)}+{len(val)} images at {img_size[0]}px in {path}")
+    return path
+
+def _load(cache_dir, name):
+    return np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode='r')
+
+# --- Trial evaluation (runs in the worker processes) ---
+
+def _init_worker(threads):
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def build_head(num_features, num_classes, head_units, dropout):
+    """
+    The classification head of train_cnn.build_model, on pooled features.
+    """
+    import tensorflow as tf
+    layers = [tf.keras.Input(shape=(num_features,)), tf.keras.layers.Dropout(dropout)]
+    if head_units:
+        layers.append(tf.keras.layers.Dense(head_units, activation='relu'))
+    layers.append(tf.keras.layers.Dense(num_classes, activation='softmax'))
+    return tf.keras.Sequential(layers)
+
+def train_head(cache_dir, config, epochs, seed=0):
+    """
+    Trains the head on cached features. Returns (validation accuracy, head model).
+    """
+    import tensorflow as tf
+    tf.keras.utils.set_random_seed(seed)
+    f_train, y_train = np.asarray(_load(cache_dir, "f_train")), np.asarray(_load(cache_dir, "y_train"))
+    f_val, y_val = np.asarray(_load(cache_dir, "f_val")), np.asarray(_load(cache_dir, "y_val"))
+    with open(os.path.join(cache_dir, "meta.json"), 'r') as f:
+        num_classes = len(json.load(f)["classes"])
+    head = build_head(f_train.shape[1], num_classes, config["head_units"], config["dropout"])
+    head.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=config["head_lr"]),
+                 loss='sparse_categorical_crossentropy')
+    head.fit(f_train, y_train, batch_size=BATCH_SIZE, epochs=epochs, shuffle=True, verbose=0)
+    return _accuracy(head, f_val, y_val), head
+
+def evaluate_head(cache_dir, config, epochs, seed=0):
+    return train_head(cache_dir, config, epochs, seed)[0]
+
+def evaluate_fine_tune(cache_dir, config, epochs, seed=0):
+    """
+    Full network from the best head (trained `config["head_epochs"]` on features), with the
+    backbone unfrozen from `fine_tune_at` and trained for `epochs` at `fine_tune_lr`.
+    """
+    import tensorflow as tf
+    from train.train_cnn import build_model
+    _, head = train_head(cache_dir, config, config["head_epochs"], seed)
+    with open(os.path.join(cache_dir, "meta.json"), 'r') as f:
+        num_classes = len(json.load(f)["classes"])
+    model, base = build_model(num_classes, tuple(config["img_size"]), head_units=config["head_units"],
+                              weights=None, dropout=config["dropout"])
+    base.load_weights(os.path.join(cache_dir, "backbone.weights.h5"))
+    dense = lambda m: [layer for layer in m.layers if isinstance(layer, tf.keras.layers.Dense)]
+    for dst, src in zip(dense(model), dense(head)):
+        dst.set_weights(src.get_weights())
+
+    base.trainable = True
+    for layer in base.layers[:config["fine_tune_at"]]:
+        layer.trainable = False
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=config["fine_tune_lr"]),
+                  loss='sparse_categorical_crossentropy')
+    x_train, y_train = _load(cache_dir, "x_train"), np.asarray(_load(cache_dir, "y_train"))
+    rng = np.random.default_rng(seed)
+
+    def batches():
+        # Normalised a batch at a time, so the uint8 cache stays memory-mapped
+        while True:
+            order = rng.permutation(len(x_train))
+            for i in range(0, len(order), BATCH_SIZE):
+                idx = np.sort(order[i:i + BATCH_SIZE])
+                yield x_train[idx].astype(np.float32) / 255.0, y_train[idx]
+
+    model.fit(batches(), steps_per_epoch=-(-len(x_train) // BATCH_SIZE), epochs=epochs, verbose=0)
+    return _accuracy(model, _load(cache_dir, "x_val"), np.asarray(_load(cache_dir, "y_val")), scale=1 / 255.0)
+
+def _accuracy(model, x, y, scale=None):
+    from core.inference import forward
+    if len(y) == 0:
+        return 0.0
+    preds = []
+    for i in range(0, len(y), BATCH_SIZE):
+        batch = np.asarray(x[i:i + BATCH_SIZE], dtype=np.float32)
+        preds.append(forward(model, batch * scale if scale else batch).argmax(axis=1))
+    return float(np.mean(np.concatenate(preds) == y))
+
+# --- Search ---
+
+def sample_head_config(rng, sizes):
+    size = int(sizes[rng.integers(len(sizes))])
+    return {
+        "img_size": [size, size],
+        "head_units": int(HEAD_UNITS[rng.integers(len(HEAD_UNITS))]),
+        "dropout": round(float(rng.uniform(0.0, 0.5)), 2),
+        "head_lr": float(10 ** rng.uniform(-4.0, -2.5)),
+    }
+
+def sample_fine_tune_config(rng, head_config, head_epochs):
+    return dict(head_config, head_epochs=head_epochs,
+                fine_tune_lr=float(10 ** rng.uniform(-6.0, -4.0)),
+                fine_tune_at=int(FINE_TUNE_AT[rng.integers(len(FINE_TUNE_AT))]))
+
+def _executor(workers, threads):
+    if workers == 0:
+        _init_worker(threads)
+        return _InlineExecutor()
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_worker, initargs=(threads,))
+
+def tune(data_dir, sizes=RESOLUTION_VARIANTS, trials=27, workers=None, eta=3, min_epochs=1, max_epochs=9,
+         fine_tune_trials=4, fine_tune_max_epochs=3, val_split=0.2, seed=0, weights='imagenet',
+         output=HYPERPARAMS_PATH, cache_dir=TUNING_CACHE_DIR):
+    """
+    Runs both search stages and writes `output`. Returns the written results.
+    """
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    threads = max(1, (os.cpu_count() or 1) // max(workers, 1))
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+
+    print(f"[Auto-Tuner] Caching backbone features for sizes {list(sizes)}...")
+    cache_dirs = {(s, s): build_cache(data_dir, (s, s), weights, val_split, seed, cache_dir) for s in sizes}
+
+    head_asha = ASHA(lambda: sample_head_config(rng, list(sizes)), trials, min_epochs, max_epochs, eta)
+    ft_asha = None
+    with _executor(workers, threads) as executor:
+        print(f"[Auto-Tuner] Stage 1: {trials} head-only trials, budgets {head_asha.budgets}, {workers or 'no'} worker processes")
+        best, best_acc, best_epochs = run_asha(head_asha, executor, workers, evaluate_head, cache_dirs, seed, "head")
+        result = dict(best["config"])
+        ft_acc = None
+        if fine_tune_trials:
+            ft_asha = ASHA(lambda: sample_fine_tune_config(rng, best["config"], best_epochs), fine_tune_trials,
+                           1, fine_tune_max_epochs, eta)
+            print(f"[Auto-Tuner] Stage 2: {fine_tune_trials} fine-tuning trials, budgets {ft_asha.budgets}")
+            ft_best, ft_acc, _ = run_asha(ft_asha, executor, workers, evaluate_fine_tune, cache_dirs, seed, "fine-tune")
+            if ft_best is not None:
+                result.update(fine_tune_lr=ft_best["config"]["fine_tune_lr"], fine_tune_at=ft_best["config"]["fine_tune_at"])
+
+    from train.train_cnn import HYPERPARAMS_FORMAT
+    trials_out = [dict(t, stage="head") for t in head_asha.trials]
+    trials_out += [dict(t, stage="fine_tune") for t in (ft_asha.trials if ft_asha else [])]
+    results = {
+        "format": HYPERPARAMS_FORMAT,
+        "version": 1,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "best": result,
+        "best_accuracy": {"head": best_acc, "fine_tune": ft_acc},
+        "search": {"scheduler": "asha", "eta": eta, "head_trials": trials, "head_budgets": head_asha.budgets,
+                   "fine_tune_trials": fine_tune_trials, "workers": workers, "data_dir": str(data_dir),
+                   "weights": weights, "val_split": val_split, "seed": seed,
+                   "seconds": round(time.perf_counter() - start, 1)},
+        "trials": [{"id": t["id"], "stage": t["stage"], "config": t["config"],
+                    "scores": {str(k): v for k, v in t["scores"].items()}} for t in trials_out],
+    }
+    os.makedirs(os.path.dirname(str(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f"\n[Auto-Tuner] Best configuration: {result} (head acc {best_acc:.3f}"
+          + (f", fine-tuned acc {ft_acc:.3f})" if ft_acc is not None else ")"))
+    print(f"[Auto-Tuner] Results saved to {output}; apply with: python train/train_cnn.py --hyperparams")
+    return results
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ASHA hyperparameter search for the CNN")
+    parser.add_argument("--data-dir", type=str, default=os.path.join(BASE_DIR, 'data', 'raw', 'cars'))
+    parser.add_argument("--sizes", type=parse_int_list, default=list(RESOLUTION_VARIANTS), help="Input sizes to search")
+    parser.add_argument("--trials", type=int, default=27, help="Head-only configurations to sample")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all CPUs; 0 = in-process)")
+    parser.add_argument("--eta", type=int, default=3, help="Promotion ratio: top 1/eta of a rung gets eta x the epochs")
+    parser.add_argument("--min-epochs", type=int, default=1)
+    parser.add_argument("--max-epochs", type=int, default=9)
+    parser.add_argument("--fine-tune-trials", type=int, default=4, help="Fine-tuning configurations (0 = head only)")
+    parser.add_argument("--fine-tune-max-epochs", type=int, default=3)
+    parser.add_argument("--val-split", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--weights", type=str, default="imagenet", help="Backbone weights ('none' for a random backbone)")
+    parser.add_argument("--output", type=str, default=str(HYPERPARAMS_PATH))
+    parser.add_argument("--cache-dir", type=str, default=str(TUNING_CACHE_DIR))
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.data_dir):
+        print(f"Error: Data directory '{args.data_dir}' does not exist.")
+        return None
+    return tune(args.data_dir, args.sizes, args.trials, args.workers, args.eta, args.min_epochs, args.max_epochs,
+                args.fine_tune_trials, args.fine_tune_max_epochs, args.val_split, args.seed,
+                None if args.weights.lower() == "none" else args.weights, args.output, args.cache_dir)
 
 if __name__ == "__main__":
-    # Default paths (try to match train_model.py default or args)
-    default_train_path = [
-        'data/raw/train/Car_Brand_Logos/Train',
-        'data/raw/train/Car_Brand_Logos/Test'
-    ]
-    
-    tune_k(default_train_path)
+    main()
@@ -78,9 +78,15 @@ document.addEventListener('DOMContentLoaded', () => {
             const start = Date.now();
             const response = await fetch('/predict', {
                 method: 'POST',
+                headers: { 'X-Client': 'ui' },  // UI traffic has its own admission limits
                 body: formData
             });
 
+            if (response.status === 429 || response.status === 503) {
+                const retry = response.headers.get('Retry-After') || '1';
+                throw new Error(`Server busy, please retry in ${retry}s`);
+            }
+
             if (!response.ok) {
                 const err = await response.json();
                 throw new Error(err.detail || 'Prediction failed');
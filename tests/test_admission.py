@@ -0,0 +1,103 @@
+"""
+tests/test_admission.py
+
+Verifies bounded admission: in-flight and queue limits per client class, 429/503 with
+Retry-After, slot hand-over and the SLO-driven queue limit.
+"""
+
+import asyncio
+import json
+import pytest
+
+from core.admission import AdmissionController, AdmissionRejected
+from core.deadline import Deadline
+from app.middleware import AdmissionMiddleware, client_class
+
+LIMITS = {"ui": {"max_in_flight": 1, "max_queue": 1}, "api": {"max_in_flight": 1, "max_queue": 2}}
+
+def test_queue_then_429_and_hand_over():
+    async def scenario():
+        ctl = AdmissionController(LIMITS, slo_ms=10000, initial_service_ms=10)
+        first = await ctl.acquire("api")
+        queued = [asyncio.ensure_future(ctl.acquire("api")) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as e:
+            await ctl.acquire("api")
+        assert e.value.status_code == 429 and e.value.retry_after >= 1
+        # The UI has its own slots
+        ui = await ctl.acquire("ui")
+        ctl.release("ui", ui)
+
+        ctl.release("api", first)
+        second = await queued[0]
+        assert not queued[1].done()
+        ctl.release("api", second)
+        ctl.release("api", await queued[1])
+        assert ctl.stats()["api"]["in_flight"] == 0
+    asyncio.run(scenario())
+
+def test_slow_service_shrinks_queue_to_503():
+    async def scenario():
+        ctl = AdmissionController(LIMITS, slo_ms=1000, initial_service_ms=100)
+        assert ctl.queue_limit("api") == 2
+        ctl.service_ms = 600
+        assert ctl.queue_limit("api") == 0
+        await ctl.acquire("api")
+        with pytest.raises(AdmissionRejected) as e:
+            await ctl.acquire("api")
+        assert e.value.status_code == 503 and e.value.retry_after == 1
+    asyncio.run(scenario())
+
+def test_queued_request_times_out_with_503():
+    async def scenario():
+        ctl = AdmissionController(LIMITS, slo_ms=50, initial_service_ms=5)
+        await ctl.acquire("ui")
+        with pytest.raises(AdmissionRejected) as e:
+            await ctl.acquire("ui")
+        assert e.value.status_code == 503
+        assert ctl.stats()["ui"]["queued"] == 0
+    asyncio.run(scenario())
+
+def test_middleware_rejects_before_reading_body():
+    async def scenario():
+        ctl = AdmissionController(LIMITS, slo_ms=1000, initial_service_ms=900)
+        inner_calls = []
+
+        async def inner(scope, receive, send):
+            inner_calls.append(scope["path"])
+
+        middleware = AdmissionMiddleware(inner, controller=ctl, paths=["/predict"])
+        await ctl.acquire("api")  # saturate the API class
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        async def receive():
+            raise AssertionError("body must not be read")
+
+        scope = {"type": "http", "method": "POST", "path": "/predict", "headers": [(b"x-client", b"sdk")]}
+        await middleware(scope, receive, send)
+        assert sent[0]["status"] == 503
+        assert (b"retry-after", b"1") in sent[0]["headers"]
+        assert "detail" in json.loads(sent[1]["body"])
+
+        scope["headers"] = [(b"x-client", b"UI")]
+        await middleware(scope, receive, send)
+        assert inner_calls == ["/predict"]
+    asyncio.run(scenario())
+
+def test_client_class():
+    assert client_class([(b"x-client", b"ui")]) == "ui"
+    assert client_class([(b"x-client", b"curl")]) == "api"
+    assert client_class([]) == "api"
+
+def test_deadline_bounds_queue_wait():
+    async def scenario():
+        ctl = AdmissionController(LIMITS, slo_ms=10000, initial_service_ms=10)
+        await ctl.acquire("api")
+        with pytest.raises(AdmissionRejected) as e:
+            await ctl.acquire("api", Deadline(30))
+        assert e.value.status_code == 504
+        assert ctl.stats()["api"]["queued"] == 0
+    asyncio.run(scenario())
@@ -0,0 +1,85 @@
+"""
+tests/test_artifact.py
+
+Verifies the memory-mapped model artifact: round trip, size/mtime and checksum checks, staleness,
+and that dl_loader serves it in place of the .h5.
+"""
+
+import os
+import json
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from train.train_cnn import build_model
+from core.artifact import export_artifact, load_artifact, is_current, read_manifest
+from core.dl_loader import load_trained_model
+
+CLASSES = {"0": "audi", "1": "bmw"}
+
+@pytest.fixture
+def exported(tmp_path):
+    model, _ = build_model(2, (32, 32), 0.35, 16, weights=None)
+    h5_path = tmp_path / "model.h5"
+    model.save(str(h5_path))
+    artifact = tmp_path / "model.omni"
+    export_artifact(model, CLASSES, artifact, source_path=str(h5_path))
+    return model, h5_path, artifact
+
+def test_round_trip_matches_original(exported):
+    model, _, artifact = exported
+    loaded, classes = load_artifact(artifact)
+    assert classes == CLASSES
+    x = np.random.default_rng(0).random((2, 32, 32, 3), dtype=np.float32)
+    np.testing.assert_allclose(loaded(x, training=False).numpy(), model(x, training=False).numpy(), atol=1e-6)
+    assert all(t["offset"] % 64 == 0 for t in read_manifest(artifact)["tensors"])
+
+def test_corrupt_weights_are_rejected(exported):
+    _, _, artifact = exported
+    st = os.stat(artifact / "weights.bin")
+    with open(artifact / "weights.bin", "r+b") as f:
+        f.seek(100)
+        f.write(b"\xff\xff\xff\xff")
+    # Corruption that leaves size and mtime alone is only caught by the checksum
+    os.utime(artifact / "weights.bin", ns=(st.st_atime_ns, st.st_mtime_ns))
+    load_artifact(artifact)
+    with pytest.raises(ValueError, match="checksum"):
+        load_artifact(artifact, verify=True)
+
+def test_modified_weights_rejected_without_checksum(exported):
+    _, _, artifact = exported
+    weights = artifact / "weights.bin"
+    st = os.stat(weights)
+    os.utime(weights, (st.st_atime, st.st_mtime + 60))
+    with pytest.raises(ValueError, match="modified"):
+        load_artifact(artifact)
+    with open(weights, "ab") as f:
+        f.write(b"\0")
+    with pytest.raises(ValueError, match="size"):
+        load_artifact(artifact)
+
+def test_artifact_goes_stale_when_h5_is_replaced(exported):
+    model, h5_path, artifact = exported
+    assert is_current(artifact, str(h5_path))
+    model.save(str(h5_path), include_optimizer=False)
+    with open(h5_path, "ab") as f:
+        f.write(b"\0")
+    assert not is_current(artifact, str(h5_path))
+
+def test_artifact_goes_stale_on_same_size_replacement_within_a_second(exported):
+    _, h5_path, artifact = exported
+    st = os.stat(h5_path)
+    # Same size, same whole second: only the nanoseconds tell the files apart
+    nudge = 1 if st.st_mtime_ns % 10**9 < 10**9 - 1 else -1
+    os.utime(h5_path, ns=(st.st_atime_ns, st.st_mtime_ns + nudge))
+    assert not is_current(artifact, str(h5_path))
+
+def test_loader_prefers_current_artifact(exported, tmp_path):
+    _, h5_path, artifact = exported
+    classes_path = tmp_path / "classes.json"
+    classes_path.write_text(json.dumps({"0": "other"}))
+    with patch("core.dl_loader.MODEL_PATH", h5_path), \
+         patch("core.dl_loader.CLASS_INDICES_PATH", classes_path), \
+         patch("core.dl_loader.MODEL_ARTIFACT_PATH", artifact):
+        model, classes = load_trained_model()
+    assert model is not None and classes == CLASSES
@@ -0,0 +1,103 @@
+"""
+tests/test_bovw.py
+
+Verifies the BoVW fallback: batched quantization matches brute force, the engine
+classifies end to end, and /predict diverts to it only under CNN backlog or a long-held model lock.
+"""
+
+import io
+import cv2
+import joblib
+import numpy as np
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC
+
+from core import telemetry, config
+from core.locks import PREDICTION_LOCK
+from core.vision_logic import BoVWEngine, quantize, build_histogram, extract_orb_features
+from app.main import app
+from app.services.model_manager import ModelManager
+
+client = TestClient(app)
+
+def jpeg():
+    img = np.random.default_rng(0).integers(0, 255, (120, 160, 3), dtype=np.uint8)
+    _, buf = cv2.imencode(".jpg", img)
+    return buf.tobytes()
+
+def make_engine(n_words=8, dim=32):
+    rng = np.random.default_rng(1)
+    kmeans = SimpleNamespace(cluster_centers_=rng.random((n_words, dim), dtype=np.float32) * 255, n_clusters=n_words)
+    hists = rng.dirichlet(np.ones(n_words), size=20).astype(np.float32)
+    labels = np.repeat([0, 1], 10)
+    scaler = StandardScaler().fit(hists)
+    return BoVWEngine(kmeans, scaler, SVC().fit(scaler.transform(hists), labels), ["audi", "bmw"])
+
+def test_quantize_matches_brute_force():
+    rng = np.random.default_rng(0)
+    x = rng.random((50, 16), dtype=np.float32)
+    centers = rng.random((7, 16), dtype=np.float32)
+    words, d2 = quantize(x, centers)
+    expected = np.argmin(((x[:, None, :] - centers[None]) ** 2).sum(-1), axis=1)
+    assert np.array_equal(words, expected)
+    assert np.allclose(d2, ((x - centers[expected]) ** 2).sum(-1), atol=1e-4)
+
+    hist = build_histogram(x, SimpleNamespace(cluster_centers_=centers, n_clusters=7))
+    assert np.array_equal(hist, np.bincount(expected, minlength=7))
+
+def test_engine_and_feature_extraction_share_orb_settings():
+    gray = cv2.cvtColor(cv2.imdecode(np.frombuffer(jpeg(), np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2GRAY)
+    _, engine_descriptors = make_engine(dim=32).extract(gray)
+    np.testing.assert_array_equal(engine_descriptors, extract_orb_features(gray))
+
+def test_engine_predicts_with_stage_timings():
+    label, confidence, stages = make_engine().predict(jpeg())
+    assert label in ("audi", "bmw") and 0.5 <= confidence <= 1.0
+    assert set(stages) == {"decode", "features", "quantize", "classify"}
+
+def test_load_memory_maps_artifacts(tmp_path):
+    engine = make_engine()
+    (tmp_path / "cars").mkdir()
+    for name, obj in (("kmeans", engine.kmeans), ("scaler", engine.scaler), ("svm", engine.svm), ("classes", engine.classes)):
+        joblib.dump(obj, tmp_path / "cars" / f"{name}.pkl")
+    loaded = BoVWEngine.load("cars", models_dir=tmp_path)
+    assert np.array_equal(loaded.centers, engine.centers)
+    assert loaded.predict(jpeg())[0] == engine.predict(jpeg())[0]
+
+def test_predict_falls_back_under_backlog():
+    model = MagicMock()
+    model.input_shape = (None, 224, 224, 3)
+    model.predict.return_value = np.array([[0.9, 0.1]])
+    classes = {"0": "audi", "1": "bmw"}
+    files = lambda: {"file": ("x.jpg", io.BytesIO(jpeg()), "image/jpeg")}
+
+    with patch.object(ModelManager, "get_model", return_value=(model, classes)), \
+         patch("app.routes.get_bovw_engine", return_value=make_engine()):
+        response = client.post("/predict", files=files())
+        assert response.status_code == 200 and "x-model-engine" not in response.headers
+        assert model.predict.call_count == 1
+
+        telemetry.INFERENCE_QUEUE_DEPTH.inc(4)
+        try:
+            response = client.post("/predict", files=files())
+        finally:
+            telemetry.INFERENCE_QUEUE_DEPTH.dec(4)
+        assert response.status_code == 200
+        assert response.headers["x-model-engine"] == "bovw"
+        assert model.predict.call_count == 1
+
+def test_predict_falls_back_while_lock_is_held_long():
+    model = MagicMock()
+    model.predict.return_value = np.array([[0.9, 0.1]])
+    classes = {"0": "audi", "1": "bmw"}
+
+    with patch.object(ModelManager, "get_model", return_value=(model, classes)), \
+         patch("app.routes.get_bovw_engine", return_value=make_engine()), \
+         patch.object(PREDICTION_LOCK, "held_for", return_value=config.BOVW_FALLBACK_LOCK_HELD_MS / 1000):
+        response = client.post("/predict", files={"file": ("x.jpg", io.BytesIO(jpeg()), "image/jpeg")})
+    assert response.status_code == 200
+    assert response.headers["x-model-engine"] == "bovw"
+    assert model.predict.call_count == 0
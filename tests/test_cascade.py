@@ -0,0 +1,86 @@
+"""
+tests/test_cascade.py
+
+Verifies cascade threshold calibration, the shared validation split and the small/full
+routing in /predict.
+"""
+
+import io
+import cv2
+import numpy as np
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+
+from core import config
+from core.cascade import choose_threshold, expected_cost_ms, run_cascade, dataset_split
+from scripts.calibrate_cascade import validation_files
+from app.main import app
+from app.services.model_manager import ModelManager
+
+client = TestClient(app)
+
+def _probs(conf, predicted, n_classes=3):
+    out = np.full((len(conf), n_classes), 0.0)
+    for i, (c, p) in enumerate(zip(conf, predicted)):
+        out[i] = (1 - c) / (n_classes - 1)
+        out[i, p] = c
+    return out
+
+def test_choose_threshold_respects_accuracy_loss():
+    labels = np.array([0, 1, 2, 0, 1, 2])
+    # Small model is right when confident, wrong on the two low-confidence images
+    small = _probs([0.95, 0.9, 0.85, 0.5, 0.45, 0.8], [0, 1, 2, 1, 0, 2])
+    full = _probs([0.9] * 6, [0, 1, 2, 0, 1, 2])
+
+    strict = choose_threshold(small, full, labels, max_accuracy_loss=0.0)
+    assert strict["threshold"] == 0.8
+    assert strict["accept_rate"] == 4 / 6
+    assert strict["cascade_accuracy"] == strict["full_accuracy"] == 1.0
+
+    loose = choose_threshold(small, full, labels, max_accuracy_loss=0.2)
+    assert loose["threshold"] == 0.5 and loose["accept_rate"] == 5 / 6
+
+    assert expected_cost_ms(strict["accept_rate"], 2.0, 12.0) == 2.0 + 12.0 / 3
+
+def test_run_cascade_escalates_only_when_unsure():
+    small, full = MagicMock(), MagicMock()
+    small.return_value.numpy.return_value = np.array([[0.7, 0.3]])
+    full.return_value.numpy.return_value = np.array([[0.1, 0.9]])
+    make_full = MagicMock(return_value="full-input")
+
+    probs, tier = run_cascade("small-input", make_full, small, full, threshold=0.6)
+    assert tier == "small" and probs[0, 0] == 0.7
+    make_full.assert_not_called()
+
+    probs, tier = run_cascade("small-input", make_full, small, full, threshold=0.8)
+    assert tier == "full" and probs[0, 1] == 0.9
+    full.assert_called_once_with("full-input", training=False)
+
+def test_predict_uses_cascade():
+    small, full = MagicMock(), MagicMock()
+    small.input_shape = (None, 32, 32, 3)
+    full.input_shape = (None, 64, 64, 3)
+    small.return_value.numpy.return_value = np.array([[0.05, 0.95]])
+    classes = {"0": "background", "1": "mazda"}
+
+    _, buf = cv2.imencode(".jpg", np.zeros((50, 50, 3), dtype=np.uint8))
+    with patch.object(ModelManager, "get_model", return_value=(full, classes)), \
+         patch.object(ModelManager, "get_cascade_model", return_value=(small, 0.9)), \
+         patch.object(config, "CASCADE_ENABLED", True):
+        response = client.post("/predict", files={"file": ("x.jpg", io.BytesIO(buf.tobytes()), "image/jpeg")})
+
+    assert response.status_code == 200
+    assert response.json()["label"] == "Mazda"
+    assert small.call_args[0][0].shape == (1, 32, 32, 3)
+    full.assert_not_called()
+    full.predict.assert_not_called()
+    assert 'omnivision_cascade_total{tier="small"}' in client.get("/metrics").text
+
+def test_calibration_scores_on_the_training_split(tmp_path):
+    for c in ("a", "b"):
+        (tmp_path / c).mkdir()
+        for i in range(10):
+            (tmp_path / c / f"{i}.jpg").write_bytes(b"")
+    train, val = dataset_split(str(tmp_path), {"a": 0, "b": 1})
+    assert len(train) == 16 and [p.rsplit("/", 1)[1] for p, _ in val] == ["0.jpg", "1.jpg"] * 2
+    assert validation_files(str(tmp_path), {"a": 0, "b": 1}) == val
@@ -0,0 +1,121 @@
+"""
+tests/test_deadline.py
+
+Verifies request deadlines: header parsing, and that expired requests and frames are
+dropped before inference and counted.
+"""
+
+import io
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+
+from core.deadline import Deadline
+from core.locks import PREDICTION_LOCK
+from core.streaming import FrameBatcher
+from app.main import app
+from app.services.model_manager import ModelManager
+
+client = TestClient(app)
+
+def jpeg():
+    _, buf = cv2.imencode(".jpg", np.zeros((32, 32, 3), dtype=np.uint8))
+    return {"file": ("x.jpg", io.BytesIO(buf.tobytes()), "image/jpeg")}
+
+def test_from_header_falls_back_to_default():
+    assert Deadline.from_header("250").budget_ms == 250.0
+    assert Deadline.from_header(None, default_ms=1000).budget_ms == 1000.0
+    assert Deadline.from_header("soon", default_ms=1000).budget_ms == 1000.0
+    assert Deadline(10, start=time.perf_counter() - 1).expired()
+
+def test_request_expired_in_lock_queue_skips_inference():
+    model = MagicMock()
+    model.input_shape = (None, 224, 224, 3)
+    model.predict.return_value = np.array([[0.9, 0.1]])
+    classes = {"0": "audi", "1": "bmw"}
+
+    def hold_lock():
+        with PREDICTION_LOCK:
+            time.sleep(0.3)
+
+    with patch.object(ModelManager, "get_model", return_value=(model, classes)):
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        time.sleep(0.05)
+        response = client.post("/predict", files=jpeg(), headers={"X-Request-Deadline-Ms": "100"})
+        holder.join()
+        assert response.status_code == 504
+        assert model.predict.call_count == 0
+
+        response = client.post("/predict", files=jpeg(), headers={"X-Request-Deadline-Ms": "5000"})
+        assert response.status_code == 200
+
+    metrics = client.get("/metrics").text
+    assert 'omnivision_deadline_expired_total{stage="queue"} 1' in metrics
+
+def test_expired_frames_are_answered_without_inference():
+    gate = threading.Event()
+    calls = []
+
+    def model(x, training=False):
+        gate.wait(5)
+        calls.append(len(x))
+        return MagicMock(numpy=lambda: np.tile([0.1, 0.9], (len(x), 1)))
+
+    fake = MagicMock(side_effect=model)
+    fake.input_shape = (None, 8, 8, 3)
+    batcher = FrameBatcher(lambda: (fake, {"0": "audi", "1": "bmw"}),
+                           lambda data, size: np.zeros((1, size[1], size[0], 3), np.float32), max_delay=0)
+    out = queue.Queue()
+    stream = batcher.open(out.put, budget_ms=50)
+
+    batcher.submit(stream, b"f0")
+    time.sleep(0.05)
+    batcher.submit(stream, b"f1")  # waits behind f0 and outlives its budget
+    time.sleep(0.1)
+    gate.set()
+    assert out.get(timeout=5)["seq"] == 0
+    batcher.release(stream)
+    late = out.get(timeout=5)
+    assert late["seq"] == 1 and late["expired"]
+    assert calls == [1]
+
+def test_lock_wait_does_not_block_event_loop():
+    import asyncio
+    import httpx
+
+    model = MagicMock()
+    model.input_shape = (None, 224, 224, 3)
+    model.predict.return_value = np.array([[0.9, 0.1]])
+    released = threading.Event()
+
+    def hold_lock():
+        with PREDICTION_LOCK:
+            released.wait(5)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            predict = asyncio.create_task(ac.post("/predict", files=jpeg()))
+            await asyncio.sleep(0.2)  # predict is now waiting for the lock
+            assert not predict.done()
+            health = await asyncio.wait_for(ac.get("/health"), timeout=2)
+            assert health.status_code == 200
+            assert "omnivision_inference_queue_depth 1" in (await ac.get("/metrics")).text
+            released.set()
+            return await predict
+
+    with patch.object(ModelManager, "get_model", return_value=(model, {"0": "audi", "1": "bmw"})):
+        holder = threading.Thread(target=hold_lock)
+        holder.start()
+        time.sleep(0.05)
+        try:
+            response = asyncio.run(scenario())
+        finally:
+            released.set()
+            holder.join()
+    assert response.status_code == 200
@@ -0,0 +1,54 @@
+"""
+tests/test_distill.py
+
+Verifies the distillation loss, soft-label tempering and the teacher soft-label cache.
+"""
+
+import os
+import cv2
+import numpy as np
+from unittest.mock import MagicMock
+
+from train.distill import soften, distillation_loss, SoftLabelCache, per_class_accuracy
+from core.cascade import dataset_split
+
+def test_soften_flattens_distribution():
+    probs = np.array([[0.9, 0.09, 0.01]])
+    np.testing.assert_allclose(soften(probs, 1.0), probs, atol=1e-6)
+    tempered = soften(probs, 4.0)
+    assert tempered[0, 0] < 0.9 and tempered[0, 2] > 0.01
+    np.testing.assert_allclose(tempered.sum(), 1.0, atol=1e-6)
+
+def test_distillation_loss_prefers_matching_teacher():
+    loss = distillation_loss(2, temperature=2.0, alpha=0.0)
+    teacher = soften(np.array([[0.8, 0.2]]), 2.0)
+    y_true = np.concatenate([[[1.0, 0.0]], teacher], axis=1).astype(np.float32)
+    matching = float(loss(y_true, np.array([[0.8, 0.2]], dtype=np.float32))[0])
+    overconfident = float(loss(y_true, np.array([[0.999, 0.001]], dtype=np.float32))[0])
+    assert matching < 1e-5 < overconfident
+
+def test_soft_label_cache_only_runs_teacher_on_misses(tmp_path):
+    data = tmp_path / "data"
+    for c in ("a", "b"):
+        os.makedirs(data / c)
+        for i in range(5):
+            img = np.full((16, 16, 3), i * 10 + (c == "b") * 100, dtype=np.uint8)
+            cv2.imwrite(str(data / c / f"{i}.png"), img)
+    train, val = dataset_split(str(data), {"a": 0, "b": 1})
+    assert len(train) == 8 and len(val) == 2 and val[0][0].endswith("0.png")
+
+    teacher = MagicMock()
+    teacher.input_shape = (None, 8, 8, 3)
+    teacher.side_effect = lambda x, training=False: MagicMock(numpy=lambda: np.tile([0.3, 0.7], (len(x), 1)))
+    paths = [p for p, _ in train]
+
+    first = SoftLabelCache(str(tmp_path / "cache"), "teacher1").get_or_compute(paths, teacher)
+    assert first.shape == (8, 2) and teacher.call_count == 1
+    again = SoftLabelCache(str(tmp_path / "cache"), "teacher1").get_or_compute(paths, teacher)
+    np.testing.assert_allclose(again, first)
+    assert teacher.call_count == 1
+
+def test_per_class_accuracy():
+    probs = np.array([[0.9, 0.1], [0.2, 0.8], [0.7, 0.3]])
+    labels = np.array([0, 1, 1])
+    np.testing.assert_allclose(per_class_accuracy(probs, labels, 2), [1.0, 0.5])
@@ -0,0 +1,80 @@
+"""
+tests/test_evaluate.py
+
+Verifies the offline evaluator: the streamed bincount confusion matrix and per-class
+report match sklearn's, calibration error matches a direct computation, and a tiny
+model evaluated over an image directory produces the file the report generator reads.
+"""
+
+import json
+import numpy as np
+import pytest
+import tensorflow as tf
+from PIL import Image
+from sklearn.metrics import confusion_matrix, classification_report as sk_report
+
+from scripts.evaluate import EvaluationAccumulator, classification_report, iter_split, evaluate, write_results
+
+def random_batches(n_classes=7, n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    logits = rng.normal(size=(n, n_classes))
+    probs = np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+    return probs, rng.integers(0, n_classes, n)
+
+def test_streamed_confusion_and_report_match_sklearn():
+    probs, labels = random_batches()
+    acc = EvaluationAccumulator(7, flush_size=64)
+    for start in range(0, len(labels), 50):
+        acc.update(probs[start:start + 50], labels[start:start + 50])
+    pred = probs.argmax(axis=1)
+    assert np.array_equal(acc.confusion(), confusion_matrix(labels, pred, labels=range(7)))
+
+    names = [f"c{i}" for i in range(7)]
+    ours = classification_report(acc.confusion(), names)
+    expected = sk_report(labels, pred, labels=range(7), target_names=names, output_dict=True, zero_division=0)
+    for key in names + ["macro avg", "weighted avg"]:
+        for metric in ("precision", "recall", "f1-score", "support"):
+            assert ours[key][metric] == pytest.approx(expected[key][metric])
+    assert ours["accuracy"] == pytest.approx(expected["accuracy"])
+
+def test_calibration_error():
+    probs, labels = random_batches(n_classes=3, seed=1)
+    acc = EvaluationAccumulator(3, n_bins=10)
+    acc.update(probs, labels)
+    cal = acc.calibration()
+
+    conf, correct = probs.max(axis=1), probs.argmax(axis=1) == labels
+    bins = np.minimum((conf * 10).astype(int), 9)
+    ece = sum(abs(correct[bins == b].mean() - conf[bins == b].mean()) * (bins == b).mean()
+              for b in range(10) if (bins == b).any())
+    assert cal["ece"] == pytest.approx(ece)
+    assert cal["nll"] == pytest.approx(-np.log(probs[np.arange(len(labels)), labels]).mean())
+    assert sum(b["count"] for b in cal["bins"]) == len(labels)
+
+def test_evaluate_image_directory(tmp_path):
+    rng = np.random.default_rng(0)
+    for name, value in (("audi", 20), ("bmw", 230)):
+        (tmp_path / "data" / name).mkdir(parents=True)
+        for i in range(10):
+            pixels = np.clip(value + rng.integers(-10, 10, (24, 24, 3)), 0, 255).astype(np.uint8)
+            Image.fromarray(pixels).save(tmp_path / "data" / name / f"{i}.png")
+    (tmp_path / "data" / "bmw" / "00_broken.png").write_bytes(b"not an image")
+
+    # Class 1 ("bmw") scores higher the brighter the image
+    inputs = tf.keras.Input(shape=(16, 16, 3))
+    brightness = tf.keras.layers.GlobalAveragePooling2D()(inputs)
+    logits = tf.keras.layers.Dense(2, activation="softmax", kernel_initializer=tf.keras.initializers.Constant(
+        [[-10.0, 10.0]] * 3), bias_initializer=tf.keras.initializers.Constant([15.0, -15.0]))(brightness)
+    model = tf.keras.Model(inputs, logits)
+
+    classes = {"0": "audi", "1": "bmw"}
+    items = list(iter_split(str(tmp_path / "data"), {"audi": 0, "bmw": 1}, split=0.5))
+    assert len(items) == 10  # five of each class, including the broken bmw file
+    results = evaluate(model, classes, items, batch_size=3, workers=2, prefetch=2)
+    assert results["matrix"] == [[5, 0], [0, 4]]
+    assert results["accuracy"] == 1.0 and results["evaluation"]["skipped"] == 1
+    assert results["report"]["bmw"]["support"] == 4
+
+    output = tmp_path / "static" / "confusion_matrix.json"
+    write_results(results, output)
+    assert json.loads(output.read_text())["classes"] == ["audi", "bmw"]
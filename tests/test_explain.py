@@ -0,0 +1,105 @@
+"""
+tests/test_explain.py
+
+Verifies Grad-CAM explanations: batched heatmaps match single-image ones, concurrent
+requests share a gradient pass, repeats are served from the cache, batches hold back while
+predictions hold the model, and /explain returns a PNG overlay or a float16 map.
+"""
+
+import io
+import base64
+import threading
+import time
+import cv2
+import numpy as np
+import tensorflow as tf
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from core.explain import ExplainService, gradcam, gradcam_layer
+from core.locks import PREDICTION_LOCK
+from app.main import app
+from app.routes import prepare_image, decode_image
+from app.services.model_manager import ModelManager
+
+client = TestClient(app)
+CLASSES = {"0": "audi", "1": "bmw"}
+
+def tiny_model():
+    tf.keras.utils.set_random_seed(0)
+    inputs = tf.keras.Input(shape=(32, 32, 3))
+    x = tf.keras.layers.Conv2D(8, 3, strides=2, activation="relu", name="features")(inputs)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    return tf.keras.Model(inputs, tf.keras.layers.Dense(2, activation="softmax")(x))
+
+MODEL = tiny_model()
+
+def jpeg(seed):
+    img = np.random.default_rng(seed).integers(0, 255, (48, 64, 3), dtype=np.uint8)
+    _, buf = cv2.imencode(".jpg", img)
+    return buf.tobytes()
+
+def preprocess(data, size):
+    return prepare_image(decode_image(data), size)
+
+def test_batched_heatmaps_match_single_images():
+    assert gradcam_layer(MODEL).name == "features"
+    x = np.random.default_rng(0).random((3, 32, 32, 3), dtype=np.float32)
+    cams, probs = gradcam(MODEL, x)
+    assert cams.shape == (3, 15, 15) and probs.shape == (3, 2)
+    assert 0 <= cams.min() and cams.max() <= 1
+    single, _ = gradcam(MODEL, x[1:2])
+    assert np.allclose(single[0], cams[1], atol=1e-5)
+
+def test_concurrent_requests_batch_and_repeats_hit_cache():
+    gate = threading.Event()
+    service = ExplainService(lambda: (gate.wait(5), (MODEL, CLASSES))[1], lambda: 1, preprocess, max_delay=0)
+    first = service.submit(jpeg(0))
+    while service._pending:  # the worker takes it and waits on the gate
+        time.sleep(0.01)
+    others = [service.submit(jpeg(i)) for i in (1, 2, 3)]
+    duplicate = service.submit(jpeg(1))
+    assert duplicate is others[0]
+    gate.set()
+
+    results = [f.result(timeout=30) for f in [first] + others]
+    assert all(r["heatmap"].dtype == np.float16 and not r["cached"] for r in results)
+    assert service.stats == {"hits": 0, "computed": 4, "batches": 2}
+
+    again = service.submit(jpeg(2))
+    assert again.done() and again.result()["cached"]
+    assert np.array_equal(again.result()["heatmap"], results[2]["heatmap"])
+
+def test_new_model_version_misses_cache():
+    version = [1]
+    service = ExplainService(lambda: (MODEL, CLASSES), lambda: version[0], preprocess, max_delay=0)
+    service.submit(jpeg(0)).result(timeout=30)
+    version[0] = 2
+    assert not service.submit(jpeg(0)).result(timeout=30)["cached"]
+    assert service.stats["computed"] == 2
+
+def test_batches_wait_while_prediction_holds_model():
+    service = ExplainService(lambda: (MODEL, CLASSES), lambda: 1, preprocess, max_delay=0, max_defer=10)
+    with PREDICTION_LOCK:
+        future = service.submit(jpeg(5))
+        time.sleep(0.3)
+        assert not future.done()
+    assert not future.result(timeout=30)["cached"]
+
+def test_explain_endpoint_png_and_map():
+    with patch.object(ModelManager, "get_model", return_value=(MODEL, CLASSES)):
+        response = client.post("/explain", files={"file": ("x.jpg", io.BytesIO(jpeg(7)), "image/jpeg")})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/png"
+        assert response.headers["x-explain-cache"] == "miss"
+        overlay = cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR)
+        assert overlay.shape == (48, 64, 3)
+
+        response = client.post("/explain?format=map", files={"file": ("x.jpg", io.BytesIO(jpeg(7)), "image/jpeg")})
+        body = response.json()
+        assert body["cached"] and body["shape"] == [15, 15]
+        heatmap = np.frombuffer(base64.b64decode(body["heatmap"]), dtype=np.float16).reshape(body["shape"])
+        assert 0 <= heatmap.min() and heatmap.max() <= 1
+
+        response = client.post("/explain", files={"file": ("x.jpg", io.BytesIO(b"not an image"), "image/jpeg")})
+        assert response.status_code == 400
@@ -0,0 +1,144 @@
+"""
+tests/test_feedback.py
+
+Verifies the /feedback ingestion path: JSON and multipart payloads,
+write-ahead logging and content-hash deduplication.
+"""
+
+import io
+import json
+import base64
+import hashlib
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import core.active_learning as active_learning
+from core.active_learning import FeedbackLog
+from app.services.training import TrainingService
+from app.main import app
+
+client = TestClient(app)
+
+def make_png(seed=0):
+    img = np.random.default_rng(seed).integers(0, 255, (64, 64, 3), dtype=np.uint8)
+    _, buf = cv2.imencode(".png", img)
+    return buf.tobytes()
+
+@pytest.fixture
+def feedback_log(tmp_path, monkeypatch):
+    log = FeedbackLog(log_path=tmp_path / "feedback.log", raw_dir=tmp_path / "raw")
+    monkeypatch.setattr(active_learning, "_feedback_log", log)
+    # Don't schedule real retrains from these requests
+    requested = []
+    monkeypatch.setattr(TrainingService, "request_training", lambda self, **kw: requested.append(kw))
+    log.requested_training = requested
+    return log
+
+def test_feedback_json_and_multipart_deduplicated(feedback_log, tmp_path):
+    img_bytes = make_png()
+    payload = {
+        "image_base64": base64.b64encode(img_bytes).decode("utf-8"),
+        "label": "unknown",
+        "is_correct": False,
+        "new_brand_name": "Sega",
+    }
+    response = client.post("/feedback?domain=cars", json=payload)
+    assert response.status_code == 200
+    assert response.json()["action"] == "queued"
+
+    # Same image again, this time as a binary upload
+    response = client.post(
+        "/feedback?domain=cars",
+        data={"label": "unknown", "is_correct": "false", "new_brand_name": "Sega"},
+        files={"file": ("sega.png", io.BytesIO(img_bytes), "image/png")},
+    )
+    assert response.status_code == 200
+
+    assert feedback_log.flush()
+    lines = (tmp_path / "feedback.log").read_text().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["target_label"] == "sega"
+
+    saved = list((tmp_path / "raw" / "cars" / "sega").iterdir())
+    assert len(saved) == 1
+    assert feedback_log.stats["duplicates"] == 1
+    assert [r["domain"] for r in feedback_log.requested_training] == ["cars", "cars"]
+
+def test_feedback_without_ground_truth_is_only_logged(feedback_log, tmp_path):
+    payload = {
+        "image_base64": base64.b64encode(make_png(1)).decode("utf-8"),
+        "label": "mazda",
+        "is_correct": False,
+    }
+    response = client.post("/feedback", json=payload)
+    assert response.status_code == 200
+    assert response.json()["action"] == "logged"
+
+    assert feedback_log.flush()
+    assert len((tmp_path / "feedback.log").read_text().splitlines()) == 1
+    assert not (tmp_path / "raw").exists()
+    assert feedback_log.requested_training == []
+
+def test_feedback_rejects_invalid_image(feedback_log):
+    payload = {
+        "image_base64": base64.b64encode(b"not an image").decode("utf-8"),
+        "label": "mazda",
+        "is_correct": True,
+    }
+    response = client.post("/feedback", json=payload)
+    assert response.status_code == 400
+
+@pytest.mark.parametrize("query, brand", [
+    ("domain=cars", "../../../escaped"),
+    ("domain=cars", "a/b"),
+    ("domain=../escaped", "sega"),
+    ("domain=tech", "sega"),
+])
+def test_feedback_rejects_paths_outside_dataset(feedback_log, tmp_path, query, brand):
+    payload = {
+        "image_base64": base64.b64encode(make_png(2)).decode("utf-8"),
+        "label": "unknown",
+        "is_correct": False,
+        "new_brand_name": brand,
+    }
+    response = client.post(f"/feedback?{query}", json=payload)
+    assert response.status_code == 400
+    assert feedback_log.flush()
+    assert not (tmp_path / "feedback.log").exists()
+    assert feedback_log.requested_training == []
+
+def test_feedback_target_dir_stays_under_raw(tmp_path):
+    assert active_learning.feedback_target_dir("cars", "land_rover", tmp_path) == (tmp_path / "cars" / "land_rover").resolve()
+    for label in ("..", "Sega", "sega\n", ""):
+        with pytest.raises(ValueError):
+            active_learning.feedback_target_dir("cars", label, tmp_path)
+
+def test_feedback_rejects_non_object_json(feedback_log):
+    response = client.post("/feedback", json=[{"label": "mazda", "is_correct": True}])
+    assert response.status_code == 400
+
+def test_spooled_batch_replayed_after_crash(tmp_path, monkeypatch):
+    log = FeedbackLog(log_path=tmp_path / "feedback.log", raw_dir=tmp_path / "raw")
+    record = {"domain": "cars", "target_label": "mazda", "sha256": "ab" * 32}
+    # Crash after the write-ahead step: the spool file is written but no image is stored
+    monkeypatch.setattr(FeedbackLog, "_apply", lambda self, r, img: (_ for _ in ()).throw(OSError("disk gone")))
+    with pytest.raises(OSError):
+        log._persist([(record, make_png(3))])
+    monkeypatch.undo()
+    assert len(list((tmp_path / "spool").iterdir())) == 1
+
+    restarted = FeedbackLog(log_path=tmp_path / "feedback.log", raw_dir=tmp_path / "raw")
+    assert restarted.recover() == 1
+    assert len(list((tmp_path / "raw" / "cars" / "mazda").iterdir())) == 1
+    assert not list((tmp_path / "spool").iterdir())
+    assert restarted.recover() == 0
+
+def test_dedupe_memory_is_bounded(tmp_path):
+    log = FeedbackLog(log_path=tmp_path / "feedback.log", raw_dir=tmp_path / "raw", dedupe_size=2)
+    for seed in range(4):
+        img = make_png(seed)
+        log._persist([({"domain": "cars", "target_label": "mazda", "sha256": hashlib.sha256(img).hexdigest()}, img)])
+    assert len(log._seen) == 2
+    assert log.stats["images_saved"] == 4
@@ -12,10 +12,18 @@ client = TestClient(app)
 
 DATA_PATH = BASE_DIR / "data" / "raw"
 # Ensure we have a clean slate for the ghost brand if possible, or we just rely on unique naming?
-# User specified "sega".
-DOMAIN = "tech"
+# User specified "sega". /feedback only accepts config.DOMAINS.
+DOMAIN = "cars"
 GHOST_BRAND = "sega"
 
+def test_ghost_loop_rejects_unconfigured_domain():
+    target_dir = DATA_PATH / "tech" / GHOST_BRAND
+    before = sorted(target_dir.glob("*")) if target_dir.exists() else []
+    payload = {"image_base64": "aGVsbG8=", "label": "unknown", "new_brand_name": GHOST_BRAND, "is_correct": False}
+    response = client.post("/feedback?domain=tech", json=payload)
+    assert response.status_code == 400
+    assert (sorted(target_dir.glob("*")) if target_dir.exists() else []) == before
+
 @pytest.mark.skipif(os.environ.get("CI") == "true", reason="Skipping E2E ghost loop in CI")
 def test_ghost_class_loop():
     print(f"\n[Ghost Loop] Starting test for brand: {GHOST_BRAND} in domain: {DOMAIN}")
@@ -0,0 +1,51 @@
+"""
+tests/test_load_generator.py
+
+Verifies the load generator's level summaries and saturation detection.
+"""
+
+import asyncio
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.qa.stress_test import closed_loop, open_loop, find_saturation
+
+class FakeResponse:
+    status_code = 200
+
+class FakeClient:
+    """Serves one request at a time in 10 ms, like a single inference worker."""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+
+    async def post(self, path, files=None):
+        async with self.lock:
+            await asyncio.sleep(0.01)
+        return FakeResponse()
+
+def test_closed_and_open_loop_summaries():
+    async def run():
+        client = FakeClient()
+        closed = await closed_loop(client, [b"img"], concurrency=2, duration=0.3)
+        opened = await open_loop(client, [b"img"], rate=20, duration=0.3)
+        return closed, opened
+
+    closed, opened = asyncio.run(run())
+    assert closed["error_rate"] == 0.0 and closed["requests"] > 5
+    assert closed["p50_ms"] <= closed["p99_ms"] <= closed["p999_ms"]
+    assert opened["offered_rps"] == 20 and opened["requests"] == 6
+
+def test_find_saturation():
+    levels = [
+        {"level": 1, "throughput_rps": 10.0, "error_rate": 0.0, "p99_ms": 100},
+        {"level": 2, "throughput_rps": 19.0, "error_rate": 0.0, "p99_ms": 110},
+        {"level": 4, "throughput_rps": 19.5, "error_rate": 0.0, "p99_ms": 220},
+    ]
+    assert find_saturation(levels)["level"] == 2
+    assert find_saturation(levels, slo_ms=105)["level"] == 1
+
+    errors = levels[:1] + [{"level": 2, "throughput_rps": 30.0, "error_rate": 0.2, "p99_ms": 50}]
+    assert "error rate" in find_saturation(errors)["reason"]
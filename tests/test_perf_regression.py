@@ -0,0 +1,56 @@
+"""
+tests/test_perf_regression.py
+
+Performance regression gate (see scripts/perf_gate.py).
+Baseline timings are rescaled by a reference workload timed in the same run, so the
+committed baseline gates other machines too. The timing gate takes ~20 s and is run by
+the CI perf-gate job (.github/workflows/main.yml):
+    OMNIVISION_PERF_GATE=1 pytest tests/test_perf_regression.py
+"""
+
+import os
+import sys
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.perf_gate import (REFERENCE_STAGE, compare_to_baseline, format_verdicts, load_baseline, median_mad,
+                               run_gate)
+
+def _stats(median, mad):
+    return {"median_ms": median, "mad_ms": mad}
+
+def test_median_mad_ignores_outliers():
+    median, mad = median_mad([10, 11, 9, 10, 250])
+    assert median == 10 and mad == 1
+
+def test_gate_flags_only_measurable_slowdowns():
+    baseline = {"quiet": _stats(10.0, 0.1), "noisy": _stats(10.0, 2.0), "faster": _stats(10.0, 0.1)}
+    current = {"quiet": _stats(13.0, 0.1), "noisy": _stats(13.0, 2.0), "faster": _stats(5.0, 0.1),
+               "new_stage": _stats(1.0, 0.0)}
+    verdicts = {v["stage"]: v for v in compare_to_baseline(current, baseline)}
+
+    # +30% with tight noise is a regression; the same shift inside the noise band is not
+    assert verdicts["quiet"]["regressed"]
+    assert not verdicts["noisy"]["regressed"]
+    assert not verdicts["faster"]["regressed"]
+    assert "new_stage" not in verdicts
+    assert "quiet" in format_verdicts(verdicts.values())
+
+def test_gate_rescales_baseline_to_machine_speed():
+    baseline = {REFERENCE_STAGE: _stats(10.0, 0.1), "stage": _stats(10.0, 0.1)}
+    # Everything twice as slow on this machine: not a regression
+    slower_host = {REFERENCE_STAGE: _stats(20.0, 0.2), "stage": _stats(21.0, 0.2)}
+    (verdict,) = compare_to_baseline(slower_host, baseline)
+    assert verdict["stage"] == "stage" and verdict["baseline_ms"] == 20.0 and not verdict["regressed"]
+    # Stage slowed down while the machine did not
+    same_host = {REFERENCE_STAGE: _stats(10.0, 0.1), "stage": _stats(21.0, 0.2)}
+    assert compare_to_baseline(same_host, baseline)[0]["regressed"]
+
+@pytest.mark.skipif(os.environ.get("OMNIVISION_PERF_GATE") != "1", reason="Set OMNIVISION_PERF_GATE=1 to run the timing gate")
+def test_no_stage_regressed():
+    baseline = load_baseline()
+    assert baseline is not None, "Record a baseline with: python scripts/perf_gate.py --update-baseline"
+    _, verdicts = run_gate(baseline["stages"])
+    regressed = [v for v in verdicts if v["regressed"]]
+    assert not regressed, "Performance regression:\n" + format_verdicts(verdicts)
@@ -0,0 +1,58 @@
+"""
+tests/test_profiling.py
+
+Verifies the Server-Timing header and the token-protected profiling endpoints.
+"""
+
+import io
+import cv2
+import numpy as np
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+
+from core import config
+from app.main import app
+from app.services.model_manager import ModelManager
+
+client = TestClient(app)
+
+def post_image():
+    model = MagicMock()
+    model.input_shape = (None, 224, 224, 3)
+    model.predict.return_value = np.array([[0.2, 0.8]])
+    _, buf = cv2.imencode(".jpg", np.zeros((32, 32, 3), dtype=np.uint8))
+    with patch.object(ModelManager, "get_model", return_value=(model, {"0": "opel", "1": "skoda"})):
+        return client.post("/predict", files={"file": ("x.jpg", io.BytesIO(buf.tobytes()), "image/jpeg")})
+
+def test_server_timing_only_when_enabled(monkeypatch):
+    monkeypatch.setattr(config, "SERVER_TIMING_ENABLED", False)
+    assert "server-timing" not in post_image().headers
+
+    monkeypatch.setattr(config, "SERVER_TIMING_ENABLED", True)
+    header = post_image().headers["server-timing"]
+    for stage in ("read", "decode", "preprocess", "queue_wait", "inference", "total"):
+        assert f"{stage};dur=" in header
+
+def test_admin_endpoints_hidden_without_token(monkeypatch):
+    monkeypatch.setattr(config, "ADMIN_TOKEN", None)
+    assert client.get("/admin/profile?seconds=0.1").status_code == 404
+
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "secret")
+    assert client.get("/admin/profile?seconds=0.1", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/admin/profile?seconds=0.1").status_code == 403
+
+def test_sampling_profile_and_tracemalloc(monkeypatch):
+    monkeypatch.setattr(config, "ADMIN_TOKEN", "secret")
+    headers = {"X-Admin-Token": "secret"}
+
+    response = client.get("/admin/profile?seconds=0.2&interval=0.01", headers=headers)
+    assert response.status_code == 200
+    lines = response.text.strip().splitlines()
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+    assert client.post("/admin/tracemalloc/start", headers=headers).json()["tracing"] is True
+    blob = [bytearray(1024) for _ in range(100)]
+    diff = client.get("/admin/tracemalloc/diff?limit=5", headers=headers).json()
+    assert len(diff["top"]) <= 5 and diff["traced_current_bytes"] > 0
+    assert client.post("/admin/tracemalloc/stop", headers=headers).json()["tracing"] is False
+    del blob
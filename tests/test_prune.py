@@ -0,0 +1,42 @@
+"""
+tests/test_prune.py
+
+Verifies channel selection and that structured pruning yields a smaller,
+functionally intact model.
+"""
+
+import numpy as np
+
+from train.train_cnn import build_model
+from train.prune import (keep_indices, prune_model, prunable_blocks, head_layers,
+                         magnitude_importance, count_flops, HEAD)
+
+def test_keep_indices_rounds_to_multiple_and_keeps_top_scores():
+    scores = np.arange(64, dtype=np.float32)
+    keep = keep_indices(scores, 0.5)
+    assert len(keep) == 32 and keep[0] == 32 and list(keep) == sorted(keep)
+    assert len(keep_indices(scores, 0.99)) == 8
+    assert len(keep_indices(scores, 0.0)) == 64
+
+def test_prune_model_is_physically_smaller():
+    model, _ = build_model(3, (64, 64), 0.35, 32, weights=None)
+    groups = prunable_blocks(model) + [HEAD]
+    assert len(groups) > 1
+    scores = magnitude_importance(model, groups)
+    pruned = prune_model(model, {g: keep_indices(scores[g], 0.5) for g in groups})
+
+    assert pruned.count_params() < model.count_params()
+    assert count_flops(pruned) < count_flops(model)
+    assert head_layers(pruned)[0].units == 16
+    x = np.random.default_rng(0).random((2, 64, 64, 3), dtype=np.float32)
+    out = pruned(x, training=False).numpy()
+    assert out.shape == (2, 3)
+    np.testing.assert_allclose(out.sum(axis=1), 1.0, atol=1e-5)
+
+def test_prune_model_keeping_everything_is_identity():
+    model, _ = build_model(2, (64, 64), 0.35, 16, weights=None)
+    groups = prunable_blocks(model)[:2] + [HEAD]
+    scores = magnitude_importance(model, groups)
+    same = prune_model(model, {g: keep_indices(scores[g], 0.0) for g in groups})
+    x = np.random.default_rng(1).random((1, 64, 64, 3), dtype=np.float32)
+    np.testing.assert_allclose(same(x, training=False).numpy(), model(x, training=False).numpy(), atol=1e-5)
@@ -13,7 +13,8 @@ import sys
 # Add project root to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from scripts.refinery import deduplicate_class, augment_class, compute_phash
+from scripts.refinery import deduplicate_class, augment_class, compute_phash, run_refinery
+from core.augmentation import load_manifest, apply_recipe, apply_recipes_batch
 
 class TestDataRefinery(unittest.TestCase):
     def setUp(self):
@@ -63,5 +64,54 @@ class TestDataRefinery(unittest.TestCase):
         aug_files = [f for f in files if f.startswith("aug_")]
         self.assertEqual(len(aug_files), 4)
 
+    def test_virtual_augmentation(self):
+        # Virtual mode records recipes instead of writing aug_* files
+        run_refinery(self.test_dir, virtual=True)
+        
+        self.assertEqual(os.listdir(self.class_dir), ["img1.png"])
+        
+        recipes = load_manifest(self.test_dir)
+        self.assertEqual(len(recipes["class_A"]), 99)
+        self.assertTrue(all(r["source"] == "img1.png" for r in recipes["class_A"]))
+
+    def test_batch_recipes_match_single(self):
+        img = np.random.randint(0, 255, (32, 32, 3), dtype=np.uint8)
+        recipes = [
+            {"angle": 10.0, "alpha": 1.1, "beta": -20.0, "blur": 0},
+            {"angle": -5.0, "alpha": 0.9, "beta": 15.0, "blur": 3},
+        ]
+        batch = apply_recipes_batch(np.stack([img, img]), recipes)
+        for out, r in zip(batch, recipes):
+            np.testing.assert_array_equal(out, apply_recipe(img, r))
+
+    def test_virtual_batches_interleaved_and_transformed(self):
+        from tensorflow.keras.preprocessing.image import ImageDataGenerator
+        from train.train_cnn import ManifestAugmentedSequence
+
+        for i in range(2, 9):
+            cv2.imwrite(os.path.join(self.class_dir, f"img{i}.png"), self.img)
+        os.makedirs(os.path.join(self.test_dir, "class_B"))
+        cv2.imwrite(os.path.join(self.test_dir, "class_B", "img1.png"), self.img + 255)
+        recipes = {"class_B": [{"source": "img1.png", "angle": 0.0, "alpha": 1.0, "beta": 0.0, "blur": 0}] * 6}
+
+        datagen = ImageDataGenerator(rescale=1./255, horizontal_flip=True)
+        base = datagen.flow_from_directory(self.test_dir, target_size=(16, 16), batch_size=3)
+        seq = ManifestAugmentedSequence(base, self.test_dir, recipes, seed=0, img_size=(16, 16))
+        self.assertEqual(len(seq), 3 + 2)
+
+        virtual_positions = set()
+        for _ in range(6):
+            virtual_positions.update(np.flatnonzero(seq.order >= len(base)).tolist())
+            seq.on_epoch_end()
+        self.assertGreater(len(virtual_positions), 2)  # not always the last two batches
+
+        calls = []
+        original = datagen.random_transform
+        datagen.random_transform = lambda x, seed=None: (calls.append(x.shape), original(x))[1]
+        x, y = seq[int(np.flatnonzero(seq.order >= len(base))[0])]
+        self.assertEqual(len(calls), 3)
+        self.assertTrue(np.allclose(x, 1.0))
+        self.assertTrue((y[:, base.class_indices["class_B"]] == 1).all())
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,73 @@
+"""
+tests/test_search.py
+
+Verifies the pyramid tiling, early stop, latency cap and the /predict/search endpoint.
+"""
+
+import io
+import time
+import cv2
+import numpy as np
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+
+from core.search import search_boxes, search_image
+from app.main import app
+from app.services.model_manager import ModelManager
+
+CLASSES = {"0": "background", "1": "mazda"}
+
+class BrightnessModel:
+    """
+    Fake classifier: P(mazda) is the mean brightness of the crop.
+    """
+    input_shape = (None, 32, 32, 3)
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def __call__(self, x, training=False):
+        time.sleep(self.delay)
+        x = np.asarray(x)
+        self.batches.append(len(x))
+        m = x.mean(axis=(1, 2, 3))
+        probs = np.stack([1.0 - m, m], axis=1)
+        return MagicMock(numpy=lambda: probs)
+
+def street_photo():
+    image = np.zeros((480, 640, 3), dtype=np.uint8)
+    image[300:460, 460:620] = 255  # small "logo" in the bottom-right corner
+    return image
+
+def test_tile_count_adapts_to_image_size_and_cap():
+    small, large = search_boxes(224, 224), search_boxes(640, 480)
+    assert len(small) < len(large)
+    assert list(large[0]) == [0.0, 0.0, 1.0, 1.0]
+    assert large.min() >= 0.0 and large.max() <= 1.0 + 1e-6
+    assert len(search_boxes(4000, 3000, max_tiles=20)) <= 20
+
+def test_search_finds_small_logo_and_stops_early():
+    model = BrightnessModel()
+    result = search_image(model, street_photo(), CLASSES, threshold=0.7, batch_size=8)
+    assert result["label"] == "mazda" and result["confidence"] >= 0.7
+    assert result["stopped"] == "confident"
+    assert result["tiles_evaluated"] < result["tiles_total"]
+    x1, y1, x2, y2 = result["box"]
+    assert x1 < 620 and x2 > 460 and y1 < 460 and y2 > 300
+    assert all(n <= 8 for n in model.batches)
+
+def test_search_respects_latency_cap():
+    model = BrightnessModel(delay=0.05)
+    result = search_image(model, street_photo(), CLASSES, threshold=1.1, max_latency_ms=60, batch_size=4)
+    assert result["stopped"] == "latency"
+    assert result["passes"] == 1
+
+def test_search_endpoint_returns_box():
+    _, buf = cv2.imencode(".png", street_photo())
+    with patch.object(ModelManager, "get_model", return_value=(BrightnessModel(), CLASSES)):
+        response = TestClient(app).post("/predict/search?threshold=0.7",
+                                        files={"file": ("x.png", io.BytesIO(buf.tobytes()), "image/png")})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["label"] == "Mazda" and len(body["box"]) == 4 and body["stopped"] == "confident"
@@ -0,0 +1,96 @@
+"""
+tests/test_streaming.py
+
+Verifies stale-frame dropping, cross-connection batching and the /ws/predict endpoint.
+"""
+
+import queue
+import threading
+import cv2
+import numpy as np
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+
+from core.streaming import FrameBatcher
+from app.main import app
+from app.services.model_manager import ModelManager
+
+CLASSES = {"0": "audi", "1": "bmw"}
+
+class GatedModel:
+    """
+    Fake model whose forward pass waits for `gate`; records batch sizes.
+    """
+    input_shape = (None, 8, 8, 3)
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.entered = threading.Event()
+        self.batches = []
+
+    def __call__(self, x, training=False):
+        self.entered.set()
+        self.gate.wait(5)
+        self.batches.append(len(x))
+        probs = np.tile([0.1, 0.9], (len(x), 1))
+        return MagicMock(numpy=lambda: probs)
+
+def make_batcher(model):
+    return FrameBatcher(lambda: (model, CLASSES), lambda data, size: np.zeros((1, size[1], size[0], 3), np.float32),
+                        max_batch=8, max_delay=0.01)
+
+def test_stale_frames_are_dropped_and_results_stay_ordered():
+    model = GatedModel()
+    batcher = make_batcher(model)
+    out = queue.Queue()
+    stream = batcher.open(out.put)
+
+    assert batcher.submit(stream, b"f0") == 0
+    assert model.entered.wait(5)
+    for i in range(1, 5):
+        batcher.submit(stream, f"f{i}".encode())
+    model.gate.set()
+
+    first = out.get(timeout=5)
+    assert first["seq"] == 0 and first["label"] == "Bmw"
+    # The next frame only runs once the previous result is sent
+    assert out.empty()
+    batcher.release(stream)
+    second = out.get(timeout=5)
+    assert second["seq"] == 4 and second["dropped"] == 3
+    batcher.close(stream)
+
+def test_pending_frames_of_all_connections_share_one_batch():
+    model = GatedModel()
+    batcher = make_batcher(model)
+    outs = [queue.Queue() for _ in range(4)]
+    streams = [batcher.open(q.put) for q in outs]
+
+    batcher.submit(streams[0], b"warmup")
+    assert model.entered.wait(5)
+    for s in streams[1:]:
+        batcher.submit(s, b"frame")
+    model.gate.set()
+
+    assert outs[0].get(timeout=5)["seq"] == 0
+    for q in outs[1:]:
+        assert q.get(timeout=5)["seq"] == 0
+    assert model.batches == [1, 3]
+
+def test_ws_predict_streams_results():
+    model = MagicMock()
+    model.input_shape = (None, 16, 16, 3)
+    model.side_effect = lambda x, training=False: MagicMock(numpy=lambda: np.tile([0.2, 0.8], (len(x), 1)))
+    _, buf = cv2.imencode(".jpg", np.zeros((20, 20, 3), dtype=np.uint8))
+
+    with patch.object(ModelManager, "get_model", return_value=(model, CLASSES)):
+        with TestClient(app).websocket_connect("/ws/predict") as ws:
+            seqs = []
+            for _ in range(3):
+                ws.send_bytes(buf.tobytes())
+                reply = ws.receive_json()
+                assert reply["label"] == "Bmw"
+                seqs.append(reply["seq"])
+            assert seqs == [0, 1, 2]
+            ws.send_bytes(b"not an image")
+            assert "error" in ws.receive_json()
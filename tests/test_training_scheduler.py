@@ -0,0 +1,192 @@
+"""
+tests/test_training_scheduler.py
+
+Verifies the coalescing, per-domain retraining queue, the worker and promotion.
+"""
+
+import os
+import json
+import threading
+import pytest
+from app.services.training import TrainingScheduler, TrainingBusy, PRIORITY_LOW, PRIORITY_HIGH
+
+class FakeRunner:
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, domain):
+        self.calls.append(domain)
+        self.release.wait(5)
+        return True
+
+def test_burst_coalesces_into_one_job(tmp_path):
+    runner = FakeRunner()
+    scheduler = TrainingScheduler(runner, state_path=str(tmp_path / "queue.json"), debounce=0.2)
+
+    for _ in range(20):
+        job = scheduler.request("cars", priority=PRIORITY_LOW, reason="feedback")
+    scheduler.request("cars", priority=PRIORITY_HIGH, reason="manual")
+
+    assert job.requests == 21
+    assert job.priority == PRIORITY_HIGH
+    assert scheduler.wait_idle(timeout=5)
+    assert runner.calls == ["cars"]
+    assert scheduler.snapshot()["finished"][0]["status"] == "succeeded"
+
+def test_request_during_training_runs_again(tmp_path):
+    runner = FakeRunner()
+    runner.release.clear()
+    scheduler = TrainingScheduler(runner, state_path=str(tmp_path / "queue.json"), debounce=0)
+
+    scheduler.request("cars")
+    while not scheduler.snapshot()["running"]:
+        pass
+    # Arrives mid-retrain: must not be dropped
+    scheduler.request("cars", reason="feedback")
+    assert len(scheduler.snapshot()["queued"]) == 1
+
+    runner.release.set()
+    assert scheduler.wait_idle(timeout=5)
+    assert runner.calls == ["cars", "cars"]
+
+def test_progress_attached_to_running_job(tmp_path):
+    runner = FakeRunner()
+    runner.release.clear()
+    scheduler = TrainingScheduler(runner, state_path=str(tmp_path / "queue.json"), debounce=0)
+    scheduler.request("cars")
+    while not scheduler.snapshot()["running"]:
+        pass
+
+    version = scheduler.version
+    scheduler.update_progress("cars", {"event": "progress", "phase": "head", "images_per_sec": 42.0})
+    assert scheduler.version > version
+    running = scheduler.snapshot("cars")["running"][0]
+    assert running["progress"]["images_per_sec"] == 42.0
+    assert scheduler.snapshot("food")["running"] == []
+
+    scheduler.update_progress("cars", {"event": "done", "ok": True, "metrics": {"val_accuracy": 0.9}})
+    runner.release.set()
+    assert scheduler.wait_idle(timeout=5)
+    assert scheduler.snapshot()["finished"][0]["metrics"] == {"val_accuracy": 0.9}
+
+def test_busy_job_is_requeued_not_failed(tmp_path):
+    outcomes = [TrainingBusy("manual run"), True]
+    calls = []
+
+    def runner(domain):
+        calls.append(domain)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    scheduler = TrainingScheduler(runner, state_path=str(tmp_path / "queue.json"), debounce=0.1)
+    scheduler.request("cars", reason="feedback")
+    assert scheduler.wait_idle(timeout=5)
+    assert calls == ["cars", "cars"]
+    finished = scheduler.snapshot()["finished"]
+    assert [j["status"] for j in finished] == ["succeeded"]
+    assert finished[0]["reasons"] == ["feedback"]
+
+def test_unconfigured_domains_rejected(tmp_path):
+    state_path = str(tmp_path / "queue.json")
+    with open(state_path, "w") as f:
+        json.dump({"pending": [{"domain": "tech"}, {"domain": "cars"}], "running": []}, f)
+    scheduler = TrainingScheduler(FakeRunner(), state_path=state_path, debounce=60, domains={"cars": []})
+    assert [j["domain"] for j in scheduler.snapshot()["queued"]] == ["cars"]
+    with pytest.raises(ValueError):
+        scheduler.request("tech")
+
+def test_jobs_endpoint_lists_jobs():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    response = TestClient(app).get("/train/jobs?domain=cars")
+    assert response.status_code == 200
+    assert set(response.json()) == {"queued", "running", "finished"}
+
+def test_pending_jobs_survive_restart(tmp_path):
+    state_path = str(tmp_path / "queue.json")
+    runner = FakeRunner()
+    scheduler = TrainingScheduler(runner, state_path=state_path, debounce=60)
+    scheduler.request("cars", reason="feedback")
+
+    with open(state_path) as f:
+        assert json.load(f)["pending"][0]["domain"] == "cars"
+
+    restored = TrainingScheduler(FakeRunner(), state_path=state_path, debounce=60)
+    queued = restored.snapshot()["queued"]
+    assert [j["domain"] for j in queued] == ["cars"]
+    assert queued[0]["reasons"] == ["feedback"]
+
+def test_worker_process_reports_failure(tmp_path):
+    from train.worker import run_in_subprocess
+
+    events = []
+    result = run_in_subprocess("no_such_domain", str(tmp_path / "staging"), on_event=events.append,
+                               threads=None, cpus=None, nice=None)
+
+    assert result["ok"] is False
+    assert "FileNotFoundError" in result["error"]
+    assert [e["event"] for e in events] == ["started", "done"]
+    assert not (tmp_path / "staging").exists()
+
+def test_promotion_limited_to_served_domain(tmp_path, monkeypatch):
+    import train.worker as worker
+
+    served, classes = tmp_path / "served.h5", tmp_path / "served.json"
+    monkeypatch.setattr(worker, "MODEL_PATH", served)
+    monkeypatch.setattr(worker, "CLASS_INDICES_PATH", classes)
+    monkeypatch.setattr(worker, "staging_paths", lambda d: {"model": os.path.join(d, "m.h5"),
+                                                            "classes": os.path.join(d, "c.json")})
+    staging = tmp_path / "staging"
+    staging.mkdir()
+    (staging / "m.h5").write_text("model")
+    (staging / "c.json").write_text("{}")
+
+    with pytest.raises(ValueError):
+        worker.promote_artifact(str(staging), "tech")
+    assert not served.exists()
+
+    worker.promote_artifact(str(staging), "cars")
+    assert served.read_text() == "model" and classes.read_text() == "{}"
+    assert not staging.exists()
+
+def test_promoted_model_loads_outside_prediction_lock(monkeypatch):
+    import train.worker as worker
+    import core.dl_loader as dl_loader
+    from app.services import training
+    from app.services.training import TrainingService
+    from app.services.model_manager import ModelManager
+    from core.locks import PREDICTION_LOCK
+
+    locked_during = {}
+    def record(step, result=None):
+        def fn(*args, **kwargs):
+            locked_during[step] = PREDICTION_LOCK.locked()
+            return result
+        return fn
+
+    monkeypatch.setattr(training, "TRAINING_OUT_OF_PROCESS", False)
+    monkeypatch.setattr(worker, "run_worker", lambda *a, **k: {"event": "done", "ok": True})
+    monkeypatch.setattr(worker, "promote_artifact", record("promote"))
+    monkeypatch.setattr(dl_loader, "load_trained_model", record("load", ("model", {"0": "audi"})))
+    monkeypatch.setattr(ModelManager, "install_model", record("install"))
+
+    service = object.__new__(TrainingService)
+    service.training_lock = threading.Lock()
+    assert service._run_scheduled_job("cars") is True
+    assert locked_during == {"load": False, "promote": True, "install": True}
+
+def test_worker_applies_tuned_hyperparams(tmp_path):
+    from train.worker import tuned_train_kwargs
+    from train.train_cnn import HYPERPARAMS_FORMAT
+
+    path = tmp_path / "hyperparams.json"
+    assert tuned_train_kwargs(path) == {}
+    path.write_text(json.dumps({"format": HYPERPARAMS_FORMAT, "best": {
+        "img_size": [160, 160], "head_units": 256, "dropout": 0.3, "head_lr": 1e-3}}))
+    assert tuned_train_kwargs(path) == {"head_units": 256, "dropout": 0.3, "head_lr": 1e-3}
+    assert tuned_train_kwargs(path, tuned_img_size=True)["img_size"] == (160, 160)
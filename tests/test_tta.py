@@ -0,0 +1,53 @@
+"""
+tests/test_tta.py
+
+Verifies the batched test-time augmentation views and the /predict rescue path.
+"""
+
+import io
+import cv2
+import numpy as np
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+
+from core.tta import build_tta_batch, combine_views
+from app.main import app
+from app.services.model_manager import ModelManager
+
+client = TestClient(app)
+
+def test_tta_batch_views():
+    x = np.random.default_rng(0).random((1, 32, 32, 3), dtype=np.float32)
+    batch = build_tta_batch(x).numpy()
+    assert batch.shape == (8, 32, 32, 3)
+    np.testing.assert_allclose(batch[0], x[0], atol=1e-5)
+    np.testing.assert_allclose(batch[4], x[0, :, ::-1], atol=1e-5)
+
+def test_combine_views_averages_log_probs():
+    probs = np.array([[0.6, 0.4], [0.6, 0.4]])
+    np.testing.assert_allclose(combine_views(probs), [[0.6, 0.4]], atol=1e-6)
+    combined = combine_views(np.array([[0.9, 0.1], [0.1, 0.9]]))
+    np.testing.assert_allclose(combined, [[0.5, 0.5]], atol=1e-6)
+
+def test_predict_rescues_low_confidence_with_one_pass():
+    model = MagicMock()
+    model.input_shape = (None, 224, 224, 3)
+    model.predict.return_value = np.array([[0.35, 0.33, 0.32]])
+    views = np.tile([[0.1, 0.8, 0.1]], (8, 1))
+    model.return_value.numpy.return_value = views
+    classes = {"0": "background", "1": "mazda", "2": "opel"}
+
+    _, buf = cv2.imencode(".jpg", np.zeros((50, 50, 3), dtype=np.uint8))
+    with patch.object(ModelManager, "get_model", return_value=(model, classes)):
+        response = client.post("/predict?tta=true", files={"file": ("x.jpg", io.BytesIO(buf.tobytes()), "image/jpeg")})
+        assert response.status_code == 200
+        assert response.json()["label"] == "Mazda"
+        # A single forward pass over all 8 views
+        assert model.call_count == 1
+        assert model.call_args[0][0].shape[0] == 8
+
+        response = client.post("/predict?tta=false", files={"file": ("x.jpg", io.BytesIO(buf.tobytes()), "image/jpeg")})
+        assert response.json()["label"] == "Uncertain"
+        assert model.call_count == 1
+
+    assert 'omnivision_tta_total{outcome="rescued"} 1' in client.get("/metrics").text
@@ -0,0 +1,87 @@
+"""
+tests/test_tune_hyperparams.py
+
+Verifies the CNN hyperparameter search: ASHA promotes only the top 1/eta of each rung,
+head-only trials learn from cached features, the results file is what
+train_cnn.load_hyperparams reads, and /predict follows a tuned input size.
+"""
+
+import io
+import os
+import json
+import cv2
+import numpy as np
+import pytest
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+
+from scripts.tune_hyperparams import ASHA, _InlineExecutor, run_asha, evaluate_head
+from train.train_cnn import load_hyperparams, variant_hyperparams, HYPERPARAMS_FORMAT
+from app.main import app
+from app.services.model_manager import ModelManager
+
+def test_asha_promotes_top_third():
+    values = iter(range(8, -1, -1))  # the first trial is the best
+    asha = ASHA(lambda: {"value": next(values)}, n_trials=9, min_epochs=1, max_epochs=9, eta=3)
+    assert asha.budgets == [1, 3, 9]
+    runs = []
+    while (job := asha.next_job()) is not None:
+        trial, rung = job
+        runs.append((trial["id"], asha.budgets[rung]))
+        asha.report(trial, rung, trial["config"]["value"] / 10)
+
+    assert sum(1 for _, epochs in runs if epochs == 3) == 3
+    assert [tid for tid, epochs in runs if epochs == 9] == [0]
+    best, score, epochs = asha.best()
+    assert best["id"] == 0 and epochs == 9 and score == pytest.approx(0.8)
+
+def make_cache(path, n=60, dim=16, classes=3):
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(classes, dim)) * 3
+    os.makedirs(path)
+    for split in ("train", "val"):
+        y = np.arange(n) % classes
+        np.save(os.path.join(path, f"f_{split}.npy"), (centers[y] + rng.normal(size=(n, dim))).astype(np.float32))
+        np.save(os.path.join(path, f"y_{split}.npy"), y)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"classes": ["a", "b", "c"]}, f)
+    return str(path)
+
+def test_head_trials_on_cached_features(tmp_path):
+    cache = make_cache(tmp_path / "96x96")
+    configs = iter([{"img_size": [96, 96], "head_units": units, "dropout": 0.1, "head_lr": lr}
+                    for units, lr in ((0, 1e-2), (64, 1e-2), (0, 1e-6))])
+    asha = ASHA(lambda: next(configs), n_trials=3, min_epochs=2, max_epochs=6, eta=3)
+    best, score, epochs = run_asha(asha, _InlineExecutor(), 0, evaluate_head, {(96, 96): cache})
+    assert epochs == 6 and score > 0.9
+    assert best["config"]["head_lr"] == 1e-2
+
+def test_load_hyperparams(tmp_path):
+    path = tmp_path / "hyperparams.json"
+    path.write_text(json.dumps({"format": HYPERPARAMS_FORMAT, "best": {
+        "img_size": [160, 160], "head_units": 256, "dropout": 0.3, "head_lr": 1e-3,
+        "fine_tune_lr": 1e-5, "fine_tune_at": 120, "head_epochs": 3}}))
+    params = load_hyperparams(path)
+    assert params["img_size"] == (160, 160) and params["fine_tune_at"] == 120
+    assert "head_epochs" not in params
+
+    path.write_text(json.dumps({"best_k": 500}))
+    with pytest.raises(ValueError):
+        load_hyperparams(path)
+
+def test_predict_sizes_input_from_tuned_model():
+    # A tuned img_size is trained into the served model; /predict must resize to it
+    model = MagicMock()
+    model.input_shape = (None, 160, 160, 3)
+    model.predict.return_value = np.array([[0.2, 0.8]])
+    _, buf = cv2.imencode(".jpg", np.zeros((48, 64, 3), dtype=np.uint8))
+    with patch.object(ModelManager, "get_model", return_value=(model, {"0": "audi", "1": "bmw"})):
+        response = TestClient(app).post("/predict", files={"file": ("x.jpg", io.BytesIO(buf.tobytes()), "image/jpeg")})
+    assert response.status_code == 200
+    assert model.predict.call_args[0][0].shape == (1, 160, 160, 3)
+
+def test_variant_hyperparams_keep_other_variants_architecture():
+    tuned = {"img_size": (160, 160), "head_units": 256, "dropout": 0.3, "head_lr": 1e-3, "fine_tune_at": 120}
+    assert variant_hyperparams(tuned, "full") == tuned
+    for variant in ("small", "r128"):
+        assert variant_hyperparams(tuned, variant) == {"dropout": 0.3, "head_lr": 1e-3, "fine_tune_at": 120}
@@ -0,0 +1,81 @@
+"""
+tests/test_variants.py
+
+Verifies latency-budget mapping, resolution selection in /predict and that the served
+model is offered under its actual input size.
+"""
+
+import io
+import cv2
+import numpy as np
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+
+from core.variants import pick_variant
+from app.main import app
+from app.services.model_manager import ModelManager
+
+client = TestClient(app)
+
+TABLE = {
+    96: {"p95_ms": 4.0, "accuracy": 0.80},
+    128: {"p95_ms": 6.0, "accuracy": 0.86},
+    160: {"p95_ms": 9.0, "accuracy": 0.86},
+    224: {"p95_ms": 15.0, "accuracy": 0.90},
+}
+
+def test_pick_variant():
+    available = [96, 128, 160, 224]
+    assert pick_variant(100, available, TABLE) == 224
+    # Equal accuracy: the larger resolution wins
+    assert pick_variant(10, available, TABLE) == 160
+    assert pick_variant(5, available, TABLE) == 96
+    # Nothing fits: fastest available
+    assert pick_variant(1, [128, 224], TABLE) == 128
+    # Unmeasured variants can't be mapped
+    assert pick_variant(10, [96], {}) is None
+
+def _upload():
+    _, buf = cv2.imencode(".jpg", np.zeros((50, 50, 3), dtype=np.uint8))
+    return {"file": ("x.jpg", io.BytesIO(buf.tobytes()), "image/jpeg")}
+
+def test_predict_serves_requested_variant():
+    default, small = MagicMock(), MagicMock()
+    small.input_shape = (None, 96, 96, 3)
+    small.return_value.numpy.return_value = np.array([[0.1, 0.9]])
+    classes = {"0": "background", "1": "mazda"}
+
+    with patch.object(ModelManager, "get_model", return_value=(default, classes)), \
+         patch.object(ModelManager, "get_variant", return_value=(small, classes)) as get_variant, \
+         patch.object(ModelManager, "variant_for_budget", return_value=96):
+        response = client.post("/predict?resolution=96", files=_upload())
+        assert response.status_code == 200
+        assert response.headers["X-Model-Variant"] == "96"
+        assert small.call_args[0][0].shape == (1, 96, 96, 3)
+        default.predict.assert_not_called()
+
+        response = client.post("/predict?latency_budget_ms=5", files=_upload())
+        assert response.status_code == 200 and response.headers["X-Model-Variant"] == "96"
+        get_variant.assert_called_with(96)
+
+        assert client.post("/predict?resolution=100", files=_upload()).status_code == 400
+
+    with patch.object(ModelManager, "get_model", return_value=(default, classes)), \
+         patch.object(ModelManager, "get_variant", return_value=(None, None)):
+        assert client.post("/predict?resolution=128", files=_upload()).status_code == 404
+
+def test_served_model_is_keyed_by_its_input_size(tmp_path):
+    # A tuned retrain serves a 160px model from MODEL_PATH; a 224 request must not get it
+    served = MagicMock()
+    served.input_shape = (None, 160, 160, 3)
+    classes = {"0": "background", "1": "mazda"}
+    paths = lambda r: {"model": tmp_path / f"model_{r}.h5", "classes": tmp_path / f"classes_{r}.json"}
+    manager = ModelManager()
+
+    with patch.object(manager, "_model", served), patch.object(manager, "_classes", classes), \
+         patch.object(manager, "_variants", {}), \
+         patch("app.services.model_manager.variant_paths", paths):
+        assert manager.served_resolution() == 160
+        assert manager.available_variants() == [160]
+        assert manager.get_variant(160) == (served, classes)
+        assert manager.get_variant(224) == (None, None)
@@ -0,0 +1,42 @@
+"""
+tests/test_visualizer.py
+
+Verifies the visual-word montage: bounded per-image scan results, and identical
+montages from the in-process and process-pool scans.
+"""
+
+import cv2
+import joblib
+import numpy as np
+from types import SimpleNamespace
+
+from core import visualizer
+from core.vision_logic import extract_sift_features
+
+def make_dataset(tmp_path, n=6):
+    rng = np.random.default_rng(0)
+    for i in range(n):
+        img = rng.integers(0, 255, (96, 128, 3), dtype=np.uint8)
+        cv2.circle(img, (40 + 5 * i, 50), 20, (255, 255, 255), -1)
+        cv2.imwrite(str(tmp_path / f"img_{i}.jpg"), img)
+    gray = cv2.cvtColor(cv2.imread(str(tmp_path / "img_0.jpg")), cv2.COLOR_BGR2GRAY)
+    _, descriptors = extract_sift_features(gray)
+    codebook = tmp_path / "vocabulary.pkl"
+    joblib.dump(SimpleNamespace(cluster_centers_=descriptors[:12]), codebook)
+    return codebook, descriptors[:12]
+
+def test_scan_keeps_at_most_per_word_patches(tmp_path):
+    _, centers = make_dataset(tmp_path, n=1)
+    visualizer._init_scanner(centers, list(range(12)), 2, 8)
+    found = visualizer._scan_image(str(tmp_path / "img_0.jpg"))
+    assert found and all(len(p) <= 2 for p in found.values())
+    # Each center is itself a descriptor of this image, so its nearest patch is an exact match
+    assert all(min(d for d, _ in patches) < 1.0 for patches in found.values())
+
+def test_pool_and_in_process_montages_match(tmp_path):
+    codebook, _ = make_dataset(tmp_path)
+    kwargs = dict(save_path=None, num_words=4, patch_size=8, per_word=5, codebook_path=codebook)
+    serial = visualizer.generate_visual_word_montage([str(tmp_path)], workers=0, **kwargs)
+    pooled = visualizer.generate_visual_word_montage([str(tmp_path)], workers=2, **kwargs)
+    assert serial.shape == (2 * 8, 4 * 3 * 8, 3)
+    assert np.array_equal(serial, pooled)
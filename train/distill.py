@@ -0,0 +1,294 @@
+"""
+train/distill.py
+
+Responsibility:
+    - Knowledge distillation: trains a smaller student (MobileNetV2 width, input size
+      and head configurable) against the production model's soft labels.
+    - Teacher outputs are computed once per image and cached on disk, keyed by the
+      teacher artifact's hash and each image's content hash, so epochs (and reruns)
+      never call the teacher again.
+    - Writes a serving-compatible artifact (.h5 + class indices) and a report comparing
+      student and teacher latency, size and per-class accuracy.
+
+Usage:
+    python train/distill.py --alpha 0.5 --head_units 0 --epochs 10
+    python train/distill.py --img_size 160 --output models/car_brand_model_160.h5 \\
+        --classes_output models/class_indices_160.json   # serve as a resolution variant
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from PIL import Image
+import tensorflow as tf
+from tensorflow.keras.optimizers import Adam
+from tensorflow.keras.callbacks import EarlyStopping
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import BASE_DIR, MODELS_DIR, MODEL_PATH, CLASS_INDICES_PATH, IMG_SIZE, BATCH_SIZE, METRICS_DIR
+from core.augmentation import file_hash
+from core.cascade import model_input_size, dataset_split
+from core.inference import forward
+from train.train_cnn import build_model, ProgressCallback
+
+STUDENT_MODEL_PATH = MODELS_DIR / "car_brand_model_student.h5"
+STUDENT_CLASS_INDICES_PATH = MODELS_DIR / "class_indices_student.json"
+SOFT_LABEL_CACHE_DIR = BASE_DIR / "data" / "cache" / "teacher"
+REPORT_PATH = METRICS_DIR / "distillation_report.json"
+
+def load_images(paths, size):
+    """
+    Decodes and resizes images into one uint8 array (N, H, W, 3).
+    """
+    w, h = size
+    out = np.empty((len(paths), h, w, 3), dtype=np.uint8)
+    for i, path in enumerate(paths):
+        out[i] = np.asarray(Image.open(path).convert('RGB').resize((w, h)), dtype=np.uint8)
+    return out
+
+class SoftLabelCache:
+    """
+    Teacher probabilities per image content hash, stored as one .npz per teacher artifact.
+    """
+
+    def __init__(self, cache_dir, teacher_signature):
+        self.path = os.path.join(cache_dir, f"{teacher_signature}.npz")
+        self.entries = {}
+        if os.path.exists(self.path):
+            data = np.load(self.path)
+            self.entries = dict(zip(data["hashes"].tolist(), data["probs"]))
+
+    def get_or_compute(self, paths, teacher, batch_size=BATCH_SIZE):
+        """
+        Returns (N, C) teacher probabilities aligned with `paths`; only misses run the teacher.
+        """
+        hashes = [file_hash(p) for p in paths]
+        missing = [i for i, h in enumerate(hashes) if h not in self.entries]
+        if missing:
+            print(f"Computing teacher soft labels for {len(missing)} of {len(paths)} images...")
+            size = model_input_size(teacher)
+            for start in range(0, len(missing), batch_size):
+                chunk = missing[start:start + batch_size]
+                x = load_images([paths[i] for i in chunk], size).astype(np.float32) / 255.0
+                probs = forward(teacher, x)
+                for i, p in zip(chunk, probs):
+                    self.entries[hashes[i]] = p
+            self.save()
+        else:
+            print(f"Teacher soft labels loaded from cache ({len(paths)} images).")
+        return np.stack([self.entries[h] for h in hashes])
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        keys = list(self.entries)
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(tmp_path, hashes=np.array(keys), probs=np.stack([self.entries[k] for k in keys]))
+        os.replace(tmp_path, self.path)
+
+def soften(probs, temperature):
+    """
+    Re-tempers softmax outputs: softmax(log(p) / T), i.e. softmax(logits / T).
+    """
+    logits = np.log(np.clip(probs, 1e-7, 1.0)) / temperature
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return (exp / exp.sum(axis=1, keepdims=True)).astype(np.float32)
+
+def distillation_loss(num_classes, temperature=4.0, alpha=0.3):
+    """
+    Keras loss over y_true = [one-hot | tempered teacher probs] and the student's softmax:
+    alpha * CE(hard) + (1 - alpha) * T^2 * KL(teacher_T || student_T).
+    """
+    def loss(y_true, y_pred):
+        hard, soft = y_true[:, :num_classes], y_true[:, num_classes:]
+        y_pred = tf.clip_by_value(y_pred, 1e-7, 1.0)
+        hard_loss = -tf.reduce_sum(hard * tf.math.log(y_pred), axis=1)
+        student_t = tf.nn.log_softmax(tf.math.log(y_pred) / temperature, axis=1)
+        soft_loss = tf.reduce_sum(soft * (tf.math.log(tf.clip_by_value(soft, 1e-7, 1.0)) - student_t), axis=1)
+        return alpha * hard_loss + (1.0 - alpha) * temperature ** 2 * soft_loss
+    return loss
+
+def hard_accuracy(num_classes):
+    def accuracy(y_true, y_pred):
+        return tf.cast(tf.equal(tf.argmax(y_true[:, :num_classes], axis=1), tf.argmax(y_pred, axis=1)), tf.float32)
+    return accuracy
+
+class DistillSequence(tf.keras.utils.Sequence):
+    """
+    Batches of preloaded uint8 images with [one-hot | soft label] targets.
+    Training batches are shuffled each epoch and randomly mirrored, a whole batch at a time.
+    """
+
+    def __init__(self, images, labels, soft, batch_size=BATCH_SIZE, augment=False, seed=None):
+        super().__init__()
+        self.images = images
+        self.targets = np.concatenate([np.eye(soft.shape[1], dtype=np.float32)[labels], soft], axis=1)
+        self.batch_size = batch_size
+        self.augment = augment
+        self.rng = np.random.default_rng(seed)
+        self.order = np.arange(len(images))
+        if augment:
+            self.rng.shuffle(self.order)
+
+    def __len__(self):
+        return -(-len(self.images) // self.batch_size)
+
+    def __getitem__(self, idx):
+        batch = self.order[idx * self.batch_size:(idx + 1) * self.batch_size]
+        x = self.images[batch].astype(np.float32) / 255.0
+        if self.augment:
+            flip = self.rng.random(len(batch)) < 0.5
+            x[flip] = x[flip, :, ::-1]
+        return x, self.targets[batch]
+
+    def on_epoch_end(self):
+        if self.augment:
+            self.rng.shuffle(self.order)
+
+def per_class_accuracy(probs, labels, num_classes):
+    """
+    Accuracy per true class (NaN for classes without samples).
+    """
+    correct = np.bincount(labels[probs.argmax(axis=1) == labels], minlength=num_classes)
+    total = np.bincount(labels, minlength=num_classes)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return correct / total
+
+def model_profile(model, path, images, labels, num_classes):
+    """
+    Size, single-image latency and validation accuracy of one model.
+    """
+    from scripts.calibrate_cascade import single_image_latency_ms
+    x = images.astype(np.float32) / 255.0
+    probs = np.concatenate([forward(model, x[i:i + BATCH_SIZE])
+                            for i in range(0, len(x), BATCH_SIZE)]) if len(x) else np.zeros((0, num_classes))
+    return {
+        "params": int(model.count_params()),
+        "size_mb": os.path.getsize(path) / (1024 * 1024) if os.path.exists(path) else None,
+        "input_size": list(model_input_size(model)),
+        "latency_ms": single_image_latency_ms(model),
+        "accuracy": float(np.mean(probs.argmax(axis=1) == labels)) if len(labels) else None,
+        "per_class_accuracy": per_class_accuracy(probs, labels, num_classes).tolist(),
+    }, probs
+
+def distill(data_dir, teacher_path=MODEL_PATH, teacher_classes_path=CLASS_INDICES_PATH,
+            output_path=STUDENT_MODEL_PATH, classes_output_path=STUDENT_CLASS_INDICES_PATH,
+            img_size=IMG_SIZE, alpha=0.5, head_units=0, epochs=10, temperature=4.0, kd_alpha=0.3,
+            weights='imagenet', cache_dir=SOFT_LABEL_CACHE_DIR, report_path=REPORT_PATH, progress=None):
+    """
+    Trains a student against the teacher's cached soft labels. Returns the report dict.
+    """
+    from core.dl_loader import load_trained_model
+    report_event = progress or (lambda event: None)
+
+    teacher, classes = load_trained_model(teacher_path, teacher_classes_path)
+    if teacher is None:
+        raise FileNotFoundError(f"Teacher model not available at {teacher_path}")
+    num_classes = len(classes)
+    label_to_idx = {label: int(idx) for idx, label in classes.items()}
+
+    train_items, val_items = dataset_split(data_dir, label_to_idx)
+    if not train_items:
+        raise ValueError(f"No training images found in {data_dir}")
+    print(f"Distilling into a student (alpha={alpha}, {img_size[0]}px, head={head_units or 'none'}) "
+          f"from {len(train_items)} training / {len(val_items)} validation images.")
+
+    cache = SoftLabelCache(cache_dir, file_hash(teacher_path)[:16])
+    train_paths = [p for p, _ in train_items]
+    val_paths = [p for p, _ in val_items]
+    train_soft = soften(cache.get_or_compute(train_paths, teacher), temperature)
+    val_soft = soften(cache.get_or_compute(val_paths, teacher), temperature) if val_items else None
+
+    img_size = tuple(img_size)
+    train_labels = np.array([l for _, l in train_items])
+    val_labels = np.array([l for _, l in val_items], dtype=np.int64)
+    train_images = load_images(train_paths, img_size)
+    val_images = load_images(val_paths, img_size) if val_items else np.zeros((0,) + img_size + (3,), np.uint8)
+
+    train_seq = DistillSequence(train_images, train_labels, train_soft, augment=True, seed=0)
+    val_seq = DistillSequence(val_images, val_labels, val_soft) if val_items else None
+
+    student, backbone = build_model(num_classes, img_size, alpha, head_units, weights=weights)
+    # Without pretrained weights there is nothing to protect: train everything from the start
+    backbone.trainable = weights is None
+    loss = distillation_loss(num_classes, temperature, kd_alpha)
+    monitor = 'val_loss' if val_seq is not None else 'loss'
+    phases = [("head", epochs // 2, 1e-4), ("fine_tune", epochs - epochs // 2, 1e-5)] if weights else [("full", epochs, 1e-3)]
+    for phase, phase_epochs, lr in phases:
+        if phase_epochs <= 0:
+            continue
+        if phase == "fine_tune":
+            backbone.trainable = True
+        student.compile(optimizer=Adam(learning_rate=lr), loss=loss, metrics=[hard_accuracy(num_classes)])
+        report_event({"event": "phase", "phase": phase, "epochs": phase_epochs})
+        student.fit(train_seq, validation_data=val_seq, epochs=phase_epochs,
+                    callbacks=[EarlyStopping(monitor=monitor, patience=3, restore_best_weights=True),
+                               ProgressCallback(report_event, phase, total_epochs=phase_epochs)])
+
+    # Same compile config as train_cnn.py artifacts, so serving loads it without the custom loss
+    student.compile(optimizer=Adam(learning_rate=1e-5), loss='categorical_crossentropy', metrics=['accuracy'])
+    os.makedirs(os.path.dirname(str(output_path)), exist_ok=True)
+    student.save(str(output_path))
+    with open(classes_output_path, 'w') as f:
+        json.dump(classes, f, indent=4)
+    print(f"Student saved to {output_path}")
+
+    teacher_val = load_images(val_paths, model_input_size(teacher)) if val_items else np.zeros((0, 1, 1, 3), np.uint8)
+    teacher_profile, teacher_probs = model_profile(teacher, str(teacher_path), teacher_val, val_labels, num_classes)
+    student_profile, student_probs = model_profile(student, str(output_path), val_images, val_labels, num_classes)
+    idx_to_label = [classes[str(i)] for i in range(num_classes)]
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"img_size": list(img_size), "alpha": alpha, "head_units": head_units, "epochs": epochs,
+                   "temperature": temperature, "kd_alpha": kd_alpha},
+        "classes": idx_to_label,
+        "teacher": teacher_profile,
+        "student": student_profile,
+        "speedup": teacher_profile["latency_ms"] / student_profile["latency_ms"],
+        "agreement": float(np.mean(student_probs.argmax(axis=1) == teacher_probs.argmax(axis=1))) if len(val_labels) else None,
+    }
+    os.makedirs(os.path.dirname(str(report_path)), exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    return report
+
+def print_report(report):
+    t, s = report["teacher"], report["student"]
+    print(f"\n{'':<10} {'params':>12} {'size MB':>8} {'latency ms':>10} {'accuracy':>8}")
+    for name, p in (("teacher", t), ("student", s)):
+        acc = f"{p['accuracy']:.3f}" if p["accuracy"] is not None else "n/a"
+        size = f"{p['size_mb']:.1f}" if p["size_mb"] is not None else "n/a"
+        print(f"{name:<10} {p['params']:>12,} {size:>8} {p['latency_ms']:>10.2f} {acc:>8}")
+    print(f"Speedup {report['speedup']:.2f}x, agreement {report['agreement']}")
+    print("\nPer-class accuracy (teacher -> student):")
+    for label, ta, sa in zip(report["classes"], t["per_class_accuracy"], s["per_class_accuracy"]):
+        print(f"  {label:<15} {ta:6.3f} -> {sa:6.3f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Distill the production CNN into a smaller student")
+    default_data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'raw', 'cars')
+    parser.add_argument("--data_dir", type=str, default=default_data_path)
+    parser.add_argument("--teacher", type=str, default=str(MODEL_PATH))
+    parser.add_argument("--output", type=str, default=str(STUDENT_MODEL_PATH))
+    parser.add_argument("--classes_output", type=str, default=str(STUDENT_CLASS_INDICES_PATH))
+    parser.add_argument("--img_size", type=int, default=IMG_SIZE[0])
+    parser.add_argument("--alpha", type=float, default=0.5, help="MobileNetV2 width multiplier")
+    parser.add_argument("--head_units", type=int, default=0, help="Hidden head units (0 = none)")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--temperature", type=float, default=4.0)
+    parser.add_argument("--kd_alpha", type=float, default=0.3, help="Weight of the hard-label loss")
+    parser.add_argument("--no_pretrained", action="store_true", help="Random init instead of ImageNet weights")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.data_dir):
+        print(f"Error: Data directory '{args.data_dir}' does not exist.")
+        sys.exit(1)
+
+    distill(args.data_dir, teacher_path=args.teacher, output_path=args.output, classes_output_path=args.classes_output,
+            img_size=(args.img_size, args.img_size), alpha=args.alpha, head_units=args.head_units, epochs=args.epochs,
+            temperature=args.temperature, kd_alpha=args.kd_alpha, weights=None if args.no_pretrained else 'imagenet')
@@ -0,0 +1,275 @@
+"""
+train/prune.py
+
+Responsibility:
+    - Structured pruning of the served CNN: removes hidden (expansion) channels of the
+      MobileNetV2 inverted-residual blocks and units of the Dense head, ranked by
+      weight magnitude or first-order sensitivity (|activation x gradient|).
+    - Rebuilds a physically smaller dense model (edited layer config + sliced weights),
+      not a mask of zeroed weights, so every exported artifact is faster as-is.
+    - Fine-tunes each pruned model briefly and reports FLOPs, parameters, size,
+      latency and accuracy for several sparsity levels.
+
+Expansion channels live entirely inside one block (expand -> depthwise -> project),
+so they can be removed without touching the residual connections.
+
+Usage:
+    python train/prune.py --levels 0,0.25,0.5,0.75 --method magnitude
+    python train/prune.py --target head --levels 0.5,0.75,0.9   # is the 1024-unit head needed?
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.optimizers import Adam
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import MODELS_DIR, MODEL_PATH, CLASS_INDICES_PATH, BATCH_SIZE, METRICS_DIR
+from core.cascade import model_input_size
+from core.inference import forward
+
+PRUNED_DIR = MODELS_DIR / "pruned"
+REPORT_PATH = METRICS_DIR / "pruning_report.json"
+HEAD = "head"
+
+def prunable_blocks(model):
+    """
+    Name prefixes of the inverted-residual blocks that have an expansion conv.
+    """
+    names = {layer.name for layer in model.layers}
+    return [n[:-len("_expand")] for n in (layer.name for layer in model.layers)
+            if n.endswith("_expand") and f"{n[:-len('_expand')]}_project" in names]
+
+def head_layers(model):
+    """
+    (hidden Dense, output Dense) of the classifier head, or None without a hidden layer.
+    """
+    dense = [layer for layer in model.layers if isinstance(layer, tf.keras.layers.Dense)]
+    return (dense[-2], dense[-1]) if len(dense) >= 2 else None
+
+def magnitude_importance(model, groups):
+    """
+    Per hidden channel: L1 of its incoming and outgoing weights, scaled by the BN gammas.
+    """
+    scores = {}
+    for g in groups:
+        if g == HEAD:
+            hidden, out = head_layers(model)
+            scores[g] = np.abs(hidden.get_weights()[0]).sum(axis=0) * np.abs(out.get_weights()[0]).sum(axis=1)
+            continue
+        expand = np.abs(model.get_layer(f"{g}_expand").get_weights()[0]).sum(axis=(0, 1, 2))
+        project = np.abs(model.get_layer(f"{g}_project").get_weights()[0]).sum(axis=(0, 1, 3))
+        gamma_e = np.abs(model.get_layer(f"{g}_expand_BN").get_weights()[0])
+        gamma_d = np.abs(model.get_layer(f"{g}_depthwise_BN").get_weights()[0])
+        scores[g] = expand * gamma_e * gamma_d * project
+    return scores
+
+def sensitivity_importance(model, groups, x, y):
+    """
+    Per hidden channel: first-order Taylor estimate of the loss change when it is removed,
+    |sum over positions of activation x gradient|, averaged over the calibration batch.
+    """
+    layers = [head_layers(model)[0] if g == HEAD else model.get_layer(f"{g}_depthwise_relu") for g in groups]
+    probe = tf.keras.Model(model.inputs, [layer.output for layer in layers] + [model.output])
+    loss_fn = tf.keras.losses.CategoricalCrossentropy()
+    totals = [0.0] * len(groups)
+    for start in range(0, len(x), BATCH_SIZE):
+        xb, yb = x[start:start + BATCH_SIZE], y[start:start + BATCH_SIZE]
+        with tf.GradientTape() as tape:
+            outputs = probe(xb, training=False)
+            loss = loss_fn(yb, outputs[-1])
+        grads = tape.gradient(loss, outputs[:-1])
+        for i, (a, g) in enumerate(zip(outputs[:-1], grads)):
+            taylor = a * g
+            if len(taylor.shape) == 4:
+                taylor = tf.reduce_sum(taylor, axis=(1, 2))
+            totals[i] = totals[i] + tf.reduce_sum(tf.abs(taylor), axis=0).numpy()
+    return {g: t / len(x) for g, t in zip(groups, totals)}
+
+def keep_indices(scores, sparsity, multiple=8, min_keep=8):
+    """
+    Indices (ascending) of the channels to keep. The kept count is rounded to a
+    multiple of `multiple` (SIMD-friendly widths) and never below `min_keep`.
+    """
+    n = len(scores)
+    keep = int(round(n * (1.0 - sparsity) / multiple)) * multiple
+    keep = min(n, max(min_keep, keep))
+    return np.sort(np.argsort(-scores, kind="stable")[:keep])
+
+def prune_model(model, keep):
+    """
+    Rebuilds `model` with only the `keep[group]` channels/units and copies the sliced weights.
+    """
+    head = head_layers(model)
+    config = model.get_config()
+    for layer_cfg in config["layers"]:
+        name = layer_cfg["config"]["name"]
+        layer_cfg.pop("build_config", None)
+        if name.endswith("_expand") and name[:-len("_expand")] in keep:
+            layer_cfg["config"]["filters"] = len(keep[name[:-len("_expand")]])
+        elif HEAD in keep and head and name == head[0].name:
+            layer_cfg["config"]["units"] = len(keep[HEAD])
+    pruned = tf.keras.Model.from_config(config)
+
+    slices = {}
+    for g, idx in keep.items():
+        if g == HEAD:
+            slices[head[0].name] = lambda w, idx=idx: [w[0][:, idx], w[1][idx]]
+            slices[head[1].name] = lambda w, idx=idx: [w[0][idx, :], w[1]]
+            continue
+        slices[f"{g}_expand"] = lambda w, idx=idx: [w[0][..., idx]] + [b[idx] for b in w[1:]]
+        slices[f"{g}_expand_BN"] = lambda w, idx=idx: [v[idx] for v in w]
+        slices[f"{g}_depthwise"] = lambda w, idx=idx: [w[0][:, :, idx, :]] + [b[idx] for b in w[1:]]
+        slices[f"{g}_depthwise_BN"] = lambda w, idx=idx: [v[idx] for v in w]
+        slices[f"{g}_project"] = lambda w, idx=idx: [w[0][:, :, idx, :]] + w[1:]
+
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if not weights:
+            continue
+        if layer.name in slices:
+            weights = slices[layer.name](weights)
+        pruned.get_layer(layer.name).set_weights(weights)
+    return pruned
+
+def count_flops(model):
+    """
+    Multiply-accumulate based FLOPs (2 x MACs) of the conv and dense layers for one image.
+    """
+    flops = 0
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.layers.DepthwiseConv2D):
+            _, h, w, c = layer.output.shape
+            kh, kw = layer.kernel_size
+            flops += 2 * h * w * kh * kw * c
+        elif isinstance(layer, tf.keras.layers.Conv2D):
+            _, h, w, c_out = layer.output.shape
+            kh, kw = layer.kernel_size
+            flops += 2 * h * w * kh * kw * layer.input.shape[-1] * c_out
+        elif isinstance(layer, tf.keras.layers.Dense):
+            flops += 2 * layer.input.shape[-1] * layer.units
+    return int(flops)
+
+def fine_tune(model, x, y, epochs=2, lr=1e-4):
+    """
+    Brief recovery training. BatchNorm statistics stay frozen (small data, small batches).
+    """
+    for layer in model.layers:
+        layer.trainable = not isinstance(layer, tf.keras.layers.BatchNormalization)
+    model.compile(optimizer=Adam(learning_rate=lr), loss='categorical_crossentropy', metrics=['accuracy'])
+    if epochs > 0 and len(x):
+        model.fit(x, y, batch_size=BATCH_SIZE, epochs=epochs, shuffle=True, verbose=2)
+    return model
+
+def accuracy(model, x, labels):
+    if not len(x):
+        return None
+    probs = np.concatenate([forward(model, x[i:i + BATCH_SIZE]) for i in range(0, len(x), BATCH_SIZE)])
+    return float(np.mean(probs.argmax(axis=1) == labels))
+
+def run_pruning(data_dir, levels=(0.0, 0.25, 0.5, 0.75), method="magnitude", target="all", epochs=2,
+                model_path=MODEL_PATH, classes_path=CLASS_INDICES_PATH, output_dir=PRUNED_DIR,
+                report_path=REPORT_PATH, limit=None):
+    """
+    Prunes, fine-tunes and profiles one model per sparsity level. Returns the report dict.
+    """
+    from core.dl_loader import load_trained_model
+    from core.cascade import dataset_split
+    from train.distill import load_images
+    from scripts.calibrate_cascade import single_image_latency_ms
+
+    model, classes = load_trained_model(model_path, classes_path)
+    if model is None:
+        raise FileNotFoundError(f"Model not available at {model_path}")
+    num_classes = len(classes)
+    train_items, val_items = dataset_split(data_dir, {label: int(idx) for idx, label in classes.items()})
+    if limit:
+        train_items = train_items[:limit]
+    size = model_input_size(model)
+    x_train = load_images([p for p, _ in train_items], size).astype(np.float32) / 255.0
+    y_train = np.eye(num_classes, dtype=np.float32)[[l for _, l in train_items]]
+    x_val = load_images([p for p, _ in val_items], size).astype(np.float32) / 255.0
+    val_labels = np.array([l for _, l in val_items])
+
+    groups = []
+    if target in ("all", "backbone"):
+        groups += prunable_blocks(model)
+    if target in ("all", "head") and head_layers(model):
+        groups.append(HEAD)
+    if method == "sensitivity":
+        scores = sensitivity_importance(model, groups, x_train[:64], y_train[:64])
+    else:
+        scores = magnitude_importance(model, groups)
+    print(f"Ranked {len(groups)} channel groups by {method}.")
+
+    os.makedirs(output_dir, exist_ok=True)
+    rows = []
+    for level in levels:
+        keep = {g: keep_indices(scores[g], level) for g in groups}
+        pruned = prune_model(model, keep) if level > 0 else model
+        if level > 0:
+            print(f"\n--- Sparsity {level:.0%}: fine-tuning for {epochs} epoch(s) ---")
+            fine_tune(pruned, x_train, y_train, epochs)
+
+        # Without optimizer slots, so the file size reflects the model itself
+        path = os.path.join(output_dir, f"car_brand_model_p{int(round(level * 100))}.h5")
+        pruned.save(path, include_optimizer=False)
+        shutil.copyfile(classes_path, os.path.join(output_dir, f"class_indices_p{int(round(level * 100))}.json"))
+        rows.append({
+            "sparsity": level,
+            "params": int(pruned.count_params()),
+            "mflops": count_flops(pruned) / 1e6,
+            "size_mb": os.path.getsize(path) / (1024 * 1024),
+            "latency_ms": single_image_latency_ms(pruned),
+            "accuracy": accuracy(pruned, x_val, val_labels),
+            "head_units": int(head_layers(pruned)[0].units) if head_layers(pruned) else 0,
+            "path": path,
+        })
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model": str(model_path),
+        "method": method,
+        "target": target,
+        "fine_tune_epochs": epochs,
+        "levels": rows,
+    }
+    os.makedirs(os.path.dirname(str(report_path)), exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    return report
+
+def print_report(report):
+    print(f"\n{'sparsity':>8} {'params':>12} {'MFLOPs':>9} {'size MB':>8} {'latency ms':>10} {'head':>5} {'accuracy':>8}")
+    for r in report["levels"]:
+        acc = f"{r['accuracy']:.3f}" if r["accuracy"] is not None else "n/a"
+        print(f"{r['sparsity']:8.0%} {r['params']:>12,} {r['mflops']:9.1f} {r['size_mb']:8.1f} "
+              f"{r['latency_ms']:10.2f} {r['head_units']:>5} {acc:>8}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Structured pruning of the served CNN")
+    default_data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'raw', 'cars')
+    parser.add_argument("--data_dir", type=str, default=default_data_path)
+    parser.add_argument("--model", type=str, default=str(MODEL_PATH))
+    parser.add_argument("--levels", type=str, default="0,0.25,0.5,0.75", help="Comma-separated sparsity levels")
+    parser.add_argument("--method", choices=["magnitude", "sensitivity"], default="magnitude")
+    parser.add_argument("--target", choices=["all", "backbone", "head"], default="all")
+    parser.add_argument("--epochs", type=int, default=2, help="Fine-tuning epochs per level")
+    parser.add_argument("--limit", type=int, default=None, help="Use at most N training images")
+    parser.add_argument("--output_dir", type=str, default=str(PRUNED_DIR))
+    args = parser.parse_args()
+
+    if not os.path.exists(args.data_dir):
+        print(f"Error: Data directory '{args.data_dir}' does not exist.")
+        sys.exit(1)
+
+    run_pruning(args.data_dir, [float(v) for v in args.levels.split(",")], args.method, args.target, args.epochs,
+                model_path=args.model, output_dir=args.output_dir, limit=args.limit)
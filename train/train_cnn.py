@@ -1,7 +1,10 @@
 import os
 import sys
 import json
+import time
 import argparse
+import numpy as np
+from PIL import Image
 import tensorflow as tf
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.applications import MobileNetV2
@@ -13,12 +16,230 @@ from tensorflow.keras.callbacks import ModelCheckpoint, EarlyStopping
 # Add project root to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.config import MODELS_DIR, MODEL_PATH, CLASS_INDICES_PATH, IMG_SIZE, BATCH_SIZE
+from core.config import (MODELS_DIR, MODEL_PATH, CLASS_INDICES_PATH, IMG_SIZE, BATCH_SIZE,
+                         CASCADE_MODEL_PATH, CASCADE_CLASS_INDICES_PATH, RESOLUTION_VARIANTS, variant_paths,
+                         HYPERPARAMS_PATH, VALIDATION_SPLIT)
+from core.augmentation import load_manifest, apply_recipes_batch
 
-def train_model(data_dir, epochs=20, fine_tune_at=100):
+class ManifestAugmentedSequence(tf.keras.utils.Sequence):
+    """
+    Wraps the directory generator and adds batches built from the refinery's
+    augmentation manifest. Recipes are applied on the fly, a whole batch at a time,
+    so the class balancing of `aug_*` files is kept without writing them to disk.
+    Real and virtual batches are interleaved in a fresh random order every epoch, and
+    recipe outputs go through the generator's random transform (rotation, shift, flip...)
+    like any file on disk.
+    """
+
+    def __init__(self, base_generator, data_dir, recipes, seed=None, img_size=IMG_SIZE):
+        super().__init__()
+        self.base = base_generator
+        self.data_dir = data_dir
+        self.img_size = tuple(img_size)
+        self.num_classes = len(base_generator.class_indices)
+        self.rng = np.random.default_rng(seed)
+        self.image_data_generator = getattr(base_generator, "image_data_generator", None)
+        self._sources = {}
+
+        # Only replay recipes whose source is in the training subset (no validation leakage)
+        train_files = set(f.replace(os.sep, '/') for f in base_generator.filenames)
+        self.recipes = []
+        for class_name, class_recipes in recipes.items():
+            if class_name not in base_generator.class_indices:
+                continue
+            label = base_generator.class_indices[class_name]
+            for r in class_recipes:
+                if f"{class_name}/{r['source']}" in train_files:
+                    self.recipes.append((label, class_name, r))
+        self.rng.shuffle(self.recipes)
+        # Batch positions: < len(base) are directory batches, the rest virtual ones
+        self.order = self.rng.permutation(len(self))
+
+    @property
+    def samples(self):
+        return self.base.samples + len(self.recipes)
+
+    def __len__(self):
+        virtual_batches = -(-len(self.recipes) // self.base.batch_size)
+        return len(self.base) + virtual_batches
+
+    def _load_source(self, class_name, filename):
+        # Sources are few (classes below the target count), so keep them decoded in memory
+        key = (class_name, filename)
+        if key not in self._sources:
+            img = Image.open(os.path.join(self.data_dir, class_name, filename)).convert('RGB')
+            self._sources[key] = np.asarray(img.resize(self.img_size), dtype=np.uint8)
+        return self._sources[key]
+
+    def _transform(self, images):
+        # Same per-image steps the DirectoryIterator runs: random transform, then rescale
+        gen = self.image_data_generator
+        if gen is None:
+            return images.astype(np.float32) / 255.0
+        return np.stack([gen.standardize(gen.random_transform(img.astype(np.float32))) for img in images])
+
+    def __getitem__(self, idx):
+        idx = int(self.order[idx])
+        if idx < len(self.base):
+            return self.base[idx]
+
+        start = (idx - len(self.base)) * self.base.batch_size
+        chunk = self.recipes[start:start + self.base.batch_size]
+        images = np.stack([self._load_source(c, r['source']) for _, c, r in chunk])
+        x = self._transform(apply_recipes_batch(images, [r for _, _, r in chunk]))
+        y = np.zeros((len(chunk), self.num_classes), dtype=np.float32)
+        y[np.arange(len(chunk)), [label for label, _, _ in chunk]] = 1.0
+        return x, y
+
+    def on_epoch_end(self):
+        self.base.on_epoch_end()
+        self.rng.shuffle(self.recipes)
+        self.order = self.rng.permutation(len(self))
+
+class ProgressCallback(tf.keras.callbacks.Callback):
+    """
+    Forwards training progress to `report(dict)` (e.g. the worker's IPC pipe).
+
+    Per batch it splits wall time into data loading (previous batch end -> batch begin,
+    i.e. waiting on the generator) and compute (batch begin -> batch end), and emits a
+    throttled "progress" event with throughput and ETA.
+    """
+
+    def __init__(self, report, phase, batch_size=BATCH_SIZE, total_epochs=None, interval=1.0):
+        super().__init__()
+        self.report = report
+        self.phase = phase
+        self.batch_size = batch_size
+        self.total_epochs = total_epochs
+        self.interval = interval
+
+    def on_train_begin(self, logs=None):
+        self.total_epochs = self.total_epochs or self.params.get("epochs")
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+        self.steps = self.params.get("steps") or 0
+        self.data_time = 0.0
+        self.compute_time = 0.0
+        self.batches = 0
+        self.epoch_start = time.perf_counter()
+        self.last_end = self.epoch_start
+        self.last_report = 0.0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.batch_start = time.perf_counter()
+        self.data_time += self.batch_start - self.last_end
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.last_end = time.perf_counter()
+        self.compute_time += self.last_end - self.batch_start
+        self.batches += 1
+        if self.last_end - self.last_report >= self.interval:
+            self.last_report = self.last_end
+            self.report(self._progress_event(batch + 1))
+
+    def _progress_event(self, step):
+        elapsed = self.last_end - self.epoch_start
+        step_time = elapsed / max(self.batches, 1)
+        remaining_steps = max(self.steps - step, 0)
+        remaining_epochs = max((self.total_epochs or 0) - self.epoch - 1, 0)
+        return {
+            "event": "progress",
+            "phase": self.phase,
+            "epoch": self.epoch + 1,
+            "epochs": self.total_epochs,
+            "step": step,
+            "steps": self.steps,
+            "images_per_sec": self.batches * self.batch_size / elapsed if elapsed > 0 else 0.0,
+            "step_time": step_time,
+            "data_time": self.data_time,
+            "compute_time": self.compute_time,
+            "eta_seconds": (remaining_steps + remaining_epochs * self.steps) * step_time,
+        }
+
+    def on_epoch_end(self, epoch, logs=None):
+        event = self._progress_event(self.batches)
+        event["event"] = "epoch"
+        event["logs"] = {k: float(v) for k, v in (logs or {}).items()}
+        self.report(event)
+
+# Named architectures: the served model and the cascade's small first stage
+VARIANTS = {
+    "full": {"img_size": IMG_SIZE, "alpha": 1.0, "head_units": 1024,
+             "model_path": MODEL_PATH, "class_indices_path": CLASS_INDICES_PATH},
+    "small": {"img_size": (128, 128), "alpha": 0.35, "head_units": 256,
+              "model_path": CASCADE_MODEL_PATH, "class_indices_path": CASCADE_CLASS_INDICES_PATH},
+}
+# Lower-resolution copies of the full architecture (see RESOLUTION_VARIANTS)
+for _res in RESOLUTION_VARIANTS:
+    if _res != IMG_SIZE[0]:
+        VARIANTS[f"r{_res}"] = {"img_size": (_res, _res), "alpha": 1.0, "head_units": 1024,
+                                "model_path": variant_paths(_res)["model"],
+                                "class_indices_path": variant_paths(_res)["classes"]}
+
+HYPERPARAMS_FORMAT = "omnivision-cnn-hparams"
+TUNABLE_PARAMS = ("img_size", "head_units", "dropout", "head_lr", "fine_tune_lr", "fine_tune_at")
+# Architecture knobs: tuned on the full model and only applied to it; the other
+# variants keep their own size and head (their artifact paths depend on it)
+ARCHITECTURE_PARAMS = ("img_size", "head_units")
+
+def load_hyperparams(path=HYPERPARAMS_PATH):
+    """
+    `train_model` keyword arguments of the best configuration found by
+    scripts/tune_hyperparams.py. Raises ValueError for files in another format
+    (e.g. the old BoVW `best_k` results).
+    """
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if data.get("format") != HYPERPARAMS_FORMAT:
+        raise ValueError(f"{path} holds no CNN hyperparameters (expected format '{HYPERPARAMS_FORMAT}').")
+    params = {k: v for k, v in data["best"].items() if k in TUNABLE_PARAMS}
+    if "img_size" in params:
+        params["img_size"] = tuple(params["img_size"])
+    return params
+
+def variant_hyperparams(params, variant):
+    """
+    The tuned `params` that apply to `variant`: dropout, learning rates and fine_tune_at
+    pass through to every variant, ARCHITECTURE_PARAMS only to "full".
+    """
+    if variant == "full":
+        return dict(params)
+    return {k: v for k, v in params.items() if k not in ARCHITECTURE_PARAMS}
+
+def build_model(num_classes, img_size=IMG_SIZE, alpha=1.0, head_units=1024, weights='imagenet', dropout=0.2):
+    """
+    MobileNetV2 backbone (frozen) + pooling/dropout head. `head_units=0` drops the
+    hidden Dense layer. Returns (model, base_model).
+    """
+    # Base Model: MobileNetV2 (Lightweight, good accuracy)
+    base_model = MobileNetV2(weights=weights, include_top=False, input_shape=tuple(img_size) + (3,), alpha=alpha)
+    
+    # Freeze base model initially
+    base_model.trainable = False
+
+    # Custom Head
+    x = base_model.output
+    x = GlobalAveragePooling2D()(x)
+    x = Dropout(dropout)(x)  # Regularization
+    if head_units:
+        x = Dense(head_units, activation='relu')(x)
+    predictions = Dense(num_classes, activation='softmax')(x)
+
+    model = Model(inputs=base_model.input, outputs=predictions)
+    return model, base_model
+
+def train_model(data_dir, epochs=20, fine_tune_at=100, model_path=MODEL_PATH, class_indices_path=CLASS_INDICES_PATH, progress=None,
+                img_size=IMG_SIZE, alpha=1.0, head_units=1024, dropout=0.2, head_lr=1e-4, fine_tune_lr=1e-5):
     """
     Trains a CNN (MobileNetV2) for Car Brand Classification.
+    Artifacts are written to `model_path` / `class_indices_path`; `progress` receives event dicts.
+    `img_size`, `alpha` (width multiplier) and `head_units` select the architecture (see VARIANTS).
+    `dropout`, `head_lr`, `fine_tune_lr` and `fine_tune_at` are the knobs searched by
+    scripts/tune_hyperparams.py (see load_hyperparams).
     """
+    img_size = tuple(img_size)
+    report = progress or (lambda event: None)
     print(f"TensorFlow Version: {tf.__version__}")
     print(f"Training on data from: {data_dir}")
 
@@ -32,13 +253,13 @@ def train_model(data_dir, epochs=20, fine_tune_at=100):
         zoom_range=0.2,
         horizontal_flip=True,
         fill_mode='nearest',
-        validation_split=0.2  # 20% for validation
+        validation_split=VALIDATION_SPLIT  # 20% for validation (see core.cascade.dataset_split)
     )
 
     print("Loading Training Data...")
     train_generator = train_datagen.flow_from_directory(
         data_dir,
-        target_size=IMG_SIZE,
+        target_size=img_size,
         batch_size=BATCH_SIZE,
         class_mode='categorical',
         subset='training'
@@ -47,7 +268,7 @@ def train_model(data_dir, epochs=20, fine_tune_at=100):
     print("Loading Validation Data...")
     validation_generator = train_datagen.flow_from_directory(
         data_dir,
-        target_size=IMG_SIZE,
+        target_size=img_size,
         batch_size=BATCH_SIZE,
         class_mode='categorical',
         subset='validation'
@@ -56,49 +277,46 @@ def train_model(data_dir, epochs=20, fine_tune_at=100):
     num_classes = len(train_generator.class_indices)
     print(f"Detected Classes ({num_classes}): {train_generator.class_indices}")
 
+    # Virtual augmentation recipes written by `scripts/refinery.py --virtual`
+    train_data = train_generator
+    steps_per_epoch = train_generator.samples // BATCH_SIZE
+    recipes = load_manifest(data_dir)
+    if recipes:
+        train_data = ManifestAugmentedSequence(train_generator, data_dir, recipes, img_size=img_size)
+        steps_per_epoch = len(train_data)
+        print(f"Replaying {len(train_data.recipes)} augmentation recipes on the fly.")
+
     # Save Class Indices
-    os.makedirs(MODELS_DIR, exist_ok=True)
+    os.makedirs(os.path.dirname(str(class_indices_path)), exist_ok=True)
     # Invert to map index -> label
     idx_to_label = {v: k for k, v in train_generator.class_indices.items()}
-    with open(CLASS_INDICES_PATH, 'w') as f:
+    with open(class_indices_path, 'w') as f:
         json.dump(idx_to_label, f, indent=4)
-    print(f"Class indices saved to {CLASS_INDICES_PATH}")
-
-    # Base Model: MobileNetV2 (Lightweight, good accuracy)
-    base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=IMG_SIZE + (3,))
-    
-    # Freeze base model initially
-    base_model.trainable = False
+    print(f"Class indices saved to {class_indices_path}")
 
-    # Custom Head
-    x = base_model.output
-    x = GlobalAveragePooling2D()(x)
-    x = Dropout(0.2)(x)  # Regularization
-    x = Dense(1024, activation='relu')(x)
-    predictions = Dense(num_classes, activation='softmax')(x)
-
-    model = Model(inputs=base_model.input, outputs=predictions)
+    model, base_model = build_model(num_classes, img_size, alpha, head_units, dropout=dropout)
 
     # Compile
-    model.compile(optimizer=Adam(learning_rate=0.0001),
+    model.compile(optimizer=Adam(learning_rate=head_lr),
                   loss='categorical_crossentropy',
                   metrics=['accuracy'])
 
     # Callbacks
     callbacks = [
-        ModelCheckpoint(filepath=str(MODEL_PATH), save_best_only=True, monitor='val_loss', mode='min'),
+        ModelCheckpoint(filepath=str(model_path), save_best_only=True, monitor='val_loss', mode='min'),
         EarlyStopping(monitor='val_loss', patience=5, restore_best_weights=True)
     ]
 
     # Initial Training (Head only)
     print("Starting Initial Training (Head Only)...")
+    report({"event": "phase", "phase": "head", "epochs": epochs // 2})
     history = model.fit(
-        train_generator,
-        steps_per_epoch=train_generator.samples // BATCH_SIZE,
+        train_data,
+        steps_per_epoch=steps_per_epoch,
         validation_data=validation_generator,
         validation_steps=validation_generator.samples // BATCH_SIZE,
         epochs=epochs // 2,
-        callbacks=callbacks
+        callbacks=callbacks + [ProgressCallback(report, "head", total_epochs=epochs // 2)]
     )
 
     # Fine-Tuning
@@ -110,23 +328,25 @@ def train_model(data_dir, epochs=20, fine_tune_at=100):
         layer.trainable = False
 
     # Recompile with lower learning rate
-    model.compile(optimizer=Adam(learning_rate=1e-5),  # Lower LR for fine-tuning
+    model.compile(optimizer=Adam(learning_rate=fine_tune_lr),  # Lower LR for fine-tuning
                   loss='categorical_crossentropy',
                   metrics=['accuracy'])
 
     print("Starting Fine-Tuning...")
+    report({"event": "phase", "phase": "fine_tune", "epochs": epochs})
     history_fine = model.fit(
-        train_generator,
-        steps_per_epoch=train_generator.samples // BATCH_SIZE,
+        train_data,
+        steps_per_epoch=steps_per_epoch,
         validation_data=validation_generator,
         validation_steps=validation_generator.samples // BATCH_SIZE,
         epochs=epochs,
         initial_epoch=history.epoch[-1],
-        callbacks=callbacks
+        callbacks=callbacks + [ProgressCallback(report, "fine_tune", total_epochs=epochs)]
     )
 
     print("Training Complete.")
-    print(f"Model saved to {MODEL_PATH}")
+    print(f"Model saved to {model_path}")
+    return history_fine
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Train CNN for Car Brand Detection")
@@ -135,11 +355,20 @@ if __name__ == '__main__':
     
     parser.add_argument("--data_dir", type=str, default=default_data_path, help="Path to training data")
     parser.add_argument("--epochs", type=int, default=20, help="Number of epochs")
+    parser.add_argument("--variant", choices=sorted(VARIANTS), default="full", help="Architecture and artifact paths")
+    parser.add_argument("--hyperparams", nargs="?", const=str(HYPERPARAMS_PATH), default=None,
+                        help="Apply tuned hyperparameters (default file: config/hyperparams.json)")
     
     args = parser.parse_args()
     
     if not os.path.exists(args.data_dir):
         print(f"Error: Data directory '{args.data_dir}' does not exist.")
         sys.exit(1)
+
+    kwargs = dict(VARIANTS[args.variant])
+    if args.hyperparams:
+        tuned = variant_hyperparams(load_hyperparams(args.hyperparams), args.variant)
+        print(f"Applying tuned hyperparameters: {tuned}")
+        kwargs.update(tuned)
         
-    train_model(args.data_dir, epochs=args.epochs)
+    train_model(args.data_dir, epochs=args.epochs, **kwargs)
@@ -0,0 +1,196 @@
+"""
+train/worker.py
+
+Responsibility:
+    - Runs a training job in its own process, isolated from the API's cores and GIL.
+    - Applies CPU limits (TF thread pools, CPU affinity, nice level) before TensorFlow loads.
+    - Trains into a staging directory and reports progress as event dicts over IPC.
+    - Applies the tuned hyperparameters (config/hyperparams.json) when present; the tuned
+      input size only with `tuned_img_size`, so retrains keep the served input size.
+    - `promote_artifact` swaps a finished artifact into place for serving (SERVED_DOMAIN only).
+
+Usage (standalone):
+    python -m train.worker --domain cars --threads 2 --cpus 0,1 --promote
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import multiprocessing
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import (BASE_DIR, MODEL_PATH, CLASS_INDICES_PATH, TRAINING_STAGING_DIR, SERVED_DOMAIN,
+                         HYPERPARAMS_PATH, TRAINING_WORKER_THREADS, TRAINING_WORKER_CPUS, TRAINING_WORKER_NICE)
+
+def apply_cpu_limits(threads=None, cpus=None, nice=None):
+    """
+    Limits the current process. Must run before TensorFlow is imported for the
+    thread settings to take full effect.
+    """
+    if threads:
+        for var in ("TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS", "OMP_NUM_THREADS"):
+            os.environ[var] = str(threads)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, set(cpus))
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+
+    if threads:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(max(1, min(2, threads)))
+
+def staging_paths(staging_dir):
+    return {
+        "model": os.path.join(staging_dir, os.path.basename(str(MODEL_PATH))),
+        "classes": os.path.join(staging_dir, os.path.basename(str(CLASS_INDICES_PATH))),
+    }
+
+def final_metrics(history):
+    """
+    Validation metrics of the epoch the checkpoint kept (lowest val_loss).
+    """
+    logs = getattr(history, "history", None) or {}
+    val_loss = logs.get("val_loss")
+    if not val_loss:
+        return {}
+    best = min(range(len(val_loss)), key=lambda i: val_loss[i])
+    return {k: float(v[best]) for k, v in logs.items() if k.startswith("val_") and len(v) > best}
+
+def tuned_train_kwargs(path=HYPERPARAMS_PATH, tuned_img_size=False):
+    """
+    `train_model` keyword arguments from the tuned hyperparameters for the served (full)
+    variant, or {} if none were tuned. `img_size` is dropped unless `tuned_img_size`.
+    """
+    if not os.path.exists(path):
+        return {}
+    from train.train_cnn import load_hyperparams, variant_hyperparams
+    params = variant_hyperparams(load_hyperparams(path), "full")
+    if not tuned_img_size:
+        params.pop("img_size", None)
+    return params
+
+def run_worker(domain, staging_dir, conn=None, threads=TRAINING_WORKER_THREADS, cpus=TRAINING_WORKER_CPUS,
+               nice=TRAINING_WORKER_NICE, epochs=20, on_event=None, hyperparams_path=HYPERPARAMS_PATH,
+               tuned_img_size=False):
+    """
+    Worker process entry point. Sends event dicts through `conn` (a multiprocessing
+    Connection), to `on_event` when run in-process, or prints them as JSON lines.
+    The last event is always {"event": "done", "ok": bool, ...}, which is also returned.
+    """
+    def report(event):
+        event.setdefault("ts", time.time())
+        if conn is not None:
+            conn.send(event)
+        elif on_event is not None:
+            on_event(event)
+        else:
+            print(json.dumps(event), flush=True)
+
+    try:
+        apply_cpu_limits(threads, cpus, nice)
+        report({"event": "started", "domain": domain, "pid": os.getpid(), "threads": threads, "cpus": cpus})
+
+        data_dir = BASE_DIR / "data" / "raw" / domain
+        if not data_dir.exists():
+            raise FileNotFoundError(f"Data path not found: {data_dir}")
+
+        os.makedirs(staging_dir, exist_ok=True)
+        paths = staging_paths(staging_dir)
+
+        from train.train_cnn import train_model
+        tuned = tuned_train_kwargs(hyperparams_path, tuned_img_size)
+        history = train_model(str(data_dir), epochs=epochs, model_path=paths["model"],
+                              class_indices_path=paths["classes"], progress=report, **tuned)
+
+        if not os.path.exists(paths["model"]):
+            raise RuntimeError("Training finished without writing a model checkpoint.")
+        result = {"event": "done", "ok": True, "staging_dir": staging_dir, "metrics": final_metrics(history)}
+    except Exception as e:
+        result = {"event": "done", "ok": False, "error": f"{type(e).__name__}: {e}"}
+    report(result)
+    if conn is not None:
+        conn.close()
+    return result
+
+def run_in_subprocess(domain, staging_dir, on_event=None, **kwargs):
+    """
+    Spawns `run_worker` in a fresh process and relays its events to `on_event`.
+    Returns the final "done" event (ok=False if the process died without one).
+    """
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=run_worker, args=(domain, staging_dir, child_conn), kwargs=kwargs,
+                       name=f"training-worker-{domain}", daemon=True)
+    proc.start()
+    child_conn.close()
+
+    result = None
+    while result is None:
+        if parent_conn.poll(1.0):
+            try:
+                event = parent_conn.recv()
+            except EOFError:
+                break
+            if on_event:
+                on_event(event)
+            if event.get("event") == "done":
+                result = event
+        elif not proc.is_alive():
+            break
+
+    proc.join()
+    parent_conn.close()
+    if result is None:
+        result = {"event": "done", "ok": False, "error": f"Worker exited with code {proc.exitcode}"}
+        if on_event:
+            on_event(result)
+    return result
+
+def promote_artifact(staging_dir, domain):
+    """
+    Moves a finished staging artifact over the served model files.
+    os.replace is atomic per file; callers hold PREDICTION_LOCK around it.
+    Raises ValueError for a domain other than SERVED_DOMAIN: the served model and its
+    class map must never be replaced by a model of another dataset.
+    """
+    if domain != SERVED_DOMAIN:
+        raise ValueError(f"Refusing to promote a '{domain}' model over the served '{SERVED_DOMAIN}' model.")
+    paths = staging_paths(staging_dir)
+    os.makedirs(os.path.dirname(str(MODEL_PATH)), exist_ok=True)
+    os.replace(paths["model"], MODEL_PATH)
+    if os.path.exists(paths["classes"]):
+        os.replace(paths["classes"], CLASS_INDICES_PATH)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+def new_staging_dir(domain):
+    return os.path.join(str(TRAINING_STAGING_DIR), f"{domain}_{int(time.time())}_{os.getpid()}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Standalone CNN training worker")
+    parser.add_argument("--domain", type=str, default="cars", help="Domain under data/raw to train on")
+    parser.add_argument("--epochs", type=int, default=20, help="Number of epochs")
+    parser.add_argument("--threads", type=int, default=TRAINING_WORKER_THREADS, help="TF thread limit (0 = no limit)")
+    parser.add_argument("--cpus", type=str, default=None, help="Comma-separated CPU ids to pin to, e.g. 0,1")
+    parser.add_argument("--nice", type=int, default=TRAINING_WORKER_NICE, help="Niceness increment")
+    parser.add_argument("--staging_dir", type=str, default=None, help="Where to write the artifact")
+    parser.add_argument("--promote", action="store_true", help="Replace the served model on success")
+    parser.add_argument("--hyperparams", type=str, default=str(HYPERPARAMS_PATH), help="Tuned hyperparameters (applied if the file exists)")
+    parser.add_argument("--tuned-img-size", action="store_true", help="Also apply the tuned input size (changes the served input size)")
+    args = parser.parse_args()
+
+    cpus = [int(c) for c in args.cpus.split(",")] if args.cpus else TRAINING_WORKER_CPUS
+    staging_dir = args.staging_dir or new_staging_dir(args.domain)
+
+    # Run in this process; events are printed as JSON lines
+    result = run_worker(args.domain, staging_dir, threads=args.threads or None, cpus=cpus, nice=args.nice, epochs=args.epochs,
+                        hyperparams_path=args.hyperparams, tuned_img_size=args.tuned_img_size)
+
+    if args.promote and result["ok"]:
+        promote_artifact(staging_dir, args.domain)
+        print(f"Promoted {staging_dir} -> {MODEL_PATH}")